@@ -0,0 +1,224 @@
+"""
+Benchmarks for scheduling, travel time modelling, answer parsing and simulated schedule execution.
+
+Run from the repository root:
+
+    python -m benchmarks.run_benchmarks                    # 1k, 10k and 100k points
+    python -m benchmarks.run_benchmarks --sizes 1000       # quick run
+    python -m benchmarks.run_benchmarks --update-baseline  # store the results as new baseline
+
+Every case is timed (short ones repeated, keeping the fastest run), then run once more under tracemalloc for its peak memory. Results are written to a
+JSON file and compared to the stored baseline (machine specific, create it with --update-baseline); cases that got slower, use more memory or produce longer tours than
+the tolerance allows are reported as regressions and make the script exit with status 1.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from src.FAS import FiveAxisSystem
+from src.scheduling import FASSchedule
+from src.simulation import SimulatedController
+
+log = logging.getLogger(__name__)
+
+benchmark_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def random_scan(n: int, rng) -> np.ndarray:
+    # Random x, y, z grid points like the README example, rotation and tilt not moved
+    coordinates = np.full((n, 5), np.nan)
+    coordinates[:, :3] = rng.integers(0, 100, (n, 3))
+    return coordinates
+
+
+def raster_scan(n: int, rng) -> np.ndarray:
+    # x-y raster with 0.5 cm pitch at a fixed height, in shuffled order
+    side = int(np.ceil(np.sqrt(n)))
+    x, y = np.meshgrid(np.arange(side) * 0.5, np.arange(side) * 0.5, indexing="ij")
+    coordinates = np.full((side * side, 5), np.nan)
+    coordinates[:, 0] = x.ravel()
+    coordinates[:, 1] = y.ravel()
+    coordinates[:, 2] = 20
+    return coordinates[rng.permutation(len(coordinates))[:n]]
+
+
+def rot_tilt_sweep(n: int, rng) -> np.ndarray:
+    # Nested rotation x tilt sweep at a fixed position, in shuffled order
+    n_tilt = int(np.ceil(np.sqrt(n / 4)))
+    n_rot = int(np.ceil(n / n_tilt))
+    rot, tilt = np.meshgrid(np.linspace(0, 360, n_rot, endpoint=False), np.linspace(0, 90, n_tilt), indexing="ij")
+    coordinates = np.full((n_rot * n_tilt, 5), np.nan)
+    coordinates[:, :3] = [50, 50, 20]
+    coordinates[:, 3] = rot.ravel()
+    coordinates[:, 4] = tilt.ravel()
+    return coordinates[rng.permutation(len(coordinates))[:n]]
+
+
+patterns = {"random": random_scan, "raster": raster_scan, "sweep": rot_tilt_sweep}
+
+
+def bench_optimize_path(coordinates):
+    schedule = FASSchedule(coordinates)
+    schedule.optimize_path()
+    return {"tour_time": schedule.calculate_total_path_time()}
+
+
+def bench_calculate_total_path_time(coordinates):
+    return {"tour_time": FASSchedule(coordinates).calculate_total_path_time()}
+
+
+def bench_time_to_position(coordinates):
+    schedule = FASSchedule(coordinates)
+    path_time = schedule.path_time
+    positions = list(schedule)
+    total_time = 0
+    for initial_position, target_position in zip(positions[:-1], positions[1:]):
+        total_time += path_time.time_to_position(initial_position, target_position)
+    return {"tour_time": total_time}
+
+
+def bench_parse_answer(coordinates):
+    fas = FiveAxisSystem(SimulatedController(time_scale=0))
+    device = fas.controller.ise
+    answers = []
+    for row in FASSchedule(np.nan_to_num(coordinates)).to_axis_units():
+        values = " ".join(f"{axis}-Achse:{int(value)}" for axis, value in zip(["X", "Y", "Z", "4", "5"], row))
+        answers.append(f"{values} {device.answer_end}")
+    for answer in answers:
+        fas._parse_answer(answer)
+    return {"answers": len(answers)}
+
+
+def bench_simulated_run(coordinates, n_points: int = 100, time_scale: float = 0.002):
+    # Executes the optimized schedule on the simulated controller, sped up by 1 / time_scale
+    schedule = FASSchedule(coordinates[:n_points])
+    schedule.optimize_path()
+    fas = FiveAxisSystem(SimulatedController(time_scale=time_scale))
+    start = time.perf_counter()
+    with fas.controller.session():
+        for position in schedule:
+            fas.move_absolute_position(**position.to_dict())
+    return {
+        "tour_time": (time.perf_counter() - start) / time_scale,
+        "predicted_tour_time": schedule.calculate_total_path_time(),
+    }
+
+
+# name: (function, whether it runs for every size)
+cases = {
+    "optimize_path": (bench_optimize_path, True),
+    "calculate_total_path_time": (bench_calculate_total_path_time, True),
+    "time_to_position": (bench_time_to_position, True),
+    "parse_answer": (bench_parse_answer, True),
+    "simulated_run": (bench_simulated_run, False),
+}
+
+
+def run_case(function, coordinates, min_time: float = 0.2, max_repeats: int = 5) -> dict:
+    # Short cases are repeated and the fastest run kept, so that timer noise does not look like a regression
+    times = []
+    while not times or (sum(times) < min_time and len(times) < max_repeats):
+        start = time.perf_counter()
+        result = function(coordinates)
+        times.append(time.perf_counter() - start)
+    result["wall_time"] = min(times)
+    tracemalloc.start()
+    try:
+        function(coordinates)
+        result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result
+
+
+def run(sizes, seed: int = 0, selected=None) -> dict:
+    results = {}
+    for name, (function, every_size) in cases.items():
+        if selected and name not in selected:
+            continue
+        for pattern, generate in patterns.items():
+            for size in sizes if every_size else sizes[:1]:
+                key = f"{name}/{pattern}/{size}" if every_size else f"{name}/{pattern}"
+                coordinates = generate(size, np.random.default_rng(seed))
+                log.info(f"Running {key}")
+                results[key] = run_case(function, coordinates)
+                print(f"{key:45s} {results[key]['wall_time']:10.3f} s {results[key]['peak_memory'] / 2**20:10.1f} MiB")
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Returns a description of every case that regressed against the baseline by more than tolerance (relative).
+    """
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for metric in ["wall_time", "peak_memory", "tour_time"]:
+            if metric not in result or metric not in baseline[key]:
+                continue
+            # Tour times are deterministic, only allow them a small numerical slack
+            allowed = 1e-6 if metric == "tour_time" and not key.startswith("simulated_run") else tolerance
+            # Ignore differences below timer and allocator resolution
+            slack = {"wall_time": 0.005, "peak_memory": 2**16}.get(metric, 1e-9)
+            reference = baseline[key][metric]
+            if result[metric] > reference * (1 + allowed) and result[metric] - reference > slack:
+                regressions.append(f"{key} {metric}: {result[metric]:.6g} vs baseline {reference:.6g}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cases", nargs="+", choices=list(cases), help="Only run these cases")
+    parser.add_argument("--output", default=os.path.join(benchmark_dir, "results.json"))
+    parser.add_argument("--baseline", default=os.path.join(benchmark_dir, "baseline.json"))
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown/memory growth")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.seed, args.cases)
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "python": sys.version,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "sizes": args.sizes,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline updated at {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --update-baseline to store one")
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f)["results"], args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print("No regressions against baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
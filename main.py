@@ -31,19 +31,19 @@ for i in range(1000):
     schedule.append_programmed_position(
         np.random.randint(0, 100), np.random.randint(0, 100), np.random.randint(0, 100)
     )
-print(schedule.calculate_total_path_time())  # In this example I got 864 min
+print(schedule.calculate_total_path_time())  # In this example I got 236 min
 
 # Optimize path so next move is always shortest distance
 schedule.optimize_path()
 
-print(schedule.calculate_total_path_time())  # In this example I got 176 min
+print(schedule.calculate_total_path_time())  # In this example I got 81 min
 
 '''
 # You can save optimized schedule
-schedule.write_schedule_to_file("optimized_position_schedule.pickle")
+schedule.write_schedule_to_file("optimized_position_schedule.fas")
 
 # And load it in future measurements directly
-schedule.load_schedule_from_file("optimized_position_schedule.pickle")
+schedule.load_schedule_from_file("optimized_position_schedule.fas")
 
 # Going through schedule
 for position in schedule:
@@ -1,14 +1,18 @@
 
 from .serialcontroller import SerialController
+from .planning import MovePlanner
+from .positionlog import PositionLogger
 from .utils_constants import axis_to_system_units, system_default_units, axis_units, Axis, system_to_axis_units
-from .utils_constants import parse_number_string
-from dataclasses import dataclass
+from .answerparser import parse_frame
+from dataclasses import dataclass, replace
 import logging
+import threading
 import time
+import numpy as np
 
 log = logging.getLogger(__name__)
 
-@dataclass    
+@dataclass(slots=True)
 class Position:
 
     X: float = None
@@ -19,31 +23,107 @@ class Position:
 
     def update_to_system_units(self):
         # Iterate through each axis and update its value according to the unit conversion
-        for axis, value in self.__dict__.items():
+        for axis in self.__slots__:
+            value = getattr(self, axis)
             if value is not None:
                 setattr(self, axis, axis_to_system_units(value, axis))
         return self
+
+    def to_dict(self) -> dict:
+        # Set axes as keyword arguments for FiveAxisSystem.move_absolute_position
+        return {axis.lower(): getattr(self, axis) for axis in self.__slots__ if getattr(self, axis) is not None}
+
+    def __setstate__(self, state):
+        # Slot state is (None, {...}), pickles from before __slots__ carry the plain __dict__
+        if isinstance(state, tuple):
+            state = state[1]
+        for axis, value in state.items():
+            setattr(self, axis, value)
     
 class FiveAxisSystem:
     
-    def __init__(self, controller : SerialController):
+    def __init__(self, controller : SerialController, simultaneous : bool = False, planner : MovePlanner = None,
+                 position_logger : PositionLogger = None):
         self.controller = controller
-        self.speed = 100
-        self.acceleration = 100
+        # Chooses the speed and acceleration settings sent with every axis move
+        self.planner = MovePlanner() if planner is None else planner
+        # Records every reached position with the predicted and measured move duration if set
+        self.position_logger = position_logger
+        # Dispatch all axis commands of a move before waiting for their answers
+        self.simultaneous = simultaneous
+        self.current_position = None
+
+    @property
+    def path_time(self):
+        """
+        PathTime model matching how this system executes moves, for FASSchedule(path_time=...).
+        """
+        return self.planner.path_time(
+            concurrent=self.simultaneous, dispatch_overhead=self.controller.command_dispatch_time()
+        )
+
+    def _axis_command(self, axis: str, pos: int) -> tuple:
+        axis_command = getattr(Axis, axis.upper())
+        # Plan the profile for the distance from the last known position, the fastest allowed one if unknown
+        distance = None
+        current = None if self.current_position is None else getattr(self.current_position, axis.upper())
+        if current is not None:
+            distance = abs(axis_to_system_units(int(pos), axis.upper()) - current)
+        speed, acceleration = self.planner.axis_profile(axis, distance)
+        return f"{axis_command}-Achse:{int(pos)}", str(speed), str(acceleration)
+
     def _move_single_axis(self, axis: str, pos: int)->str:
         log.debug(f"Moving axis {axis} to position {int(pos)}")
-        axis_command = getattr(Axis, axis.upper())
-        if axis_command in ["4"]:
-            speed = 50
-        else:
-            speed = self.speed
-        return self.controller.send(f"{axis_command}-Achse:{int(pos)}", str(speed), str(self.acceleration))
+        return self.controller.send(*self._axis_command(axis, pos))
+
+    def calibrate_pacing(self, axis: str = "x") -> float:
+        """
+        Calibrates the shortest safe gap between command arguments (see SerialController.calibrate_min_gap),
+        probing with moves of one axis to the position it is already at.
+        """
+        position = self._parse_answer(self.controller.send("My-Achse:"))
+        pos = getattr(position, axis.upper())
+        if pos is None:
+            raise RuntimeError("Could not read the current position for the pacing calibration")
+        probe = self._axis_command(axis, system_to_axis_units(pos, axis.upper()))
+        return self.controller.calibrate_min_gap(*probe, validate=self._is_position_answer)
+
+    def _is_position_answer(self, answer) -> bool:
+        try:
+            return self._parse_answer(answer).X is not None
+        except (IndexError, ValueError):
+            return False
     
-    def get_current_position(self)->None:
-        answer = self.controller.send(f"My-Achse:")
-        print(self._parse_answer(answer))
+    def read_position(self) -> Position:
+        """
+        Queries the current position of all axes from the controller.
+        """
+        return self._parse_answer(self.controller.send("My-Achse:"))
+
+    def get_current_position(self)->Position:
+        position = self.read_position()
+        print(position)
+        return position
         
-    def move_absolute_position(self, x=None, y=None, z=None, rot=None, tilt=None, position=None) -> None:
+    def _move_axes_simultaneously(self, moves: dict) -> str:
+        log.debug(f"Dispatching moves {moves} before waiting for the answers")
+        commands = [self._axis_command(axis, pos) for axis, pos in moves.items()]
+        # The answer read last is the one of the axis that finished last
+        return self.controller.send_many(commands)[-1]
+
+    def _drop_unchanged_axes(self, moves: dict) -> dict:
+        # Axes already within the planner tolerance of their target are not sent
+        if self.current_position is None:
+            return moves
+        remaining = {}
+        for axis, value in moves.items():
+            current = getattr(self.current_position, axis.upper())
+            tolerance = self.planner.limits[axis.upper()].tolerance
+            if current is None or abs(value - current) > tolerance:
+                remaining[axis] = value
+        return remaining
+
+    def move_absolute_position(self, x=None, y=None, z=None, rot=None, tilt=None, position=None, simultaneous=None) -> None:
         # Check if both individual coordinates and Position object are provided
         if (x is not None or y is not None or z is not None or rot is not None or tilt is not None) and isinstance(position, Position):
             log.error("Error: Cannot provide coordinates and a Position object at the same time.")
@@ -54,12 +134,140 @@ class FiveAxisSystem:
             x, y, z, rot, tilt = position.X, position.Y, position.Z, position.ROT, position.TILT
         # Create a dictionary from the local variables (axis names and values),
         # filtering out None values to only attempt to move axes that are specified.
-        moves = {axis: value for axis, value in locals().items() if axis not in ["self", "position"] and value is not None}
+        moves = {axis: value for axis, value in locals().items() if axis not in ["self", "position", "simultaneous"] and value is not None}
+        moves = self._drop_unchanged_axes(moves)
+        if not moves:
+            log.debug("All axes are already at the target position, nothing to send")
+            return
         log.debug(f"Moving to absolute position {moves}")
-        for axis, pos in moves.items():
-            converted_pos = system_to_axis_units(pos, axis.upper())
-            answer = self._move_single_axis(axis, converted_pos)
+        if simultaneous is None:
+            simultaneous = self.simultaneous
+        start = time.perf_counter()
+        if simultaneous and len(moves) > 1:
+            answer = self._move_axes_simultaneously(
+                {axis: system_to_axis_units(pos, axis.upper()) for axis, pos in moves.items()}
+            )
+        else:
+            for axis, pos in moves.items():
+                converted_pos = system_to_axis_units(pos, axis.upper())
+                answer = self._move_single_axis(axis, converted_pos)
+        duration = time.perf_counter() - start
+        previous_position = self.current_position
+        self.current_position = self._parse_answer(answer)
+        telemetry = getattr(self.controller, "telemetry", None)
+        if self.position_logger is not None or telemetry is not None:
+            predicted = None
+            if previous_position is not None:
+                target = Position(**{axis.upper(): value for axis, value in moves.items()})
+                path_time = self.path_time
+                path_time.concurrent = simultaneous
+                predicted = path_time.time_to_position(previous_position, target)
+            if telemetry is not None:
+                telemetry.record_move([axis.upper() for axis in moves], predicted, duration)
+            if self.position_logger is not None:
+                self.position_logger.log(self.current_position, predicted, duration)
+
+    def fly_scan(self, axis: str, positions, dwell: float = 0.0, measure=None, latency: float = None) -> np.ndarray:
+        """
+        Crosses positions of one axis in a single move at constant speed, calling measure(index, position, fas) as the
+        axis passes each of them, instead of stopping at every position.
+
+        The axis first moves one run-up (see PathTime.fly_run_up) before the first position and ends one run-up after
+        the last one, so all positions are crossed at full speed. The speed leaves at least dwell seconds between
+        neighbouring positions. The controller only answers a move once it is done, so the crossings are estimated
+        from the calibrated speed profile (PathTime.crossing_times), counted from when the last argument of the move
+        is written plus latency. measure runs on a separate thread and must not send commands.
+
+        The crossings are estimates. The calibration only measures the fixed overhead t0 of a move as a whole, not
+        which part of it passes before the motion starts, so by default PathTime.start_delay assumes a share of it.
+        If the real delay differs, every position is measured early or late by the difference times the fly speed,
+        up to t0 times the speed. Pass a latency measured on the rig to remove that error.
+
+        Args:
+            axis: Axis name, e.g. "x" or "rot".
+            positions: Monotonic positions of the axis in system units.
+            dwell: Measuring time per position in seconds.
+            measure: Callable measure(index, position, fas), position being a Position with the crossed value.
+            latency: Seconds between the move command and the start of the motion, PathTime.start_delay if None.
+
+        Returns:
+            np.ndarray: time.perf_counter() at which each position was measured.
+        """
+        from .flyscan import fly_speed
+
+        axis = axis.upper()
+        positions = np.asarray(positions, dtype=float)
+        direction = 1.0 if positions[-1] >= positions[0] else -1.0
+        speed_adc, acceleration_adc = self.planner.fly_profile(axis, fly_speed(positions, dwell))
+        path_time = self.planner.path_time()
+        run_up = path_time.fly_run_up(axis, speed_adc)
+        start, stop = positions[0] - direction * run_up, positions[-1] + direction * run_up
+        self.move_absolute_position(**{axis.lower(): start}, simultaneous=False)
+        crossings = path_time.crossing_times(axis, abs(stop - start), np.abs(positions - start), speed_adc)
+        if latency is None:
+            latency = path_time.start_delay(axis)
+            _, speed, t0 = path_time._axis_motion(axis, speed_adc)
+            error = max(path_time.start_delay_share, 1 - path_time.start_delay_share) * t0 * speed
+            log.warning(
+                f"Fly scan trigger positions are estimates, they may be off by up to {error:.3g} system units "
+                f"of {axis} unless the latency is measured"
+            )
+
+        origin = self.current_position
+        measured = np.full(len(positions), np.nan)
+        finished = threading.Event()
+        written = threading.Event()
+        began = None
+        errors = []
+
+        def on_written(timestamp):
+            nonlocal began
+            # The motion starts once the last of the three arguments is written, after any pacing wait before them
+            began = timestamp + latency
+            written.set()
+
+        def trigger():
+            written.wait()
+            if began is None:
+                # The move was never written
+                return
+            for index, crossing in enumerate(crossings):
+                # Positions still ahead when the move already answered are measured right away
+                finished.wait(max(0.0, began + crossing - time.perf_counter()))
+                measured[index] = time.perf_counter()
+                if measure is not None:
+                    try:
+                        measure(index, replace(origin, **{axis: float(positions[index])}), self)
+                    except Exception as err:
+                        errors.append(err)
+                        return
+
+        log.debug(f"Fly scan of {len(positions)} {axis} positions from {start} to {stop} at speed {speed_adc}")
+        command = (
+            f"{getattr(Axis, axis)}-Achse:{int(system_to_axis_units(stop, axis))}",
+            str(speed_adc),
+            str(acceleration_adc),
+        )
+        thread = threading.Thread(target=trigger, name="Fly scan trigger", daemon=True)
+        thread.start()
+        start_time = time.perf_counter()
+        try:
+            answer = self.controller.send(*command, on_written=on_written)
+        finally:
+            finished.set()
+            written.set()
+            thread.join()
+        duration = time.perf_counter() - start_time
         self.current_position = self._parse_answer(answer)
+        predicted = path_time.fly_time(axis, abs(positions[-1] - positions[0]), speed_adc)
+        telemetry = getattr(self.controller, "telemetry", None)
+        if telemetry is not None:
+            telemetry.record_move([axis], float(predicted), duration)
+        if self.position_logger is not None:
+            self.position_logger.log(self.current_position, float(predicted), duration)
+        if errors:
+            raise errors[0]
+        return measured
 
     def move_relative_distance(self, x=None, y=None, z=None, rot=None, tilt=None) -> None:
         if self.current_position is None:
@@ -77,16 +285,22 @@ class FiveAxisSystem:
 
     def _parse_answer(self, answer) -> Position:
         log.debug(f"Parsing answer {answer} into Position instance")
-        answer_without_ending = answer.split(self.controller.answer_end)
-        if len(answer_without_ending) > 1:
-            split_axis = answer_without_ending[0].split("Achse:")
-            axis_values = [parse_number_string(split_axis[i].split(" ")[0]) for i in range(1, 6)]
-            return Position(*axis_values).update_to_system_units()
-        else:
+        answer_end = self.controller.answer_end
+        if isinstance(answer, bytes):
+            answer_end = answer_end.encode()
+        frame, found, _ = answer.partition(answer_end)
+        if not found:
             return Position()
+        return Position(*parse_frame(frame))
         
-    def log_current_position(self, fname) -> None:
+    def log_current_position(self, fname=None) -> None:
         position = self.current_position
+        if fname is None:
+            if self.position_logger is None:
+                raise ValueError("log_current_position needs a file name or a position_logger")
+            # Queued on the background logger instead of opening the file for every record
+            self.position_logger.log(position)
+            return
         with open(fname, "a") as f:
             x, y, z, rot, tilt = position.X, position.Y, position.Z, position.ROT, position.TILT
             f.write(f"{time.time()}\t")
@@ -0,0 +1,96 @@
+import logging
+import re
+from .utils_constants import axis_order, axis_units, system_default_units
+
+log = logging.getLogger(__name__)
+
+# (system unit, axis unit) factors of axis_to_system_units, precomputed in axis_order
+unit_factors = tuple((float(system_default_units[axis]), float(axis_units[axis])) for axis in axis_order)
+
+_value_pattern = {bytes: re.compile(rb"Achse:([^\s#]*)"), str: re.compile(r"Achse:([^\s#]*)")}
+_minus = {bytes: b"-", str: "-"}
+
+
+def parse_frame(frame) -> tuple:
+    """
+    Parses the axis values of one position answer, e.g. "X-Achse:100 Y-Achse:0 Z-Achse:0 4-Achse:0 5-Achse:0 ",
+    given as bytes or str.
+
+    Returns:
+        tuple: The five axis values in axis_order and system units.
+
+    Raises:
+        ValueError: If the frame holds fewer than five axis values or one is not a number.
+    """
+    kind = type(frame)
+    tokens = _value_pattern[kind].findall(frame)
+    if len(tokens) < len(axis_order):
+        raise ValueError(f"Answer {frame!r} holds {len(tokens)} axis values, expected {len(axis_order)}")
+    minus = _minus[kind]
+    # Same convention as parse_number_string: a minus anywhere makes the number after it negative
+    return tuple(
+        (-float(token.split(minus)[1]) if minus in token else float(token)) * system_unit / axis_unit
+        for token, (system_unit, axis_unit) in zip(tokens, unit_factors)
+    )
+
+
+class AnswerParser:
+    """
+    Incremental parser of the controller's position answers from raw bytes.
+
+    Bytes are fed as they arrive, in chunks of any size: a frame split over several chunks is completed by later
+    ones, several frames in one chunk are all returned.
+
+    Args:
+        answer_end (bytes): Delimiter that ends every answer.
+    """
+
+    def __init__(self, answer_end=b"####"):
+        self.answer_end = answer_end.encode() if isinstance(answer_end, str) else answer_end
+        self._buffer = bytearray()
+        self.invalid_frames = 0
+
+    @property
+    def pending(self) -> bytes:
+        """
+        Bytes received after the last complete frame.
+        """
+        return bytes(self._buffer)
+
+    def split(self, data: bytes) -> list:
+        """
+        Adds received bytes and returns the frames completed by them, each as bytes up to and including answer_end.
+        """
+        self._buffer += data
+        frames = []
+        start = 0
+        while True:
+            end = self._buffer.find(self.answer_end, start)
+            if end < 0:
+                break
+            end += len(self.answer_end)
+            frames.append(bytes(self._buffer[start:end]))
+            start = end
+        if start:
+            del self._buffer[:start]
+        return frames
+
+    def feed(self, data: bytes) -> list:
+        """
+        Adds received bytes and returns the positions of all frames completed by them, each as a tuple of the five
+        axis values in system units. Frames without valid axis values are counted in invalid_frames and skipped.
+        """
+        positions = []
+        for frame in self.split(data):
+            try:
+                positions.append(parse_frame(frame[: -len(self.answer_end)]))
+            except ValueError as err:
+                self.invalid_frames += 1
+                log.debug(err)
+        return positions
+
+    def reset(self) -> None:
+        """
+        Drops a partially received frame.
+        """
+        self._buffer.clear()
@@ -0,0 +1,337 @@
+"""
+Fits the travel time model of PathTime to the speed/acceleration scans of the axes and stores it in a calibration file.
+
+A scan file has one tab separated row per (speed_adc, acceleration_adc) setting, followed by (distance, time) pairs
+of the moves measured with it (distances in system units, times in seconds). Re-calibrate after the hardware
+changed with:
+
+    python -m src.calibration 240311_FAS_calibration/data --output fas_calibration.json
+
+PathTime loads the default calibration file lazily (see load_calibration) and falls back to the constants of the
+original 240311_FAS_calibration analysis if there is none.
+"""
+import argparse
+import functools
+import glob
+import hashlib
+import json
+import logging
+import os
+import time
+import numpy as np
+from .utils_constants import Units, axis_order, system_default_units
+
+log = logging.getLogger(__name__)
+
+calibration_format_version = 1
+# Written by the pipeline, loaded by PathTime if no other file is given. FAS_CALIBRATION_FILE overrides it.
+default_calibration_file = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fas_calibration.json"
+)
+scan_file_pattern = "*_speed_acceleration_scan_{axis}"
+
+# Constants of the motion model: acceleration = a_slope * acceleration_adc + a_const (adc in steps of 10),
+# max_speed = s_slope * speed_adc + s_const, t0 = fixed overhead of every move
+model_parameters = ("a_slope", "a_const", "s_slope", "s_const", "t0")
+
+# Distance units the fit is done in, the same as in the original analysis
+calibration_units = {
+    "X": Units.MM,
+    "Y": Units.MM,
+    "Z": Units.MM,
+    "ROT": Units.DEG,
+    "TILT": Units.DEG,
+}
+
+# Result of the 240311_FAS_calibration analysis. distance_scale converts system units into the distance units the
+# constants were fitted in.
+default_axis_calibration = {
+    "x": {
+        "a_slope": 0.2904409779122619,
+        "a_const": 1.2077330604928136,
+        "s_slope": 0.21638106368842852,
+        "s_const": 0.0018993869426034257,
+        "t0": 0.8908983496211884,
+        "distance_scale": Units.MM / Units.CM,
+    },
+    "y": {
+        "a_slope": 0.23827953982528538,
+        "a_const": 2.0345359162324947,
+        "s_slope": 0.21659195037066725,
+        "s_const": 0.0007889468963793958,
+        "t0": 0.8251032150944726,
+        "distance_scale": Units.MM / Units.CM,
+    },
+    "z": {
+        "a_slope": 0.23342700810816303,
+        "a_const": 2.127238368785634,
+        "s_slope": 0.21652565324121187,
+        "s_const": 0.000773052604182803,
+        "t0": 0.8161839563958946,
+        "distance_scale": Units.MM / Units.CM,
+    },
+    "tilt": {
+        "a_slope": 17.752623230479188,
+        "a_const": -28.161817079227312,
+        "s_slope": 0.06027239386618709,
+        "s_const": -0.001236066727795777,
+        "t0": 0.8217697818261861,
+        "distance_scale": 1.0,
+    },
+    "rot": {
+        "a_slope": 6.081587120398348,
+        "a_const": -17.82680508910915,
+        "s_slope": 0.020025354843183265,
+        "s_const": -0.00014466021729686357,
+        "t0": 0.8218914594786518,
+        "distance_scale": 1.0,
+    },
+}
+
+
+def calibration_version(axes: dict) -> str:
+    """
+    Content hash of the model constants, changes whenever any of them changes.
+    """
+    constants = {
+        axis: {key: float(values[key]) for key in model_parameters + ("distance_scale",)}
+        for axis, values in axes.items()
+    }
+    return hashlib.sha1(json.dumps(constants, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def default_calibration() -> dict:
+    return {
+        "format_version": calibration_format_version,
+        "version": calibration_version(default_axis_calibration),
+        "source": "240311_FAS_calibration",
+        "axes": default_axis_calibration,
+    }
+
+
+def load_scan(fname: str) -> dict:
+    """
+    Reads a speed/acceleration scan file into flat arrays with one entry per measured move.
+
+    Rows may contain different numbers of moves (e.g. aborted scans), they are parsed in a single pass over all
+    numbers of the file.
+
+    Returns:
+        dict: "speed_adc", "acceleration_adc", "distance" and "time" arrays of equal length.
+    """
+    with open(fname) as f:
+        lines = [line.split() for line in f.read().splitlines()]
+    lines = [line for line in lines if len(line) >= 4 and len(line) % 2 == 0]
+    values = np.array([value for line in lines for value in line], dtype=float)
+    lengths = np.array([len(line) for line in lines])
+    row_start = np.cumsum(lengths) - lengths
+    # Every row contributes (length - 2) / 2 moves, the pairs start after the two adc values
+    moves = (lengths - 2) // 2
+    row = np.repeat(np.arange(len(lines)), moves)
+    pair = np.arange(moves.sum()) - np.repeat(np.cumsum(moves) - moves, moves)
+    first = row_start[row] + 2 + 2 * pair
+    return {
+        "speed_adc": values[row_start[row]],
+        "acceleration_adc": values[row_start[row] + 1],
+        "distance": values[first],
+        "time": values[first + 1],
+    }
+
+
+def _model_and_jacobian(params, x_acceleration, x_speed, distance):
+    # Move times of the ramp model and their derivatives by the model parameters
+    a_slope, a_const, s_slope, s_const, t0 = params
+    acceleration = a_slope * x_acceleration + a_const
+    max_speed = s_slope * x_speed + s_const
+    with np.errstate(all="ignore"):
+        triangular = distance < max_speed * max_speed / acceleration
+        ramp_time = np.where(
+            triangular, np.sqrt(4 * distance / acceleration), distance / max_speed + max_speed / acceleration
+        )
+        dt_dacceleration = np.where(triangular, -ramp_time / (2 * acceleration), -max_speed / acceleration**2)
+        dt_dspeed = np.where(triangular, 0.0, 1 / acceleration - distance / max_speed**2)
+    jacobian = np.stack(
+        [
+            dt_dacceleration * x_acceleration,
+            dt_dacceleration,
+            dt_dspeed * x_speed,
+            dt_dspeed,
+            np.ones_like(distance),
+        ],
+        axis=1,
+    )
+    valid = (acceleration > 0) & (max_speed > 0)
+    return ramp_time + t0, jacobian, valid
+
+
+def _levenberg_marquardt(params, x_acceleration, x_speed, distance, times, max_iterations=200, tolerance=1e-12):
+    # Least squares fit of the model parameters, steps that make a model evaluation invalid are rejected
+    model, jacobian, valid = _model_and_jacobian(params, x_acceleration, x_speed, distance)
+    residual = times - model
+    cost = residual @ residual
+    damping = 1e-3
+    for _ in range(max_iterations):
+        normal = jacobian.T @ jacobian
+        gradient = jacobian.T @ residual
+        while True:
+            step = np.linalg.solve(normal + damping * np.diag(np.diag(normal)), gradient)
+            candidate = params + step
+            new_model, new_jacobian, new_valid = _model_and_jacobian(candidate, x_acceleration, x_speed, distance)
+            new_residual = times - new_model
+            new_cost = new_residual @ new_residual if new_valid.all() else np.inf
+            if new_cost < cost or damping > 1e12:
+                break
+            damping *= 4
+        if new_cost >= cost:
+            break
+        converged = cost - new_cost < tolerance * cost
+        params, jacobian, residual, cost = candidate, new_jacobian, new_residual, new_cost
+        damping = max(damping / 3, 1e-12)
+        if converged:
+            break
+    return params, residual
+
+
+def fit_axis(scan: dict, distance_scale: float = 1.0, initial: dict = None, outlier_threshold: float = 5.0) -> dict:
+    """
+    Fits the model constants of one axis to its scan.
+
+    Zero distance moves and settings the model can not describe (non-positive acceleration or speed at the initial
+    constants) are left out. Moves deviating by more than outlier_threshold robust standard deviations from the first
+    fit are dropped and the fit is repeated.
+
+    Args:
+        scan (dict): Arrays as returned by load_scan.
+        distance_scale (float): Factor from the scan distances (system units) to the units to fit in.
+        initial (dict): Start values of the constants, default_axis_calibration entry of the axis if not given.
+        outlier_threshold (float): Residual cut in units of the scaled median absolute deviation.
+
+    Returns:
+        dict: Fitted constants, distance_scale and the rms residual and number of moves of the fit.
+    """
+    if initial is None:
+        initial = default_axis_calibration["x"]
+    params = np.array([initial[key] for key in model_parameters], dtype=float)
+    x_acceleration = np.trunc(scan["acceleration_adc"] / 10) * 10
+    x_speed = scan["speed_adc"]
+    distance = np.abs(scan["distance"]) * distance_scale
+    times = scan["time"]
+
+    _, _, valid = _model_and_jacobian(params, x_acceleration, x_speed, distance)
+    keep = valid & (distance > 0) & np.isfinite(times)
+    for _ in range(2):
+        params, residual = _levenberg_marquardt(
+            params, x_acceleration[keep], x_speed[keep], distance[keep], times[keep]
+        )
+        spread = 1.4826 * np.median(np.abs(residual - np.median(residual)))
+        inlier = np.abs(residual) <= outlier_threshold * max(spread, 1e-6)
+        if inlier.all():
+            break
+        log.debug(f"Dropping {np.count_nonzero(~inlier)} outlier moves")
+        keep[np.flatnonzero(keep)[~inlier]] = False
+
+    calibration = {key: float(value) for key, value in zip(model_parameters, params)}
+    calibration["distance_scale"] = float(distance_scale)
+    calibration["rms"] = float(np.sqrt(np.mean(residual[inlier] ** 2)))
+    calibration["moves"] = int(np.count_nonzero(keep))
+    return calibration
+
+
+def fit_calibration(data_dir: str, pattern: str = scan_file_pattern) -> dict:
+    """
+    Fits all axes to the scan files found in data_dir.
+
+    Axes without a scan file keep the default constants.
+
+    Returns:
+        dict: Calibration as written by write_calibration.
+    """
+    axes = {}
+    sources = {}
+    for axis in axis_order:
+        key = axis.lower()
+        files = sorted(glob.glob(os.path.join(data_dir, pattern.format(axis=key))))
+        if not files:
+            log.warning(f"No scan file for axis {axis} in {data_dir}, keeping the default calibration")
+            axes[key] = dict(default_axis_calibration[key])
+            continue
+        scans = [load_scan(fname) for fname in files]
+        scan = {name: np.concatenate([s[name] for s in scans]) for name in scans[0]}
+        distance_scale = calibration_units[axis] / system_default_units[axis]
+        axes[key] = fit_axis(scan, distance_scale, default_axis_calibration[key])
+        sources[key] = [os.path.basename(fname) for fname in files]
+        log.info(f"Axis {axis}: rms {axes[key]['rms']:.4f} s over {axes[key]['moves']} moves")
+    return {
+        "format_version": calibration_format_version,
+        "version": calibration_version(axes),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "source": sources,
+        "axes": axes,
+    }
+
+
+def write_calibration(calibration: dict, fname: str = default_calibration_file) -> None:
+    # Written to a temporary file first, so a running PathTime never reads a half written calibration
+    tmp = fname + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(calibration, f, indent=2)
+    os.replace(tmp, fname)
+    log.info(f"Calibration {calibration['version']} written to {fname}")
+
+
+@functools.lru_cache(maxsize=16)
+def _read_calibration(fname: str, mtime_ns: int) -> dict:
+    # Cached per file and modification time, rewriting the file invalidates the entry
+    with open(fname) as f:
+        calibration = json.load(f)
+    if calibration.get("format_version") != calibration_format_version:
+        raise ValueError(
+            f"{fname} has calibration format {calibration.get('format_version')}, "
+            f"expected {calibration_format_version}"
+        )
+    for axis in axis_order:
+        values = calibration["axes"].get(axis.lower())
+        if values is None or any(key not in values for key in model_parameters):
+            raise ValueError(f"{fname} misses model constants of axis {axis}")
+        values.setdefault("distance_scale", 1.0)
+    # Derived from the constants instead of trusting the stored one, so hand edited files get a new version too
+    calibration["version"] = calibration_version(calibration["axes"])
+    return calibration
+
+
+def load_calibration(fname: str = None) -> dict:
+    """
+    Loads a calibration file written by write_calibration.
+
+    Args:
+        fname (str): Calibration file. If not given, $FAS_CALIBRATION_FILE or default_calibration_file is used, and
+            the constants of the original analysis if that does not exist.
+
+    Returns:
+        dict: Calibration with "version" and per axis constants under "axes".
+    """
+    if fname is None:
+        fname = os.environ.get("FAS_CALIBRATION_FILE", default_calibration_file)
+        if not os.path.exists(fname):
+            return default_calibration()
+    fname = os.path.abspath(fname)
+    return _read_calibration(fname, os.stat(fname).st_mtime_ns)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Fit the FAS travel time model to speed/acceleration scans")
+    parser.add_argument("data_dir", help="Directory with the *_speed_acceleration_scan_<axis> files")
+    parser.add_argument("--output", default=default_calibration_file)
+    args = parser.parse_args(argv)
+
+    calibration = fit_calibration(args.data_dir)
+    for axis, values in calibration["axes"].items():
+        constants = " ".join(f"{key}={values[key]:.6g}" for key in model_parameters)
+        print(f"{axis:5s} {constants} rms={values.get('rms', float('nan')):.4f}s")
+    write_calibration(calibration, args.output)
+    print(f"Calibration {calibration['version']} written to {args.output}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,146 @@
+import hashlib
+import logging
+import os
+import struct
+import time
+import numpy as np
+from tqdm import tqdm
+from .FAS import FiveAxisSystem
+from .scheduling import FASSchedule, array_to_position
+
+log = logging.getLogger(__name__)
+
+journal_magic = b"FASJRNL1"
+# Magic, sha256 of the schedule coordinates, number of positions
+journal_header = struct.Struct("<8s32sQ")
+# Index of a completed position and the time it was completed
+journal_record = struct.Struct("<Qd")
+
+
+def schedule_digest(coordinates: np.ndarray, chunk_rows: int = 2**18) -> bytes:
+    """
+    sha256 of the coordinate content, read in chunks so memory-mapped schedules are not loaded at once.
+    """
+    digest = hashlib.sha256()
+    digest.update(str(coordinates.shape).encode())
+    for start in range(0, len(coordinates), chunk_rows):
+        chunk = np.ascontiguousarray(coordinates[start : start + chunk_rows], dtype="<f8")
+        digest.update(np.where(np.isnan(chunk), np.nan, chunk).tobytes())
+    return digest.digest()
+
+
+def read_journal(fname: str) -> tuple:
+    """
+    Reads a progress journal.
+
+    Returns:
+        tuple: (digest, length, records) with records a structured array of the completed "index" and its
+        completion "time", a record cut off by a crash is ignored.
+    """
+    with open(fname, "rb") as f:
+        header = f.read(journal_header.size)
+        if len(header) < journal_header.size or not header.startswith(journal_magic):
+            raise ValueError(f"{fname} is not a schedule progress journal")
+        _, digest, length = journal_header.unpack(header)
+        data = f.read()
+    data = data[: len(data) - len(data) % journal_record.size]
+    records = np.frombuffer(data, dtype=[("index", "<u8"), ("time", "<f8")])
+    return digest, length, records
+
+
+class ScheduleExecutor:
+    """
+    Moves through a schedule position by position, journaling progress so an interrupted run can be resumed.
+
+    After every completed position (move and measurement) its index is appended to the journal file. The journal
+    is flushed to the OS after every record and fsynced every fsync_every positions or fsync_interval seconds,
+    whichever comes first. Running again with the same journal continues after the last journaled position, provided
+    the schedule content is unchanged.
+
+    Args:
+        fas (FiveAxisSystem): System to move.
+        schedule (FASSchedule): Positions to visit, may be memory-mapped, rows are read lazily.
+        journal_file (str): Progress journal, created if it does not exist.
+        measure: Optional callable measure(index, position, fas) run at every position after the move.
+        fsync_every (int): Positions between fsyncs of the journal.
+        fsync_interval (float): Longest time in seconds between fsyncs of the journal.
+    """
+
+    def __init__(self, fas: FiveAxisSystem, schedule: FASSchedule, journal_file: str, measure=None,
+                 fsync_every: int = 20, fsync_interval: float = 5.0):
+        self.fas = fas
+        self.schedule = schedule
+        self.journal_file = journal_file
+        self.measure = measure
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._digest = None
+
+    def _schedule_digest(self) -> bytes:
+        # Hashing reads the whole schedule, do it once per executor
+        if self._digest is None:
+            self._digest = schedule_digest(self.schedule.coordinates)
+        return self._digest
+
+    def completed(self) -> int:
+        """
+        Number of positions completed according to the journal, the index the next run starts at.
+        """
+        if not os.path.exists(self.journal_file):
+            return 0
+        digest, length, records = read_journal(self.journal_file)
+        if digest != self._schedule_digest() or length != len(self.schedule):
+            raise ValueError(f"Journal {self.journal_file} belongs to a different schedule")
+        return int(records["index"][-1]) + 1 if len(records) else 0
+
+    def _open_journal(self):
+        if not os.path.exists(self.journal_file):
+            with open(self.journal_file, "wb") as f:
+                f.write(journal_header.pack(journal_magic, self._schedule_digest(), len(self.schedule)))
+                f.flush()
+                os.fsync(f.fileno())
+        else:
+            # Drop a record cut off by a crash, so new records stay aligned
+            size = os.path.getsize(self.journal_file)
+            tail = (size - journal_header.size) % journal_record.size
+            if tail:
+                with open(self.journal_file, "r+b") as f:
+                    f.truncate(size - tail)
+        return open(self.journal_file, "ab")
+
+    def run(self, progress: bool = True) -> int:
+        """
+        Visits all positions not completed yet.
+
+        Returns:
+            int: Number of positions visited in this run.
+        """
+        start = self.completed()
+        n = len(self.schedule)
+        if start:
+            log.info(f"Resuming schedule at position {start} of {n}")
+        journal = self._open_journal()
+        unsynced = 0
+        synced_at = time.monotonic()
+        visited = 0
+        try:
+            with self.fas.controller.session():
+                coordinates = self.schedule.coordinates
+                for index in tqdm(range(start, n), initial=start, total=n, desc="Running schedule", disable=not progress):
+                    position = array_to_position(coordinates[index])
+                    self.fas.move_absolute_position(position=position)
+                    if self.measure is not None:
+                        self.measure(index, position, self.fas)
+                    journal.write(journal_record.pack(index, time.time()))
+                    journal.flush()
+                    visited += 1
+                    unsynced += 1
+                    if unsynced >= self.fsync_every or time.monotonic() - synced_at >= self.fsync_interval:
+                        os.fsync(journal.fileno())
+                        unsynced = 0
+                        synced_at = time.monotonic()
+        finally:
+            journal.flush()
+            os.fsync(journal.fileno())
+            journal.close()
+        return visited
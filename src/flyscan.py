@@ -0,0 +1,165 @@
+"""
+Fly scans: instead of stopping at every position of a line along one axis, the axis crosses all of them in a single
+move at constant speed and the measurements are taken as it passes (see FiveAxisSystem.fly_scan).
+"""
+from dataclasses import dataclass
+import logging
+import numpy as np
+from .planning import MovePlanner
+from .scheduling import PathTime
+from .utils_constants import axis_order
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class FlySegment:
+    """
+    Rows start to stop (exclusive) of a schedule, between which only axis moves, always in the same direction.
+    """
+
+    axis: str
+    start: int
+    stop: int
+
+    def __len__(self):
+        return self.stop - self.start
+
+
+def fly_speed(positions, dwell: float) -> float:
+    """
+    Highest speed (system units per second) that leaves dwell seconds between neighbouring positions, None if there
+    is no limit.
+    """
+    if dwell <= 0 or len(positions) < 2:
+        return None
+    return float(np.abs(np.diff(positions)).min() / dwell)
+
+
+def _reached(coordinates: np.ndarray, origin) -> np.ndarray:
+    # Position after every row, axes that are not set keep their last value
+    origin = np.full(len(axis_order), np.nan) if origin is None else np.asarray(origin, dtype=float)
+    path = np.vstack([origin, coordinates])
+    last = np.where(np.isnan(path), 0, np.arange(len(path))[:, None])
+    np.maximum.accumulate(last, axis=0, out=last)
+    return path[last, np.arange(len(axis_order))][1:]
+
+
+def _fly_move(path_time: PathTime, planner: MovePlanner, axis: str, positions, dwell: float) -> tuple:
+    # (speed_adc, start point, end point) of the fly move over positions, like FiveAxisSystem.fly_scan sends it
+    speed_adc, _ = planner.fly_profile(axis, fly_speed(positions, dwell))
+    run_up = path_time.fly_run_up(axis, speed_adc)
+    direction = 1.0 if positions[-1] >= positions[0] else -1.0
+    return speed_adc, positions[0] - direction * run_up, positions[-1] + direction * run_up
+
+
+def _detour(path: np.ndarray, reached: np.ndarray, i: int, start: int, stop: int, points: tuple,
+            path_time: PathTime) -> float:
+    # Extra time of the moves around the fly move over rows start..stop - 1 of path[1:]: the move into the segment
+    # ends one run-up before its first position, and the axis returns from the overshoot one run-up past the last
+    # position before the next row
+    origins, targets = path[[start, stop]], path[[start + 1, min(stop + 1, len(path) - 1)]]
+    if stop + 1 == len(path):
+        # Nothing follows the segment, the axis stays at the overshoot
+        origins, targets = origins[:1], targets[:1]
+    detour_origins, detour_targets = origins.copy(), targets.copy()
+    detour_targets[0, i] = points[0]
+    if len(origins) > 1:
+        detour_origins[1, i] = points[1]
+        if np.isnan(detour_targets[1, i]):
+            detour_targets[1, i] = reached[stop - 1, i]
+    detour = path_time.travel_times(detour_origins, detour_targets).sum()
+    return float(detour - path_time.travel_times(origins, targets).sum())
+
+
+def find_fly_segments(
+    coordinates,
+    path_time: PathTime = None,
+    planner: MovePlanner = None,
+    min_points: int = 5,
+    dwell: float = 0.0,
+    origin=None,
+) -> list:
+    """
+    Finds runs of consecutive positions that only move a single axis, in one direction, and are faster as one fly
+    move than stopping at each of them.
+
+    Axes within the planner tolerance of their previous position count as not moved. A stop costs its PathTime move
+    plus dwell seconds of measuring, a fly segment its PathTime.fly_time at the speed that leaves dwell seconds
+    between neighbouring positions, plus the longer moves to its run-up start and back from its overshoot.
+
+    Args:
+        coordinates: (N, 5) coordinate array in axis_order and system units, NaN for axes that are not moved.
+        path_time: PathTime the stops are timed with, defaults to the planner's.
+        planner: MovePlanner giving the tolerance and the fly speed settings, defaults to MovePlanner().
+        min_points: Smallest number of positions of a segment.
+        dwell: Measuring time per position in seconds.
+        origin: Position the schedule starts from.
+
+    Returns:
+        list: FlySegment instances in schedule order, not overlapping.
+    """
+    coordinates = np.asarray(coordinates, dtype=float).reshape(-1, len(axis_order))
+    planner = MovePlanner() if planner is None else planner
+    path_time = planner.path_time() if path_time is None else path_time
+    n = len(coordinates)
+    if n < max(min_points, 2):
+        return []
+    reached = _reached(coordinates, origin)
+    path = np.vstack([np.full(len(axis_order), np.nan) if origin is None else origin, coordinates])
+    step = np.diff(reached, axis=0)
+    # An axis set for the first time moves by an unknown distance
+    moved = (np.abs(step) > planner.tolerance) | (np.isnan(reached[:-1]) & ~np.isnan(reached[1:]))
+    axis = np.argmax(moved, axis=1)
+    direction = np.sign(step[np.arange(n - 1), axis])
+    # Steps continue a run if they move the same single axis in the same direction
+    key = np.where(moved.sum(axis=1) == 1, 2 * axis + (direction > 0), -1)
+    bounds = np.concatenate([[0], np.flatnonzero(np.diff(key)) + 1, [n - 1]])
+
+    segments = []
+    free = 0
+    for first, end in zip(bounds[:-1], bounds[1:]):
+        # Steps first..end - 1 connect rows first..end, a row already ending a segment cannot start the next one
+        start, stop = max(first, free), end + 1
+        if key[first] < 0 or stop - start < min_points:
+            continue
+        i = key[first] // 2
+        name = axis_order[i]
+        positions = reached[start:stop, i]
+        stops = path_time.travel_times(coordinates[start : stop - 1], coordinates[start + 1 : stop]).sum()
+        stops += dwell * (stop - start)
+        speed_adc, *points = _fly_move(path_time, planner, name, positions, dwell)
+        flying = path_time.fly_time(name, abs(positions[-1] - positions[0]), speed_adc)
+        flying += _detour(path, reached, i, start, stop, points, path_time)
+        if flying < stops:
+            segments.append(FlySegment(name, int(start), int(stop)))
+            free = stop
+        else:
+            log.debug(f"Run of {stop - start} {name} positions at {start} is not faster as fly segment")
+    return segments
+
+
+def fly_path_time(coordinates, segments: list, path_time: PathTime, origin=None, dwell: float = 0.0,
+                  planner: MovePlanner = None) -> float:
+    """
+    Total time of a schedule whose segments are flown, including dwell seconds of measuring at every position
+    that is stopped at. The moves into a segment end at its run-up start, the moves after it start from its overshoot
+    (see FiveAxisSystem.fly_scan). Compare with path_total_time plus dwell per position.
+    """
+    coordinates = np.asarray(coordinates, dtype=float).reshape(-1, len(axis_order))
+    planner = MovePlanner() if planner is None else planner
+    reached = _reached(coordinates, origin)
+    # Leg k moves into row k of the schedule, from the origin or nowhere for k = 0
+    path = np.vstack([np.full(len(axis_order), np.nan) if origin is None else origin, coordinates])
+    legs = path_time.travel_times(path[:-1], path[1:])
+    flown = np.zeros(len(legs), dtype=bool)
+    total = 0.0
+    for segment in segments:
+        flown[segment.start + 1 : segment.stop] = True
+        i = axis_order.index(segment.axis)
+        positions = reached[segment.start : segment.stop, i]
+        speed_adc, *points = _fly_move(path_time, planner, segment.axis, positions, dwell)
+        total += path_time.fly_time(segment.axis, abs(positions[-1] - positions[0]), speed_adc)
+        total += _detour(path, reached, i, segment.start, segment.stop, points, path_time)
+    stopped = len(coordinates) - sum(len(segment) for segment in segments)
+    return float(total + legs[~flown].sum() + dwell * stopped)
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import logging
+import os
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class OrderCache:
+    """
+    On-disk cache of optimized schedule orders, keyed by the content of the schedule.
+
+    An entry is the permutation optimize_path found (plus the path time before refinement), stored as
+    <calibration version>-<key>.npz in directory. The key hashes the coordinates, the start position, the travel time
+    model and the optimizer settings, so any change to them is a miss. When the directory grows beyond max_bytes,
+    the least recently used entries are deleted.
+
+    Args:
+        directory (str): Cache directory, created if missing. Defaults to ~/.cache/fas_schedules.
+        max_bytes (int): Size limit of the directory.
+    """
+
+    def __init__(self, directory: str = None, max_bytes: int = 256 * 2**20):
+        if directory is None:
+            directory = os.path.join(os.path.expanduser("~"), ".cache", "fas_schedules")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(coordinates: np.ndarray, origin: np.ndarray, model: dict, settings: dict) -> str:
+        """
+        Hash of the coordinate content, the start position, the travel time model parameters and the settings.
+        """
+        digest = hashlib.sha256()
+        coordinates = np.ascontiguousarray(coordinates, dtype="<f8")
+        digest.update(str(coordinates.shape).encode())
+        # All NaN bit patterns mean the same, hash one canonical NaN
+        digest.update(np.where(np.isnan(coordinates), np.nan, coordinates).tobytes())
+        digest.update(np.asarray(origin, dtype="<f8").tobytes())
+        digest.update(json.dumps(model, sort_keys=True, default=str).encode())
+        digest.update(json.dumps(settings, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def _path(self, key: str, calibration_version: str) -> str:
+        return os.path.join(self.directory, f"{calibration_version}-{key}.npz")
+
+    def get(self, key: str, calibration_version: str, size: int):
+        """
+        Returns (order, before) of a stored entry, None if there is none.
+        """
+        path = self._path(key, calibration_version)
+        try:
+            with np.load(path) as entry:
+                order, before = entry["order"], float(entry["before"])
+        except (OSError, ValueError, KeyError):
+            return None
+        if len(order) != size:
+            log.warning(f"Cached order {path} does not match the schedule length, ignoring it")
+            return None
+        # The modification time is the last use for the LRU eviction
+        os.utime(path)
+        return order, before
+
+    def put(self, key: str, calibration_version: str, order: np.ndarray, before: float = np.nan) -> None:
+        path = self._path(key, calibration_version)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, order=np.asarray(order, dtype=np.int64), before=before)
+        os.replace(tmp, path)
+        self.evict()
+
+    def _entries(self) -> list:
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npz"):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        return entries
+
+    def evict(self) -> None:
+        """
+        Deletes the least recently used entries until the directory is within max_bytes.
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def invalidate(self, calibration_version: str = None) -> int:
+        """
+        Deletes all entries not computed with calibration_version, or every entry if it is None.
+
+        Returns:
+            int: Number of deleted entries.
+        """
+        removed = 0
+        for _, _, name in self._entries():
+            if calibration_version is None or not name.startswith(f"{calibration_version}-"):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
@@ -0,0 +1,162 @@
+"""
+How far a schedule's path is from the shortest possible one: a lower bound on the travel time of any path through
+the positions, and the exact optimum for small schedules. All paths start at a fixed origin and end anywhere, like
+the paths optimize_path constructs.
+"""
+import logging
+import numpy as np
+from .scheduling import PathTime, path_total_time
+from .utils_constants import axis_order
+
+log = logging.getLogger(__name__)
+
+# Largest number of positions optimal_order solves exactly, its time and memory grow with 2**n * n
+max_exact_positions = 18
+# Up to this size the travel time matrix of lower_bound is computed once, larger ones are evaluated row by row
+matrix_bytes = 2**28
+
+
+class _TravelTimes:
+    # Travel times between the origin (node 0) and the positions (nodes 1..N)
+
+    def __init__(self, coordinates: np.ndarray, path_time: PathTime, origin=None):
+        # An all-NaN origin moves no axis, so reaching any position from it costs nothing
+        origin = np.full(len(axis_order), np.nan) if origin is None else np.asarray(origin, dtype=float)
+        self.nodes = np.vstack([origin, coordinates])
+        self.path_time = path_time
+        self.size = len(self.nodes)
+        self.matrix = None
+        if self.size**2 * 8 <= matrix_bytes:
+            self.matrix = path_time.time_matrix(self.nodes, self.nodes)
+
+    def row(self, i: int) -> np.ndarray:
+        if self.matrix is not None:
+            return self.matrix[i]
+        return self.path_time.travel_times(self.nodes[i], self.nodes)
+
+
+def _spanning_tree(times: _TravelTimes, penalty: np.ndarray) -> tuple:
+    # Prim's algorithm on the complete graph with edge costs times + penalty of both ends, O(N^2) time, O(N) memory
+    n = times.size
+    in_tree = np.zeros(n, dtype=bool)
+    best = np.full(n, np.inf)
+    parent = np.zeros(n, dtype=np.intp)
+    best[0] = 0.0
+    total = 0.0
+    for _ in range(n):
+        i = int(np.argmin(best))
+        total += best[i]
+        in_tree[i] = True
+        best[i] = np.inf
+        candidate = times.row(i) + penalty + penalty[i]
+        better = (candidate < best) & ~in_tree
+        best[better] = candidate[better]
+        parent[better] = i
+    degree = np.bincount(parent[1:], minlength=n) + 1
+    degree[0] -= 1
+    return total, degree
+
+
+def lower_bound(coordinates, path_time: PathTime, origin=None, iterations: int = 20, upper_bound: float = None):
+    """
+    Lower bound on the travel time of every path that starts at origin and visits all positions.
+
+    Every such path is a spanning tree of the positions and the origin, so the minimum spanning tree under the
+    PathTime cost bounds it from below. The bound is tightened by Held-Karp subgradient ascent: node penalties
+    push the tree towards a path (degree 2 everywhere but the ends), each iteration costs one more spanning tree.
+    Spanning trees take O(N^2) travel time evaluations.
+
+    Args:
+        coordinates: (N, 5) coordinate array in axis_order and system units.
+        path_time: PathTime instance giving the travel times.
+        origin: Coordinates the path starts from, None for a free start.
+        iterations: Number of subgradient steps, 0 gives the plain spanning tree bound.
+        upper_bound: Travel time of a known path, sets the step size. Defaults to the path in the given order.
+
+    Returns:
+        float: The lower bound in seconds.
+    """
+    coordinates = np.asarray(coordinates, dtype=float).reshape(-1, len(axis_order))
+    if len(coordinates) <= 1:
+        return path_total_time(coordinates, path_time, origin) if len(coordinates) else 0.0
+    if upper_bound is None:
+        upper_bound = path_total_time(coordinates, path_time, origin)
+    times = _TravelTimes(coordinates, path_time, origin)
+    # Target degrees of a path: the origin starts it, every position continues it, the end is a free leaf
+    target = np.full(times.size, 2)
+    target[0] = 1
+    penalty = np.zeros(times.size)
+    best = -np.inf
+    step = 2.0
+    stalled = 0
+    for iteration in range(iterations + 1):
+        tree, degree = _spanning_tree(times, penalty)
+        # Any path has penalty degree sum penalty[0] + 2 * sum(penalty[1:]) - penalty[end]
+        bound = tree - penalty[0] - 2 * penalty[1:].sum() + penalty[1:].min()
+        if bound > best + 1e-9:
+            best = bound
+            stalled = 0
+        else:
+            stalled += 1
+            if stalled >= 3:
+                step /= 2
+                stalled = 0
+        subgradient = degree - target
+        if subgradient[0] == 0 and np.count_nonzero(subgradient[1:]) == 1 and subgradient[1:].min() == -1:
+            log.debug(f"Spanning tree is a path after {iteration} iterations, the bound is the optimum")
+            break
+        norm = float((subgradient**2).sum())
+        if iteration == iterations or norm == 0 or upper_bound <= bound:
+            break
+        penalty += step * (upper_bound - bound) / norm * subgradient
+    return float(max(best, 0.0))
+
+
+def optimal_order(coordinates, path_time: PathTime, origin=None) -> np.ndarray:
+    """
+    Shortest path that starts at origin and visits all positions, by Held-Karp dynamic programming over subsets.
+
+    Args:
+        coordinates: (N, 5) coordinate array with N up to max_exact_positions.
+        path_time: PathTime instance giving the travel times.
+        origin: Coordinates the path starts from, None for a free start.
+
+    Returns:
+        np.ndarray: The optimal visiting order as a permutation of range(N).
+
+    Raises:
+        ValueError: If there are more than max_exact_positions positions.
+    """
+    coordinates = np.asarray(coordinates, dtype=float).reshape(-1, len(axis_order))
+    n = len(coordinates)
+    if n > max_exact_positions:
+        raise ValueError(f"Exact optimization is limited to {max_exact_positions} positions, got {n}")
+    if n <= 1:
+        return np.arange(n)
+    times = _TravelTimes(coordinates, path_time, origin).matrix
+    start, cost = times[0, 1:], times[1:, 1:]
+
+    n_masks = 1 << n
+    masks = np.arange(n_masks)
+    members = ((masks[:, None] >> np.arange(n)) & 1).astype(bool)
+    # shortest[mask, j]: shortest path from the origin through the positions in mask, ending at j
+    shortest = np.full((n_masks, n), np.inf)
+    previous = np.zeros((n_masks, n), dtype=np.int8)
+    shortest[1 << np.arange(n), np.arange(n)] = start
+    size = members.sum(axis=1)
+    for s in range(2, n + 1):
+        layer = masks[size == s]
+        for j in range(n):
+            ending = layer[members[layer, j]]
+            totals = shortest[ending ^ (1 << j)] + cost[:, j]
+            k = np.argmin(totals, axis=1)
+            shortest[ending, j] = totals[np.arange(len(ending)), k]
+            previous[ending, j] = k
+
+    order = np.empty(n, dtype=np.intp)
+    mask = n_masks - 1
+    j = int(np.argmin(shortest[mask]))
+    for i in range(n - 1, -1, -1):
+        order[i] = j
+        mask, j = mask ^ (1 << j), int(previous[mask, j])
+    return order
@@ -0,0 +1,146 @@
+"""
+Generators for common scan patterns. They return (N, 5) coordinate arrays in axis_order and system units, ordered
+for a short traversal so that the schedule needs little or no optimize_path:
+
+    schedule = FASSchedule(raster(x=np.arange(0, 50, 0.5), y=np.arange(0, 50, 0.5), z=20))
+"""
+import logging
+import numpy as np
+from .scheduling import PathTime
+from .utils_constants import axis_order
+
+log = logging.getLogger(__name__)
+
+golden_angle = 180 * (3 - np.sqrt(5))
+
+
+def _step_times(steps: dict, path_time: PathTime) -> dict:
+    # Travel time of a single step of every axis, the axis with the most expensive step is scanned slowest
+    origins = np.full((len(steps), len(axis_order)), np.nan)
+    targets = np.full((len(steps), len(axis_order)), np.nan)
+    for i, (axis, step) in enumerate(steps.items()):
+        j = axis_order.index(axis)
+        origins[i, j], targets[i, j] = 0.0, step
+    return dict(zip(steps, path_time.travel_times(origins, targets)))
+
+
+def raster(x=None, y=None, z=None, rot=None, tilt=None, serpentine: bool = True, order=None,
+           path_time: PathTime = None) -> np.ndarray:
+    """
+    Rectangular grid over every combination of the given axis values, traversed in nested loops.
+
+    The axis whose single step takes longest is the outermost loop, the cheapest one the innermost, so the
+    expensive axes move least often. With serpentine set, every loop reverses direction whenever the loops around
+    it advance (boustrophedon), so consecutive points differ by one step of one axis.
+
+    Args:
+        x, y, z, rot, tilt: Value or 1D array of values per axis, None for axes that are not moved.
+        serpentine: Reverse the direction of inner loops on every pass instead of jumping back to the start.
+        order: Axis names from the outermost to the innermost loop, overriding the automatic choice.
+        path_time: PathTime the step costs are taken from, defaults to PathTime().
+
+    Returns:
+        np.ndarray: (N, 5) coordinates in traversal order.
+    """
+    values = {
+        axis: None if value is None else np.atleast_1d(np.asarray(value, dtype=float))
+        for axis, value in zip(axis_order, [x, y, z, rot, tilt])
+    }
+    scanned = [axis for axis in axis_order if values[axis] is not None and len(values[axis]) > 1]
+    if order is None:
+        steps = {axis: np.abs(np.diff(values[axis])).mean() for axis in scanned}
+        costs = _step_times(steps, PathTime() if path_time is None else path_time) if steps else {}
+        order = sorted(scanned, key=lambda axis: -costs[axis])
+    else:
+        order = [axis.upper() for axis in order]
+        if sorted(order) != sorted(scanned):
+            raise ValueError(f"order {order} must name exactly the scanned axes {scanned}")
+
+    sizes = [len(values[axis]) for axis in order]
+    n = int(np.prod(sizes))
+    coordinates = np.full((n, len(axis_order)), np.nan)
+    for axis in axis_order:
+        if values[axis] is not None and axis not in order:
+            coordinates[:, axis_order.index(axis)] = values[axis][0]
+    # counter[k]: index of the current pass of loop k, counting all passes of the loops around it
+    step = np.arange(n)
+    inner_size = n
+    for axis, size in zip(order, sizes):
+        inner_size //= size
+        counter = step // inner_size
+        index = counter % size
+        if serpentine:
+            reverse = (counter // size) % 2 == 1
+            index = np.where(reverse, size - 1 - index, index)
+        coordinates[:, axis_order.index(axis)] = values[axis][index]
+    return coordinates
+
+
+def angular_sweep(rot, tilt, x=None, y=None, z=None, serpentine: bool = True, path_time: PathTime = None):
+    """
+    Nested rotation x tilt sweep at a fixed position, see raster.
+    """
+    return raster(x=x, y=y, z=z, rot=rot, tilt=tilt, serpentine=serpentine, path_time=path_time)
+
+
+def fibonacci_sphere(n: int, max_tilt: float = 180.0, x=None, y=None, z=None, bands: int = None,
+                     path_time: PathTime = None) -> np.ndarray:
+    """
+    n nearly evenly spread orientations on the sphere (Fibonacci lattice), as rotation and tilt angles.
+
+    The lattice is built on the cap of tilt angles up to max_tilt. Its points are traversed in bands of the slower
+    of the two axes, sorted by it, with the faster axis running up and down within a band, so the slow axis sweeps
+    its range about once. The number of bands giving the shortest path is chosen automatically.
+
+    Args:
+        n: Number of orientations.
+        max_tilt: Largest tilt angle in degrees, 180 covers the full sphere, 90 a hemisphere.
+        x, y, z: Fixed position, None for axes that are not moved.
+        bands: Number of bands, chosen by the path time if None.
+        path_time: PathTime the axis speeds are taken from, defaults to PathTime().
+
+    Returns:
+        np.ndarray: (n, 5) coordinates in traversal order.
+    """
+    i = np.arange(n) + 0.5
+    cos_tilt = 1 - i / n * (1 - np.cos(np.radians(max_tilt)))
+    tilt = np.degrees(np.arccos(cos_tilt))
+    rot = (i * golden_angle) % 360
+
+    path_time = PathTime() if path_time is None else path_time
+    # Scan in bands along the axis that takes longer for its full range
+    steps = {"ROT": np.ptp(rot) if n else 0.0, "TILT": np.ptp(tilt) if n else 0.0}
+    costs = _step_times(steps, path_time)
+    slow, fast = (rot, tilt) if costs["ROT"] >= costs["TILT"] else (tilt, rot)
+    by_slow = np.argsort(slow, kind="stable")
+
+    def banded_order(n_bands):
+        band = np.arange(n) * n_bands // max(n, 1)
+        # Within a band sort by the fast axis, ascending and descending in turns
+        direction = np.where(band % 2 == 0, 1.0, -1.0)
+        return by_slow[np.lexsort((direction * fast[by_slow], band))]
+
+    if bands is None:
+        # Narrow bands keep the slow axis from moving back and forth, wide ones the fast axis from sweeping its
+        # whole range often: keep the band count with the shortest path
+        angles = np.full((n, len(axis_order)), np.nan)
+        angles[:, axis_order.index("ROT")] = rot
+        angles[:, axis_order.index("TILT")] = tilt
+        best = None
+        for n_bands in np.unique(np.geomspace(1, max(n, 1), 16).round().astype(int)):
+            candidate = banded_order(n_bands)
+            path = angles[candidate]
+            total = path_time.travel_times(path[:-1], path[1:]).sum()
+            if best is None or total < best[0]:
+                best = total, candidate
+        order = best[1]
+    else:
+        order = banded_order(bands)
+
+    coordinates = np.full((n, len(axis_order)), np.nan)
+    for axis, value in zip(["X", "Y", "Z"], [x, y, z]):
+        if value is not None:
+            coordinates[:, axis_order.index(axis)] = value
+    coordinates[:, axis_order.index("ROT")] = rot[order]
+    coordinates[:, axis_order.index("TILT")] = tilt[order]
+    return coordinates
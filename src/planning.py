@@ -0,0 +1,178 @@
+from dataclasses import dataclass
+import logging
+import numpy as np
+from .utils_constants import axis_order
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class AxisLimits:
+    """
+    Range of the speed and acceleration ADC settings an axis may be driven with, and the largest position change
+    (system units) that is treated as no move and not sent. A negative tolerance sends every move.
+    """
+
+    max_speed_adc: int = 500
+    max_acceleration_adc: int = 500
+    min_speed_adc: int = 1
+    tolerance: float = 0.0
+
+
+# The range covered by the calibration scans (240311_FAS_calibration/data): speed and acceleration up to 500 for the
+# linear axes, acceleration only up to 100 for rotation and tilt. Rotation keeps the slow speed it was always moved
+# with. Changes below half a controller step (1 um, 0.01 deg) give the same command as the current position.
+default_axis_limits = {
+    "X": AxisLimits(tolerance=0.5e-4),
+    "Y": AxisLimits(tolerance=0.5e-4),
+    "Z": AxisLimits(tolerance=0.5e-4),
+    "ROT": AxisLimits(max_speed_adc=50, max_acceleration_adc=100, tolerance=0.005),
+    "TILT": AxisLimits(max_acceleration_adc=100, tolerance=0.005),
+}
+
+
+class MovePlanner:
+    """
+    Chooses the speed and acceleration settings of every axis move.
+
+    The travel time of a move never increases with acceleration or speed, so the fastest profile always uses the
+    highest allowed acceleration. Moves too short to reach the highest allowed speed are sent with the lowest speed
+    that still is not reached, they take the same time but run gentler. Axes whose target is within the tolerance of
+    their current position are not moved at all.
+
+    Args:
+        limits (dict): AxisLimits per axis name in axis_order, overriding default_axis_limits.
+        calibration_file (str): Calibration of the travel time model (see calibration.load_calibration).
+    """
+
+    def __init__(self, limits: dict = None, calibration_file: str = None):
+        self.limits = dict(default_axis_limits)
+        self.limits.update({axis.upper(): value for axis, value in (limits or {}).items()})
+        self.calibration_file = calibration_file
+        self.speed_adc = np.array([self.limits[axis].max_speed_adc for axis in axis_order])
+        self.acceleration_adc = np.array([self.limits[axis].max_acceleration_adc for axis in axis_order])
+        self.min_speed_adc = np.array([self.limits[axis].min_speed_adc for axis in axis_order])
+        self.tolerance = np.array([self.limits[axis].tolerance for axis in axis_order], dtype=float)
+        self._constants = None
+
+    def path_time(self, concurrent: bool = False, dispatch_overhead: float = 0.0):
+        """
+        PathTime evaluating the profiles this planner sends.
+        """
+        from .scheduling import PathTime
+
+        return PathTime(
+            concurrent=concurrent,
+            dispatch_overhead=dispatch_overhead,
+            calibration_file=self.calibration_file,
+            speed_adc=self.speed_adc,
+            acceleration_adc=self.acceleration_adc,
+            tolerance=self.tolerance,
+        )
+
+    def _speed_constants(self):
+        # (acceleration, s_slope, s_const) per axis in system units at the planned acceleration
+        if self._constants is None:
+            path_time = self.path_time()
+            acceleration, _, _ = path_time.axis_parameters()
+            calibration = path_time.axis_calibration
+            scale = np.array([calibration[axis.lower()]["distance_scale"] for axis in axis_order])
+            s_slope = np.array([calibration[axis.lower()]["s_slope"] for axis in axis_order]) / scale
+            s_const = np.array([calibration[axis.lower()]["s_const"] for axis in axis_order]) / scale
+            self._constants = acceleration, s_slope, s_const
+        return self._constants
+
+    def unchanged(self, origins, targets) -> np.ndarray:
+        """
+        Mask of the axes whose target is within the tolerance of the origin, for coordinate arrays of shape (..., 5)
+        that broadcast against each other. Axes with a NaN origin or target are not unchanged.
+        """
+        distance = np.abs(np.asarray(targets, dtype=float) - np.asarray(origins, dtype=float))
+        return distance <= self.tolerance
+
+    def redundant_rows(self, coordinates, origin=None) -> np.ndarray:
+        """
+        Mask of the rows of a path that do not move any axis beyond the tolerance from where the rows before left it,
+        e.g. duplicate consecutive points. Dropping all of them leaves every remaining move unchanged.
+
+        Args:
+            coordinates: (N, 5) path in axis_order and system units, NaN for axes that are not moved.
+            origin: Position the path starts from, unknown if None.
+
+        Returns:
+            np.ndarray: Boolean mask of length N.
+        """
+        coordinates = np.asarray(coordinates, dtype=float).reshape(-1, len(axis_order))
+        origin = np.full(len(axis_order), np.nan) if origin is None else np.asarray(origin, dtype=float)
+        path = np.vstack([origin, coordinates])
+        columns = np.arange(len(axis_order))
+        # Start by dropping the rows that do not differ from the row before. Dropping a run of rows can move its
+        # later rows beyond the tolerance of the last kept position (slow drifts), so keep the first such row of
+        # every dropped run and repeat until no row is added.
+        kept = np.ones(len(path), dtype=bool)
+        first_pass = True
+        while True:
+            # Position before every row: the last value each axis was set to by a kept row
+            last = np.where(np.isnan(path) | ~kept[:, None], 0, np.arange(len(path))[:, None])
+            np.maximum.accumulate(last, axis=0, out=last)
+            before = path[last[:-1], columns]
+            redundant = np.all(np.isnan(coordinates) | self.unchanged(before, coordinates), axis=1)
+            if first_pass:
+                first_pass = False
+                kept[1:] = ~redundant
+                if kept.all():
+                    return ~kept[1:]
+                continue
+            added = np.flatnonzero(~redundant & ~kept[1:])
+            if not len(added):
+                return ~kept[1:]
+            # Rows of the same dropped run share the count of kept rows before them
+            _, first = np.unique(np.cumsum(kept)[added], return_index=True)
+            kept[added[first] + 1] = True
+
+    def plan(self, origins, targets):
+        """
+        Profiles of the moves from origins to targets, coordinate arrays of shape (..., 5) in axis_order and system
+        units that broadcast against each other.
+
+        Returns:
+            tuple: (speed_adc, acceleration_adc) integer arrays of the broadcast shape, 0 for axes that are not moved.
+        """
+        distance = np.abs(np.asarray(targets, dtype=float) - np.asarray(origins, dtype=float))
+        # Axes within the tolerance are not sent
+        np.copyto(distance, np.nan, where=distance <= self.tolerance)
+        acceleration, s_slope, s_const = self._speed_constants()
+        # Speed that is just reached at half the distance, any higher speed gives the same triangular profile
+        with np.errstate(invalid="ignore"):
+            needed = np.ceil((np.sqrt(distance * acceleration) - s_const) / s_slope)
+        speed = np.clip(np.nan_to_num(needed, nan=0.0), self.min_speed_adc, self.speed_adc).astype(int)
+        moved = ~np.isnan(distance)
+        return np.where(moved, speed, 0), np.where(moved, self.acceleration_adc, 0)
+
+    def fly_profile(self, axis: str, speed: float = None) -> tuple:
+        """
+        (speed_adc, acceleration_adc) of a fly move of axis at a constant speed of at most speed (system units per
+        second), the fastest allowed one if speed is None.
+        """
+        i = axis_order.index(axis.upper())
+        if speed is None or not np.isfinite(speed):
+            return int(self.speed_adc[i]), int(self.acceleration_adc[i])
+        _, s_slope, s_const = self._speed_constants()
+        speed_adc = np.floor((speed - s_const[i]) / s_slope[i])
+        return int(np.clip(speed_adc, self.min_speed_adc[i], self.speed_adc[i])), int(self.acceleration_adc[i])
+
+    def axis_profile(self, axis: str, distance: float = None) -> tuple:
+        """
+        (speed_adc, acceleration_adc) of a single axis move, the fastest allowed one if the distance is unknown and
+        the slowest one if it is within the tolerance (a move sent anyway, e.g. as a probe).
+        """
+        i = axis_order.index(axis.upper())
+        if distance is None:
+            return int(self.speed_adc[i]), int(self.acceleration_adc[i])
+        origin = np.full(len(axis_order), np.nan)
+        target = np.full(len(axis_order), np.nan)
+        origin[i], target[i] = 0.0, distance
+        speed, acceleration = self.plan(origin, target)
+        if speed[i] == 0:
+            return int(self.min_speed_adc[i]), int(self.acceleration_adc[i])
+        return int(speed[i]), int(acceleration[i])
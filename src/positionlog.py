@@ -0,0 +1,170 @@
+import logging
+import os
+import queue
+import threading
+import time
+import numpy as np
+from .utils_constants import axis_order
+
+log = logging.getLogger(__name__)
+
+# One fixed width little-endian record per logged position, NaN for values that are not known
+record_fields = ("time",) + axis_order + ("predicted_duration", "actual_duration")
+record_dtype = np.dtype([(name, "<f8") for name in record_fields])
+
+
+def read_position_log(fname: str, mmap: bool = True) -> np.ndarray:
+    """
+    Reads a binary position log into a structured array with the columns of record_fields, e.g. log["X"].
+    """
+    if mmap:
+        if os.path.getsize(fname) == 0:
+            return np.empty(0, dtype=record_dtype)
+        return np.memmap(fname, dtype=record_dtype, mode="r")
+    return np.fromfile(fname, dtype=record_dtype)
+
+
+class _RotatingFile:
+    # Append-only file that is kept open, rotated to fname.1, fname.2, ... once it exceeds max_bytes
+
+    def __init__(self, fname: str, max_bytes: int = None, backup_count: int = 5, binary: bool = True):
+        self.fname = fname
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.mode = "ab" if binary else "a"
+        self.file = open(fname, self.mode)
+
+    def write(self, data) -> None:
+        if self.max_bytes and self.file.tell() > 0 and self.file.tell() + len(data) > self.max_bytes:
+            self.rotate()
+        self.file.write(data)
+
+    def rotate(self) -> None:
+        self.file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.fname}.{i}"):
+                os.replace(f"{self.fname}.{i}", f"{self.fname}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.fname, f"{self.fname}.1")
+        else:
+            os.remove(self.fname)
+        self.file = open(self.fname, self.mode)
+
+    def flush(self) -> None:
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class PositionLogger:
+    """
+    Logs positions and move durations from a background thread, written in batches instead of one file access per
+    record.
+
+    Records go to a binary file of fixed width float64 records (see record_dtype and read_position_log) and/or a tab
+    separated text file in the format of FiveAxisSystem.log_current_position, extended by the predicted and actual
+    move duration.
+
+    Args:
+        binary_file (str): Binary log file, not written if None.
+        tsv_file (str): Text log file, not written if None.
+        flush_interval (float): Longest time in seconds a record stays queued before it is written.
+        batch_size (int): Records written at once at most.
+        max_bytes (int): Size at which a file is rotated to <file>.1, <file>.2, ..., no rotation if None.
+        backup_count (int): Number of rotated files kept.
+    """
+
+    def __init__(self, binary_file: str = None, tsv_file: str = None, flush_interval: float = 1.0,
+                 batch_size: int = 1024, max_bytes: int = None, backup_count: int = 5):
+        if binary_file is None and tsv_file is None:
+            raise ValueError("PositionLogger needs a binary_file or a tsv_file")
+        if max_bytes is not None:
+            # Rotate at record boundaries only, so every binary file stays readable on its own
+            max_bytes = max(max_bytes - max_bytes % record_dtype.itemsize, record_dtype.itemsize)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._files = []
+        self._binary = self._tsv = None
+        if binary_file is not None:
+            self._binary = _RotatingFile(binary_file, max_bytes, backup_count, binary=True)
+            self._files.append(self._binary)
+        if tsv_file is not None:
+            self._tsv = _RotatingFile(tsv_file, max_bytes, backup_count, binary=False)
+            self._files.append(self._tsv)
+        self.records_written = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="PositionLogger", daemon=True)
+        self._worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def log(self, position, predicted_duration: float = None, actual_duration: float = None,
+            timestamp: float = None) -> None:
+        """
+        Queues a record of a Position (None axes are logged as NaN) and the durations of the move to it.
+        """
+        if self._closed:
+            raise RuntimeError("PositionLogger is closed")
+        values = [time.time() if timestamp is None else timestamp]
+        values += [getattr(position, axis) for axis in axis_order]
+        values += [predicted_duration, actual_duration]
+        self._queue.put(tuple(np.nan if value is None else value for value in values))
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            # Collect records for up to flush_interval after the first one, then write them at once
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            # None is the stop marker queued by close, it comes after all records
+            if batch[-1] is None:
+                batch.pop()
+                stop = True
+            try:
+                if batch:
+                    self._write(batch)
+            except OSError:
+                log.exception(f"Could not write {len(batch)} position records")
+            finally:
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+
+    def _write(self, batch: list) -> None:
+        records = np.array(batch, dtype=float)
+        if self._binary is not None:
+            self._binary.write(records.astype("<f8", copy=False).tobytes())
+            self._binary.flush()
+        if self._tsv is not None:
+            lines = []
+            for record in batch:
+                fields = ["None" if np.isnan(value) else str(value) for value in record]
+                lines.append("\t".join(fields) + "\t\n")
+            self._tsv.write("".join(lines))
+            self._tsv.flush()
+        self.records_written += len(batch)
+
+    def flush(self) -> None:
+        """
+        Blocks until all queued records are written, at most flush_interval after the last one was queued.
+        """
+        self._queue.join()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+        for f in self._files:
+            f.close()
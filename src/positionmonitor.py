@@ -0,0 +1,166 @@
+import logging
+import threading
+import time
+import numpy as np
+from .answerparser import parse_frame
+from .planning import default_axis_limits
+from .utils_constants import axis_order
+
+log = logging.getLogger(__name__)
+
+
+class PositionMonitor:
+    """
+    Polls the controller position from a background thread at a fixed rate and keeps the timestamped samples in a
+    preallocated ring buffer.
+
+    The polls share the controller's connection: inside a session they are queued between the other commands and
+    written while a move still waits for its answer, so the samples follow the motion. Outside of one each poll
+    opens the port like send and waits until a running send is answered. Every sample is stamped with clock()
+    halfway between sending the query and reading its answer.
+
+    The single polling thread is the only writer. latest() reads an immutable snapshot without locking, samples()
+    copies the buffer and drops the entries overwritten while copying.
+
+    Args:
+        controller (SerialController): Controller to poll, e.g. FiveAxisSystem.controller.
+        rate (float): Polls per second, the pacing of the controller may limit it further.
+        capacity (int): Number of samples kept, older ones are overwritten.
+        clock: Time source of the timestamps, time.perf_counter by default like FiveAxisSystem.fly_scan.
+    """
+
+    def __init__(self, controller, rate: float = 20.0, capacity: int = 2**16, clock=time.perf_counter):
+        self.controller = controller
+        self.interval = 1.0 / rate
+        self.capacity = capacity
+        self.clock = clock
+        # Columns: timestamp, then the axes in axis_order and system units. One spare slot is the one being written.
+        self._slots = capacity + 1
+        self.buffer = np.full((self._slots, 1 + len(axis_order)), np.nan)
+        self.count = 0
+        self.failures = 0
+        self._latest = None
+        self._updated = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="PositionMonitor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def poll(self) -> tuple:
+        """
+        Queries the position once and stores the sample.
+
+        Returns:
+            tuple: (timestamp, values) with the five axis values in axis_order and system units, None if the answer
+            could not be parsed.
+        """
+        sent = self.clock()
+        answer = self.controller.send("My-Achse:")
+        timestamp = (sent + self.clock()) / 2
+        frame, found, _ = answer.partition(self.controller.answer_end)
+        try:
+            if not found:
+                raise ValueError(f"Answer {answer!r} is incomplete")
+            values = parse_frame(frame)
+        except ValueError as err:
+            self.failures += 1
+            log.debug(f"Position poll failed: {err}")
+            return None
+        i = self.count
+        self.buffer[i % self._slots, 0] = timestamp
+        self.buffer[i % self._slots, 1:] = values
+        self.count = i + 1
+        # Replacing the reference is atomic, readers never see a half written sample
+        self._latest = (timestamp, values)
+        with self._updated:
+            self._updated.notify_all()
+        return self._latest
+
+    def _run(self) -> None:
+        next_poll = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception:
+                self.failures += 1
+                log.exception("Position poll failed")
+            next_poll = max(next_poll + self.interval, time.monotonic())
+            self._stop.wait(next_poll - time.monotonic())
+
+    def latest(self) -> tuple:
+        """
+        (timestamp, values) of the most recent sample, values in axis_order and system units, None before the first
+        one.
+        """
+        return self._latest
+
+    def samples(self, n: int = None) -> np.ndarray:
+        """
+        Copy of the last n (all kept if None) samples in time order, as an (M, 6) array of timestamp and the axis
+        values in axis_order.
+        """
+        count = self.count
+        first = max(count - self.capacity, 0 if n is None else count - n, 0)
+        indices = np.arange(first, count)
+        samples = self.buffer[indices % self._slots]
+        # The writer may have overwritten the oldest slots while copying, the sample in flight included
+        valid = indices > self.count - self._slots
+        return samples[valid]
+
+    def position_at(self, timestamp: float) -> np.ndarray:
+        """
+        Axis values at a clock() time, linearly interpolated between the kept samples (clamped at both ends).
+        """
+        samples = self.samples()
+        if not len(samples):
+            return np.full(len(axis_order), np.nan)
+        return np.array([np.interp(timestamp, samples[:, 0], samples[:, 1 + i]) for i in range(len(axis_order))])
+
+    def wait_for(self, target, tolerance=None, timeout: float = None) -> bool:
+        """
+        Waits until a sample shows every set axis of the target Position within the tolerance.
+
+        Args:
+            target (Position): Position to wait for, None axes are ignored.
+            tolerance: Per axis tolerance in axis_order and system units, defaults to AxisLimits.tolerance.
+            timeout: Longest wait in seconds, None for no limit.
+
+        Returns:
+            bool: Whether the position was reached before the timeout.
+        """
+        if tolerance is None:
+            tolerance = [default_axis_limits[axis].tolerance for axis in axis_order]
+        tolerance = np.broadcast_to(np.asarray(tolerance, dtype=float), len(axis_order))
+        wanted = np.array([getattr(target, axis) for axis in axis_order], dtype=float)
+        set_axes = ~np.isnan(wanted)
+
+        def reached():
+            latest = self._latest
+            return latest is not None and bool(
+                np.all(np.abs(np.asarray(latest[1])[set_axes] - wanted[set_axes]) <= tolerance[set_axes])
+            )
+
+        with self._updated:
+            return self._updated.wait_for(reached, timeout)
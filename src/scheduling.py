@@ -1,7 +1,22 @@
 from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import json
+import logging
+import os
+import pickle
+import struct
+import time
 import numpy as np
 import functools
 from .FAS import Position
+from .calibration import load_calibration, model_parameters
+from .planning import MovePlanner, default_axis_limits
+from .utils_constants import axis_order, system_default_units, system_to_axis_units
+from .ordercache import OrderCache
+from .spatialindex import GridIndex, bisection_clusters
+
+log = logging.getLogger(__name__)
 
 
 def linear(x, slope, const):
@@ -13,43 +28,71 @@ def linear_step(x, slope, const):
     return linear(x,slope,const)
 
 class PathTime:
-    axis_calibration = {
-        "x": {
-            "a_slope": 0.2904409779122619,
-            "a_const": 1.2077330604928136,
-            "s_slope": 0.21638106368842852,
-            "s_const": 0.0018993869426034257,
-            "t0": 0.8908983496211884,
-        },
-        "y": {
-            "a_slope": 0.23827953982528538,
-            "a_const": 2.0345359162324947,
-            "s_slope": 0.21659195037066725,
-            "s_const": 0.0007889468963793958,
-            "t0": 0.8251032150944726,
-        },
-        "z": {
-            "a_slope": 0.23342700810816303,
-            "a_const": 2.127238368785634,
-            "s_slope": 0.21652565324121187,
-            "s_const": 0.000773052604182803,
-            "t0": 0.8161839563958946,
-        },
-        "tilt": {
-            "a_slope": 17.752623230479188,
-            "a_const": -28.161817079227312,
-            "s_slope": 0.06027239386618709,
-            "s_const": -0.001236066727795777,
-            "t0": 0.8217697818261861,
-        },
-        "rot": {
-            "a_slope": 6.081587120398348,
-            "a_const": -17.82680508910915,
-            "s_slope": 0.020025354843183265,
-            "s_const": -0.00014466021729686357,
-            "t0": 0.8218914594786518,
-        },
-    }
+    # Calibration file the model constants are loaded from, None for the default (see calibration.load_calibration)
+    calibration_file = None
+
+    # ADC settings the travel time model is evaluated with, per axis in axis_order: the fastest profile within the
+    # default limits, which MovePlanner sends
+    speed_adc = tuple(default_axis_limits[axis].max_speed_adc for axis in axis_order)
+    acceleration_adc = tuple(default_axis_limits[axis].max_acceleration_adc for axis in axis_order)
+    # Axis moves within this distance are not sent (see AxisLimits.tolerance) and take no time
+    tolerance = tuple(default_axis_limits[axis].tolerance for axis in axis_order)
+    # Share of the fixed move overhead t0 that passes before the motion starts, the rest is settling after it. The
+    # calibration scans only measure the sum, so the split is an assumption (see FiveAxisSystem.fly_scan).
+    start_delay_share = 0.5
+    # Number of array elements time_matrix evaluates at once
+    block_size = 2**22
+    # Above this many array elements travel_times evaluates axis by axis
+    axis_loop_size = 2000
+
+    def __init__(
+        self,
+        concurrent: bool = False,
+        dispatch_overhead: float = 0.0,
+        calibration_file: str = None,
+        speed_adc=None,
+        acceleration_adc=None,
+        tolerance=None,
+    ):
+        """
+        Args:
+            concurrent: Model moves whose axis commands are all dispatched before waiting (see
+                FiveAxisSystem.simultaneous): a move takes as long as its slowest axis instead of the sum of all axes.
+            dispatch_overhead: Seconds between dispatching consecutive axis commands in concurrent mode, the n-th
+                moved axis starts n * dispatch_overhead later.
+            calibration_file: Calibration written by the calibration pipeline, overrides the class attribute.
+            speed_adc: Speed setting, one for all axes or one per axis in axis_order. Use MovePlanner.path_time to
+                match the settings a planner sends.
+            acceleration_adc: Acceleration setting, one for all axes or one per axis in axis_order.
+            tolerance: Largest distance per axis in system units that is not moved, one for all axes or one per axis.
+        """
+        self.concurrent = concurrent
+        self.dispatch_overhead = dispatch_overhead
+        if calibration_file is not None:
+            self.calibration_file = calibration_file
+        if speed_adc is not None:
+            self.speed_adc = tuple(np.broadcast_to(speed_adc, len(axis_order)).tolist())
+        if acceleration_adc is not None:
+            self.acceleration_adc = tuple(np.broadcast_to(acceleration_adc, len(axis_order)).tolist())
+        if tolerance is not None:
+            self.tolerance = tuple(np.broadcast_to(tolerance, len(axis_order)).tolist())
+        self._calibration = None
+
+    @property
+    def calibration(self) -> dict:
+        # Loaded on first use, load_calibration caches the parsed file for all instances
+        if self._calibration is None:
+            self._calibration = load_calibration(self.calibration_file)
+            log.debug(f"Using travel time calibration {self._calibration['version']}")
+        return self._calibration
+
+    @property
+    def axis_calibration(self) -> dict:
+        return self.calibration["axes"]
+
+    @property
+    def calibration_version(self) -> str:
+        return self.calibration["version"]
 
     @functools.lru_cache(maxsize=1000000)
     def ramp_motion_time(self, distance, max_speed, acceleration):
@@ -85,89 +128,1155 @@ class PathTime:
         max_speed = linear(speed_adc, s_slope, s_const)
         return self.ramp_motion_time(distance, max_speed, acceleration) + t0
 
+    def axis_time(self, axis: str, distance: float, speed_adc, acceleration_adc) -> float:
+        """
+        Time a single move of axis over distance (system units) takes with the given adc settings.
+        """
+        calibration = self.axis_calibration[axis.lower()]
+        return self.model(
+            distance * calibration["distance_scale"],
+            speed_adc,
+            acceleration_adc,
+            *(calibration[key] for key in model_parameters),
+        )
+
+    def axis_parameters(self):
+        """
+        Returns the (acceleration, max_speed, t0) arrays of the motion model in system units, one entry per axis in
+        axis_order.
+        """
+        acceleration = np.empty(len(axis_order))
+        max_speed = np.empty(len(axis_order))
+        t0 = np.empty(len(axis_order))
+        speed_adc = np.broadcast_to(self.speed_adc, len(axis_order))
+        acceleration_adc = np.broadcast_to(self.acceleration_adc, len(axis_order))
+        for i, axis in enumerate(axis_order):
+            calibration = self.axis_calibration[axis.lower()]
+            acceleration[i] = linear_step(
+                acceleration_adc[i], calibration["a_slope"], calibration["a_const"]
+            )
+            max_speed[i] = linear(speed_adc[i], calibration["s_slope"], calibration["s_const"])
+            t0[i] = calibration["t0"]
+            # The constants are fitted in their own distance units, scaling speed and acceleration by the same
+            # factor lets the model take system units
+            acceleration[i] /= calibration["distance_scale"]
+            max_speed[i] /= calibration["distance_scale"]
+        return acceleration, max_speed, t0
+
+    def _axis_motion(self, axis: str, speed_adc=None, acceleration_adc=None) -> tuple:
+        # (acceleration, max_speed, t0) of one axis in system units, at speed_adc and acceleration_adc instead of the
+        # model's settings
+        i = axis_order.index(axis.upper())
+        acceleration, max_speed, t0 = self.axis_parameters()
+        acceleration, speed = acceleration[i], max_speed[i]
+        calibration = self.axis_calibration[axis.lower()]
+        if speed_adc is not None:
+            speed = linear(speed_adc, calibration["s_slope"], calibration["s_const"]) / calibration["distance_scale"]
+        if acceleration_adc is not None:
+            acceleration = linear_step(acceleration_adc, calibration["a_slope"], calibration["a_const"])
+            acceleration /= calibration["distance_scale"]
+        return acceleration, speed, t0[i]
+
+    def start_delay(self, axis: str) -> float:
+        """
+        Estimated seconds between the last argument of a move command and the start of the motion, start_delay_share
+        of the axis' t0.
+        """
+        return self.start_delay_share * self._axis_motion(axis)[2]
+
+    def fly_run_up(self, axis: str, speed_adc=None) -> float:
+        """
+        Distance an axis needs to reach the speed of speed_adc (or to stop from it), in system units.
+        """
+        acceleration, speed, _ = self._axis_motion(axis, speed_adc)
+        return speed * speed / (2 * acceleration)
+
+    def fly_time(self, axis: str, distance, speed_adc=None):
+        """
+        Duration of a fly segment: a single move of axis that crosses distance (system units) at the constant speed
+        of speed_adc, starting and ending one run-up (see fly_run_up) outside of it. Unlike a stop at every position
+        of the segment, it pays the ramps and t0 only once.
+        """
+        acceleration, speed, t0 = self._axis_motion(axis, speed_adc)
+        # Trapezoidal move over distance + 2 run-ups, d / v + v / a
+        return np.asarray(distance, dtype=float) / speed + 2 * speed / acceleration + t0
+
+    @staticmethod
+    def _ramp_profile(distance: float, speed: float, acceleration: float) -> tuple:
+        # (ramp length, top speed, duration) of a move, the top speed is not reached on moves shorter than two ramps
+        ramp = speed * speed / (2 * acceleration)
+        if distance < 2 * ramp:
+            ramp = distance / 2
+            speed = np.sqrt(acceleration * distance)
+        return ramp, speed, distance / speed + speed / acceleration
+
+    def crossing_times(self, axis: str, distance: float, offsets, speed_adc=None) -> np.ndarray:
+        """
+        Seconds after an axis starts a move over distance (system units) at which it passes offsets from its start
+        point, following the trapezoidal (triangular for short moves) speed profile of the model. t0 is not included,
+        the motion starts start_delay after the command.
+        """
+        acceleration, speed, _ = self._axis_motion(axis, speed_adc)
+        offsets = np.clip(np.asarray(offsets, dtype=float), 0.0, distance)
+        ramp, speed, duration = self._ramp_profile(distance, speed, acceleration)
+        times = speed / acceleration + (offsets - ramp) / speed
+        np.copyto(times, np.sqrt(2 * offsets / acceleration), where=offsets < ramp)
+        np.copyto(times, duration - np.sqrt(2 * (distance - offsets) / acceleration), where=offsets > distance - ramp)
+        return times
+
+    def distance_at(self, axis: str, distance: float, elapsed: float, speed_adc=None, acceleration_adc=None) -> float:
+        """
+        Distance (system units) an axis has covered elapsed seconds after starting a move over distance, the inverse
+        of crossing_times.
+        """
+        acceleration, speed, _ = self._axis_motion(axis, speed_adc, acceleration_adc)
+        ramp, speed, duration = self._ramp_profile(distance, speed, acceleration)
+        elapsed = min(max(elapsed, 0.0), duration)
+        ramp_time = speed / acceleration
+        if elapsed < ramp_time:
+            return acceleration * elapsed**2 / 2
+        if elapsed > duration - ramp_time:
+            return distance - acceleration * (duration - elapsed) ** 2 / 2
+        return ramp + (elapsed - ramp_time) * speed
+
+    @staticmethod
+    def ramp_motion_times(distance, max_speed, acceleration, t0):
+        # Array version of model, NaN distances (axis not moved) stay NaN
+        d_ramp = max_speed * max_speed / acceleration
+        # Triangular motion (max speed not reached)
+        time = np.sqrt(distance * (4 / acceleration))
+        # Trapezoidal motion (max speed reached), t_ramp + t_const simplifies to d / v + v / a
+        trapezoidal = distance * (1 / max_speed)
+        trapezoidal += max_speed / acceleration
+        np.copyto(time, trapezoidal, where=distance >= d_ramp)
+        time += t0
+        return time
+
+    def travel_times(self, origins, targets) -> np.ndarray:
+        """
+        Calculates the travel time between coordinate arrays of shape (..., 5), broadcast against each other.
+
+        Args:
+            origins: Coordinates in axis_order and system units, NaN for axes that are not set.
+            targets: Coordinates in axis_order and system units, NaN for axes that are not set.
+
+        Returns:
+            np.ndarray: The summed time of all axis moves for every broadcast pair. Axes moved by no more than the
+            tolerance are not sent and cost nothing.
+        """
+        origins = np.asarray(origins, dtype=float)
+        targets = np.asarray(targets, dtype=float)
+        acceleration, max_speed, t0 = self.axis_parameters()
+        tolerance = np.asarray(self.tolerance, dtype=float)
+        shape = np.broadcast_shapes(origins.shape, targets.shape)
+        if np.prod(shape) < self.axis_loop_size:
+            # Small arrays: evaluating all axes at once has the least call overhead
+            distance = np.abs(targets - origins)
+            np.copyto(distance, np.nan, where=distance <= tolerance)
+            times = self.ramp_motion_times(distance, max_speed, acceleration, t0)
+            if not self.concurrent:
+                return np.nansum(times, axis=-1)
+            moved = ~np.isnan(times)
+            times += (np.cumsum(moved, axis=-1) - 1) * self.dispatch_overhead
+            return np.where(moved, times, 0.0).max(axis=-1)
+        # Large arrays: one pass per axis avoids slow operations along the short last dimension
+        total_time = np.zeros(shape[:-1])
+        moved_axes = np.zeros(shape[:-1])
+        for i in range(len(axis_order)):
+            distance = np.abs(targets[..., i] - origins[..., i])
+            time = self.ramp_motion_times(distance, max_speed[i], acceleration[i], t0[i])
+            # NaN distances compare False as well
+            moved = distance > tolerance[i]
+            if self.concurrent:
+                time += moved_axes * self.dispatch_overhead
+                np.maximum(total_time, time, out=total_time, where=moved)
+                moved_axes += moved
+            else:
+                np.copyto(time, 0.0, where=~moved)
+                total_time += time
+        return total_time
+
+    def time_matrix(self, origins, targets) -> np.ndarray:
+        """
+        Calculates the travel time from each of N origins to each of M targets.
+
+        Args:
+            origins: (N, 5) coordinate array, or a single (5,) coordinate row.
+            targets: (M, 5) coordinate array.
+
+        Returns:
+            np.ndarray: (N, M) travel time matrix, or the (M,) row if a single origin is given.
+        """
+        origins = np.asarray(origins, dtype=float)
+        targets = np.atleast_2d(np.asarray(targets, dtype=float))
+        if origins.ndim == 1:
+            return self.travel_times(origins, targets)
+        matrix = np.empty((len(origins), len(targets)))
+        # Evaluate in blocks of rows to bound the size of the intermediate (rows, M, 5) arrays
+        rows = max(1, self.block_size // max(targets.size, 1))
+        for start in range(0, len(origins), rows):
+            block = origins[start : start + rows]
+            matrix[start : start + rows] = self.travel_times(block[:, None, :], targets[None, :, :])
+        return matrix
+
     def time_to_position(self, initial_position: Position, target_position: Position):
-        total_time = 0
-        for (axis_initial, val_initial), (axis_target, val_target) in zip(
-            initial_position, target_position
-        ):
-            assert axis_initial == axis_target, "Mismatched axes in positions"
-            if val_initial != None and val_target != None:
-                distance = abs(val_target - val_initial)
-                total_time += self.model(
-                    distance, 200, 200, **self.axis_calibration[axis_initial]
+        return float(
+            self.travel_times(
+                positions_to_array([initial_position])[0],
+                positions_to_array([target_position])[0],
+            )
+        )
+
+
+def _fastest(times: np.ndarray, rng=None) -> int:
+    # Index of the smallest time, ties are broken randomly if a generator is given
+    k = int(np.argmin(times))
+    if rng is not None:
+        ties = np.flatnonzero(times <= times[k] + 1e-9)
+        if len(ties) > 1:
+            k = int(rng.choice(ties))
+    return k
+
+
+def path_total_time(coordinates: np.ndarray, path_time: PathTime, origin=None) -> float:
+    """
+    Total travel time of visiting coordinates in the given row order, starting from origin if given.
+    """
+    coordinates = np.asarray(coordinates, dtype=float)
+    if origin is not None:
+        coordinates = np.vstack([origin, coordinates])
+    return float(path_time.travel_times(coordinates[:-1], coordinates[1:]).sum())
+
+
+def array_to_position(row) -> Position:
+    """
+    Converts one coordinate row into a Position, NaN axes become None.
+    """
+    return Position(*(None if np.isnan(value) else float(value) for value in row))
+
+
+def positions_to_array(positions) -> np.ndarray:
+    """
+    Converts Position instances into an (N, 5) coordinate array in axis_order, NaN where an axis is not set.
+    """
+    return np.array(
+        [[getattr(position, axis) for axis in axis_order] for position in positions],
+        dtype=float,
+    ).reshape(-1, len(axis_order))
+
+
+def nearest_neighbour_order(
+    coordinates: np.ndarray, path_time: PathTime, start: int = 0, rng=None, progress: bool = True
+) -> np.ndarray:
+    """
+    Greedy path construction, always moving to the remaining position that is reached fastest.
+
+    Args:
+        coordinates: (N, 5) coordinate array.
+        path_time: PathTime instance used to score the moves.
+        start: Index of the first position of the path.
+        rng: Optional np.random.Generator, breaks ties between equally fast moves randomly.
+        progress: Show a progress bar.
+
+    Returns:
+        np.ndarray: The visiting order as a permutation of range(N).
+    """
+    n = len(coordinates)
+    order = np.empty(n, dtype=np.intp)
+    if n == 0:
+        return order
+    # Remaining positions are kept compacted at the front of pool, removed ones are swapped to the end
+    pool = np.array(coordinates, dtype=float)
+    pool_index = np.arange(n)
+    size = n
+
+    def remove(k):
+        nonlocal size
+        size -= 1
+        pool[[k, size]] = pool[[size, k]]
+        pool_index[[k, size]] = pool_index[[size, k]]
+
+    current = pool[start].copy()
+    order[0] = start
+    remove(start)
+    # Progress bar for visual feedback
+    with tqdm(total=n - 1, desc="Optimizing path", disable=not progress) as pbar:
+        for step in range(1, n):
+            k = _fastest(path_time.time_matrix(current, pool[:size]), rng)
+            order[step] = pool_index[k]
+            current = pool[k].copy()
+            remove(k)
+            pbar.update(1)
+    return order
+
+
+def indexed_nearest_neighbour_order(
+    coordinates: np.ndarray,
+    path_time: PathTime,
+    start: int = 0,
+    candidates: int = 8,
+    rng=None,
+    progress: bool = True,
+) -> np.ndarray:
+    """
+    Greedy path construction like nearest_neighbour_order, but only the closest candidates of a GridIndex
+    are scored with the exact model, which keeps the construction near-linear in the number of positions.
+
+    The index scales every axis by its calibrated max speed, so index distances approximate travel times.
+
+    Args:
+        coordinates: (N, 5) coordinate array.
+        path_time: PathTime instance used to score the candidate moves.
+        start: Index of the first position of the path.
+        candidates: Number of index neighbours scored per step.
+        rng: Optional np.random.Generator, breaks ties between equally fast moves randomly.
+        progress: Show a progress bar.
+
+    Returns:
+        np.ndarray: The visiting order as a permutation of range(N).
+    """
+    coordinates = np.asarray(coordinates, dtype=float)
+    n = len(coordinates)
+    order = np.empty(n, dtype=np.intp)
+    if n == 0:
+        return order
+    _, max_speed, _ = path_time.axis_parameters()
+    index = GridIndex(coordinates, scale=max_speed)
+    current = start
+    order[0] = start
+    index.remove(start)
+    # Progress bar for visual feedback
+    with tqdm(total=n - 1, desc="Optimizing path", disable=not progress) as pbar:
+        for step in range(1, n):
+            nearest = index.query(coordinates[current], candidates)
+            current = nearest[_fastest(path_time.time_matrix(coordinates[current], coordinates[nearest]), rng)]
+            order[step] = current
+            index.remove(current)
+            pbar.update(1)
+    return order
+
+
+def refine_order(
+    coordinates: np.ndarray,
+    order: np.ndarray,
+    path_time: PathTime,
+    time_budget: float = None,
+    max_iterations: int = None,
+    max_segment_length: int = 3,
+) -> np.ndarray:
+    """
+    Local search on an open path with 2-opt (segment reversal) and Or-opt (moving a short segment) moves.
+
+    The first position of the path is kept fixed. Moves are scored with path_time, whose cost is symmetric,
+    and applied as soon as they shorten the path.
+
+    Args:
+        coordinates: (N, 5) coordinate array.
+        order: Initial visiting order as a permutation of range(N).
+        path_time: PathTime instance used to score the moves.
+        time_budget: Wall-clock budget in seconds, None for no limit.
+        max_iterations: Maximum number of passes over the path, None for no limit.
+        max_segment_length: Longest segment considered by Or-opt moves.
+
+    Returns:
+        np.ndarray: The refined visiting order.
+    """
+    order = np.array(order, dtype=np.intp)
+    n = len(order)
+    if n < 3:
+        return order
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+    path = np.asarray(coordinates, dtype=float)[order]
+    edges = path_time.travel_times(path[:-1], path[1:])
+    eps = 1e-9
+
+    def out_of_time():
+        return deadline is not None and time.monotonic() > deadline
+
+    def apply(new_order):
+        nonlocal order, path, edges
+        order = order[new_order]
+        path = path[new_order]
+        edges = path_time.travel_times(path[:-1], path[1:])
+
+    iteration = 0
+    improved = True
+    while improved and (max_iterations is None or iteration < max_iterations):
+        improved = False
+        iteration += 1
+        for i in range(1, n - 1):
+            if out_of_time():
+                log.debug("Refinement stopped after reaching the time budget")
+                return order
+
+            # 2-opt: reverse path[i:j + 1] for j > i
+            delta = path_time.time_matrix(path[i - 1], path[i + 1 :]) - edges[i - 1]
+            delta[:-1] += path_time.time_matrix(path[i], path[i + 2 :]) - edges[i + 1 :]
+            j = int(np.argmin(delta))
+            if delta[j] < -eps:
+                j += i + 1
+                new_order = np.arange(n)
+                new_order[i : j + 1] = new_order[i : j + 1][::-1]
+                apply(new_order)
+                improved = True
+                continue
+
+            # Or-opt: move path[i:i + length] between path[j] and path[j + 1], optionally reversed
+            for length in range(1, min(max_segment_length, n - i) + 1):
+                last = i + length - 1
+                gain = edges[i - 1]
+                if last < n - 1:
+                    gain += edges[last] - path_time.travel_times(path[i - 1], path[last + 1])
+                to_first = path_time.time_matrix(path[i], path)
+                to_last = path_time.time_matrix(path[last], path)
+                forward = to_first.copy()
+                forward[:-1] += to_last[1:] - edges
+                backward = to_last.copy()
+                backward[:-1] += to_first[1:] - edges
+                forward[i - 1 : last + 1] = np.inf
+                backward[i - 1 : last + 1] = np.inf
+                reverse = bool(backward.min() < forward.min())
+                insertion = backward if reverse else forward
+                j = int(np.argmin(insertion))
+                if insertion[j] - gain < -eps:
+                    segment = np.arange(i, last + 1)
+                    if reverse:
+                        segment = segment[::-1]
+                    rest = np.concatenate([np.arange(i), np.arange(last + 1, n)])
+                    position = j + 1 if j < i else j + 1 - length
+                    apply(np.concatenate([rest[:position], segment, rest[position:]]))
+                    improved = True
+                    break
+        log.debug(f"Refinement pass {iteration} done, path time {edges.sum()} s")
+    return order
+
+
+# Coordinates shared read-only with the multi-start worker processes
+_shared_coordinates = {}
+
+
+def _attach_shared_coordinates(name: str, shape: tuple) -> None:
+    memory = shared_memory.SharedMemory(name=name)
+    coordinates = np.ndarray(shape, dtype=float, buffer=memory.buf)
+    coordinates.flags.writeable = False
+    _shared_coordinates["memory"] = memory
+    _shared_coordinates["coordinates"] = coordinates
+
+
+def _multi_start_worker(start, seed, path_time, origin, candidates, refine, time_budget, max_iterations):
+    coordinates = _shared_coordinates["coordinates"]
+    rng = np.random.default_rng(seed)
+    if candidates:
+        order = indexed_nearest_neighbour_order(
+            coordinates, path_time, start, candidates, rng=rng, progress=False
+        )
+    else:
+        order = nearest_neighbour_order(coordinates, path_time, start, rng=rng, progress=False)
+    greedy_time = path_total_time(coordinates[order], path_time, origin)
+    if refine:
+        order = refine_order(coordinates, order, path_time, time_budget, max_iterations)
+    return greedy_time, path_total_time(coordinates[order], path_time, origin), order
+
+
+def multi_start_order(
+    coordinates: np.ndarray,
+    path_time: PathTime,
+    origin=None,
+    starts: int = None,
+    workers: int = None,
+    seed: int = None,
+    candidates: int = 0,
+    refine: bool = False,
+    time_budget: float = None,
+    max_iterations: int = None,
+):
+    """
+    Runs independent greedy constructions (and refinements) from different start positions in a process pool
+    and keeps the fastest path.
+
+    The coordinates are placed in shared memory that every worker maps read-only. The first run starts at
+    index 0, the others at seeded random positions with randomized tie-breaking, so the result only depends
+    on seed and not on the number of workers.
+
+    Args:
+        coordinates: (N, 5) coordinate array.
+        path_time: PathTime instance used to score the moves.
+        origin: Coordinates the path starts from, included in the compared path times.
+        starts: Number of constructions, defaults to the number of workers.
+        workers: Number of worker processes, defaults to os.cpu_count().
+        seed: Seed for the start positions and tie-breaking.
+        candidates: Spatial index candidates per greedy step, 0 scores all remaining positions.
+        refine: Refine each path with refine_order.
+        time_budget: Wall-clock budget in seconds for each refinement.
+        max_iterations: Maximum number of passes of each refinement.
+
+    Returns:
+        tuple: (greedy path time, final path time, order) of the fastest path.
+    """
+    coordinates = np.ascontiguousarray(coordinates, dtype=float)
+    n = len(coordinates)
+    workers = workers or os.cpu_count() or 1
+    starts = starts or workers
+    seeds = np.random.SeedSequence(seed).spawn(starts + 1)
+    # Random start positions without repetition while possible, the first run keeps index 0
+    start_indices = np.random.default_rng(seeds[0]).permutation(n)
+    start_indices = np.concatenate([[0], start_indices[start_indices != 0]])
+    start_indices = start_indices[np.arange(starts) % n]
+
+    memory = shared_memory.SharedMemory(create=True, size=max(coordinates.nbytes, 1))
+    try:
+        np.ndarray(coordinates.shape, dtype=float, buffer=memory.buf)[:] = coordinates
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_attach_shared_coordinates,
+            initargs=(memory.name, coordinates.shape),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _multi_start_worker,
+                    int(start),
+                    seeds[i + 1],
+                    path_time,
+                    origin,
+                    candidates,
+                    refine,
+                    time_budget,
+                    max_iterations,
                 )
-        return total_time
+                for i, start in enumerate(start_indices)
+            ]
+            results = []
+            for future in tqdm(futures, desc="Optimizing path (multi-start)"):
+                results.append(future.result())
+    finally:
+        memory.close()
+        memory.unlink()
+
+    for i, (greedy_time, total_time, _) in enumerate(results):
+        log.debug(f"Start {i} at index {start_indices[i]}: {greedy_time / 60:.1f} min -> {total_time / 60:.1f} min")
+    # min keeps the first of equally fast paths, so the choice does not depend on completion order
+    return min(results, key=lambda result: result[1])
+
+
+def _cluster_tour(coordinates, indices, path_time, candidates, refine, time_budget, max_iterations):
+    # Greedy (and refined) path through one cluster, as indices into coordinates
+    points = coordinates[indices]
+    if candidates and len(points) > candidates:
+        order = indexed_nearest_neighbour_order(points, path_time, candidates=candidates, progress=False)
+    else:
+        order = nearest_neighbour_order(points, path_time, progress=False)
+    refined = refine_order(points, order, path_time, time_budget, max_iterations) if refine else order
+    return indices[order], indices[refined]
+
+
+def _cluster_worker(indices, path_time, candidates, refine, time_budget, max_iterations):
+    coordinates = _shared_coordinates["coordinates"]
+    return _cluster_tour(coordinates, indices, path_time, candidates, refine, time_budget, max_iterations)
+
+
+def stitch_tours(coordinates: np.ndarray, tours: list, path_time: PathTime, origin=None) -> np.ndarray:
+    """
+    Joins tours into one path, visiting them in the given order.
+
+    Every tour is treated as a cycle and entered at the position where the move from the end of the path so far,
+    minus the cycle edge that is cut to open it there, is cheapest. The tour is walked in the direction that leaves
+    that edge out.
+
+    Args:
+        coordinates: (N, 5) coordinate array.
+        tours: Index arrays into coordinates, one per tour.
+        path_time: PathTime instance used to score the joins.
+        origin: Coordinates the path starts from, if None the first tour is opened at its most expensive edge.
+
+    Returns:
+        np.ndarray: The visiting order of all positions of the tours.
+    """
+    pieces = []
+    current = None if origin is None else np.asarray(origin, dtype=float)
+    for tour in tours:
+        points = coordinates[tour]
+        # Cycle edge k runs from position k to position k + 1
+        cycle = path_time.travel_times(points, np.roll(points, -1, axis=0))
+        enter = np.zeros(len(tour)) if current is None else path_time.travel_times(current, points)
+        forward = enter - np.roll(cycle, 1)
+        backward = enter - cycle
+        i = int(np.argmin(forward))
+        j = int(np.argmin(backward))
+        if forward[i] <= backward[j]:
+            pieces.append(np.roll(tour, -i))
+        else:
+            pieces.append(np.roll(tour[::-1], j + 1 - len(tour)))
+        current = coordinates[pieces[-1][-1]]
+    return np.concatenate(pieces) if pieces else np.empty(0, dtype=np.intp)
+
+
+def cluster_order(
+    coordinates: np.ndarray,
+    path_time: PathTime,
+    origin=None,
+    cluster_size: int = 5000,
+    workers: int = None,
+    candidates: int = 0,
+    refine: bool = False,
+    time_budget: float = None,
+    max_iterations: int = None,
+):
+    """
+    Decompose-and-stitch path construction for very large schedules.
+
+    The positions are split into clusters of at most cluster_size positions by recursive bisection of the
+    coordinates scaled by the axis speeds (see bisection_clusters). The path through every cluster is constructed
+    (and refined) independently in a process pool sharing the coordinates like multi_start_order. The clusters are
+    then ordered greedily by their centres starting at origin, and their paths joined at the cheapest boundary
+    edges (see stitch_tours). Memory and run time grow linearly with the number of positions for a fixed
+    cluster_size.
+
+    Args:
+        coordinates: (N, 5) coordinate array.
+        path_time: PathTime instance used to score the moves.
+        origin: Coordinates the path starts from.
+        cluster_size: Largest number of positions per cluster.
+        workers: Number of worker processes, defaults to os.cpu_count(), 1 runs in this process.
+        candidates: Spatial index candidates per greedy step, 0 scores all remaining positions of a cluster.
+        refine: Refine the path of every cluster with refine_order.
+        time_budget: Wall-clock budget in seconds for each cluster's refinement.
+        max_iterations: Maximum number of passes of each cluster's refinement.
+
+    Returns:
+        tuple: (greedy path time, final path time, order).
+    """
+    coordinates = np.ascontiguousarray(coordinates, dtype=float)
+    workers = workers or os.cpu_count() or 1
+    _, max_speed, _ = path_time.axis_parameters()
+    clusters = bisection_clusters(coordinates, cluster_size, scale=max_speed)
+    log.debug(f"Split {len(coordinates)} positions into {len(clusters)} clusters")
+
+    settings = (path_time, candidates, refine, time_budget, max_iterations)
+    if workers == 1:
+        results = [
+            _cluster_tour(coordinates, indices, *settings)
+            for indices in tqdm(clusters, desc="Optimizing path (clusters)")
+        ]
+    else:
+        memory = shared_memory.SharedMemory(create=True, size=max(coordinates.nbytes, 1))
+        try:
+            np.ndarray(coordinates.shape, dtype=float, buffer=memory.buf)[:] = coordinates
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_attach_shared_coordinates,
+                initargs=(memory.name, coordinates.shape),
+            ) as executor:
+                futures = [executor.submit(_cluster_worker, indices, *settings) for indices in clusters]
+                results = [future.result() for future in tqdm(futures, desc="Optimizing path (clusters)")]
+        finally:
+            memory.close()
+            memory.unlink()
+
+    # Visit the clusters in greedy order of their centres, beginning with the one closest to origin
+    centres = np.full((len(clusters), len(axis_order)), np.nan)
+    for k, indices in enumerate(clusters):
+        present = ~np.isnan(coordinates[indices]).all(axis=0)
+        centres[k, present] = np.nanmean(coordinates[indices][:, present], axis=0)
+    if origin is None:
+        cluster_sequence = nearest_neighbour_order(centres, path_time, progress=False)
+    else:
+        cluster_sequence = nearest_neighbour_order(np.vstack([origin, centres]), path_time, progress=False)[1:] - 1
+
+    greedy = stitch_tours(coordinates, [results[k][0] for k in cluster_sequence], path_time, origin)
+    greedy_time = path_total_time(coordinates[greedy], path_time, origin)
+    if not refine:
+        return greedy_time, greedy_time, greedy
+    order = stitch_tours(coordinates, [results[k][1] for k in cluster_sequence], path_time, origin)
+    return greedy_time, path_total_time(coordinates[order], path_time, origin), order
+
+
+# Binary schedule file: magic, format version, metadata length, offset of the coordinate block
+schedule_magic = b"FASSCHED"
+schedule_format_version = 1
+schedule_header = struct.Struct("<8sHIQ")
+
+
+class _LegacyScheduleUnpickler(pickle.Unpickler):
+    # Pickled schedules only contain Positions or numpy arrays, refuse to construct anything else
+    allowed = {
+        ("numpy", "ndarray"),
+        ("numpy", "dtype"),
+        ("numpy.core.multiarray", "_reconstruct"),
+        ("numpy._core.multiarray", "_reconstruct"),
+    }
+
+    def find_class(self, module, name):
+        if name == "Position" and module.split(".")[-1] == "FAS":
+            return Position
+        if (module, name) in self.allowed:
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f"Refusing to load {module}.{name} from a schedule file")
 
 
 class FASSchedule:
-    schedule = []
+    """
+    Ordered list of positions to move to, stored column-wise as a float64 (N, 5) array in axis_order and
+    system units, with NaN for axes that are not moved.
+
+    Indexing with an integer or iterating returns Position rows, slicing returns a schedule that shares the
+    underlying array without copying.
+
+    Args:
+        coordinates (np.ndarray): Optional (N, 5) array of initial positions.
+        path_time (PathTime): Travel time model used for optimizing and timing the schedule, e.g.
+            FiveAxisSystem.path_time to match how the moves are executed. Defaults to PathTime().
+    """
+
+    # Above this many positions the greedy search only scores spatial index candidates
+    index_threshold = 5000
+    index_candidates = 8
+    # Position the rig starts from, the first move of the schedule is timed from here
+    initial_position = Position(10, 10, 10, 0, 0)
+    # OrderCache optimize_path looks orders up in, e.g. FASSchedule.order_cache = OrderCache()
+    order_cache = None
+
+    def __init__(self, coordinates=None, path_time: PathTime = None):
+        self._coordinates = np.empty((0, len(axis_order)))
+        self._size = 0
+        # Travel time of the move into every row, kept up to date by insert_positions and remove_positions
+        self._legs = None
+        self.path_time = PathTime() if path_time is None else path_time
+        if coordinates is not None:
+            self.append_positions(coordinates)
+
+    @property
+    def coordinates(self) -> np.ndarray:
+        """
+        (N, 5) view of the scheduled coordinates.
+        """
+        return self._coordinates[: self._size]
+
+    def _reserve(self, n: int) -> None:
+        # Grow the buffer geometrically so repeated appends stay amortized O(1)
+        if self._size + n > len(self._coordinates):
+            capacity = max(self._size + n, 2 * len(self._coordinates), 16)
+            buffer = np.empty((capacity, len(axis_order)))
+            buffer[: self._size] = self.coordinates
+            self._coordinates = buffer
+
+    def _apply_order(self, order) -> None:
+        self._coordinates = self.coordinates[order]
+        self._size = len(self._coordinates)
+        self._legs = None
 
     def append_programmed_position(
         self, x=None, y=None, z=None, rot=None, tilt=None
     ) -> None:
-        moves = {
-            axis: value
-            for axis, value in locals().items()
-            if axis != "self" and value is not None
-        }
-        self.schedule.append(Position(**moves))
+        self._reserve(1)
+        # None becomes NaN, i.e. axis not moved
+        self._coordinates[self._size] = np.array([x, y, z, rot, tilt], dtype=float)
+        self._size += 1
+
+    def append_positions(self, coordinates) -> None:
+        """
+        Appends many positions at once.
+
+        Args:
+            coordinates: (M, 5) array in axis_order and system units (NaN for axes not moved),
+                or an iterable of Position instances.
+        """
+        if not isinstance(coordinates, np.ndarray):
+            coordinates = list(coordinates)
+            if coordinates and isinstance(coordinates[0], Position):
+                coordinates = positions_to_array(coordinates)
+        coordinates = np.asarray(coordinates, dtype=float).reshape(-1, len(axis_order))
+        self._reserve(len(coordinates))
+        self._coordinates[self._size : self._size + len(coordinates)] = coordinates
+        self._size += len(coordinates)
+
+    def to_axis_units(self) -> np.ndarray:
+        """
+        Returns the (N, 5) coordinates converted to the controller's axis units.
+        """
+        return np.stack(
+            [system_to_axis_units(self.coordinates[:, i], axis) for i, axis in enumerate(axis_order)], axis=1
+        )
 
     def calculate_total_path_time(self):
-        initial_position = Position(10, 10, 10, 0, 0)
-        Ptime = PathTime()
-        total_time = 0
-        for position in self.schedule:
-            total_time += Ptime.time_to_position(initial_position, position)
-            initial_position = position
-        return total_time
+        return path_total_time(
+            self.coordinates, self.path_time, positions_to_array([self.initial_position])[0]
+        )
+
+    def move_profiles(self, planner: MovePlanner = None):
+        """
+        Speed and acceleration settings the planner sends for every scheduled move, starting at initial_position.
+
+        Returns:
+            tuple: (speed_adc, acceleration_adc) (N, 5) integer arrays in axis_order, 0 for axes that are not moved.
+        """
+        planner = MovePlanner() if planner is None else planner
+        path = np.vstack([positions_to_array([self.initial_position]), self.coordinates])
+        # Axes that are not moved stay where they were, carry their last position forward
+        last = np.where(np.isnan(path), 0, np.arange(len(path))[:, None])
+        np.maximum.accumulate(last, axis=0, out=last)
+        origins = path[last[:-1], np.arange(len(axis_order))]
+        return planner.plan(origins, self.coordinates)
+
+    def merge_duplicates(self, planner: MovePlanner = None) -> int:
+        """
+        Removes the positions that would not move any axis beyond the planner tolerance (see AxisLimits.tolerance),
+        e.g. consecutive duplicates, starting at initial_position. The moves into the remaining positions stay the
+        same.
+
+        Returns:
+            int: Number of removed positions.
+        """
+        planner = MovePlanner() if planner is None else planner
+        redundant = planner.redundant_rows(self.coordinates, positions_to_array([self.initial_position])[0])
+        if redundant.any():
+            self.remove_positions(np.flatnonzero(redundant))
+            log.info(f"Merged {int(redundant.sum())} positions that do not move any axis")
+        return int(redundant.sum())
+
+    def fly_segments(self, min_points: int = 5, dwell: float = 0.0, planner: MovePlanner = None) -> list:
+        """
+        Runs of positions along a single axis that take less time as fly segments, see flyscan.find_fly_segments.
+        """
+        from .flyscan import find_fly_segments
+
+        return find_fly_segments(
+            self.coordinates,
+            self.path_time,
+            planner,
+            min_points=min_points,
+            dwell=dwell,
+            origin=positions_to_array([self.initial_position])[0],
+        )
 
     def write_schedule_to_file(self, fname: str):
-        import pickle
+        """
+        Writes the schedule in the binary schedule format: a header with the format version and the unit metadata
+        of system_default_units, followed by the contiguous little-endian float64 (N, 5) coordinate array.
+        """
+        metadata = json.dumps(
+            {"axes": list(axis_order), "units": system_default_units, "dtype": "<f8", "rows": len(self)}
+        ).encode()
+        # Align the coordinate block so it can be memory-mapped efficiently
+        data_offset = -(-(schedule_header.size + len(metadata)) // 64) * 64
+        # Written to a temporary file first, the coordinates may be memory-mapped from fname itself
+        mapped = self._coordinates
+        if (
+            isinstance(mapped, np.memmap) and mapped.filename is not None and os.path.exists(fname)
+            and os.path.samefile(mapped.filename, fname)
+        ):
+            # Windows cannot replace a file that is still mapped, keep the coordinates in memory and drop the mapping
+            self._coordinates = np.array(mapped)
+        del mapped
+        tmp = fname + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(schedule_header.pack(schedule_magic, schedule_format_version, len(metadata), data_offset))
+            f.write(metadata)
+            f.write(b"\0" * (data_offset - schedule_header.size - len(metadata)))
+            np.ascontiguousarray(self.coordinates, dtype="<f8").tofile(f)
+        os.replace(tmp, fname)
 
-        with open(fname, "wb") as f:
-            pickle.dump(self.schedule, f)
+    def load_schedule_from_file(self, fname: str, mmap: bool = True):
+        """
+        Loads a schedule written by write_schedule_to_file, replacing the current positions.
 
-    def load_schedule_from_file(self, fname: str):
-        import pickle
+        The coordinates are memory-mapped read-only by default, so opening is instant and iterating reads from disk
+        as needed; the schedule is copied into memory once it is modified. Files written in other units are
+        converted to system_default_units on load. Pickled schedules of older versions are still read.
 
+        Args:
+            fname: Path of the schedule file.
+            mmap: Memory-map the coordinates instead of reading them into memory.
+        """
+        self._legs = None
         with open(fname, "rb") as f:
-            self.schedule = pickle.load(f)
+            header = f.read(schedule_header.size)
+            if len(header) < schedule_header.size or not header.startswith(schedule_magic):
+                log.warning(f"{fname} is not a binary schedule file, loading it as legacy pickle")
+                f.seek(0)
+                self._coordinates = np.empty((0, len(axis_order)))
+                self._size = 0
+                self.append_positions(_LegacyScheduleUnpickler(f).load())
+                return
+            _, version, metadata_length, data_offset = schedule_header.unpack(header)
+            if version > schedule_format_version:
+                raise ValueError(f"Schedule file version {version} is newer than the supported version {schedule_format_version}")
+            metadata = json.loads(f.read(metadata_length))
 
-    def optimize_path(self):
-        if not self.schedule:
+        shape = (metadata["rows"], len(metadata["axes"]))
+        if not metadata["rows"]:
+            coordinates = np.empty(shape)
+        elif mmap:
+            coordinates = np.memmap(fname, dtype=metadata["dtype"], mode="r", offset=data_offset, shape=shape)
+        else:
+            coordinates = np.fromfile(fname, dtype=metadata["dtype"], count=shape[0] * shape[1], offset=data_offset)
+            coordinates = coordinates.reshape(shape)
+        columns = [metadata["axes"].index(axis) for axis in axis_order]
+        if columns != list(range(len(axis_order))):
+            coordinates = coordinates[:, columns]
+        factors = np.array([system_default_units[axis] / metadata["units"][axis] for axis in axis_order])
+        if not np.all(factors == 1):
+            log.info(f"Converting schedule from units {metadata['units']} to {system_default_units}")
+            coordinates = coordinates * factors
+        self._coordinates = coordinates
+        self._size = len(coordinates)
+
+    def optimize_path(
+        self,
+        refine: bool = False,
+        time_budget: float = None,
+        max_iterations: int = None,
+        candidates: int = None,
+        workers: int = 1,
+        starts: int = None,
+        seed: int = None,
+        cache: OrderCache = None,
+        cluster_size: int = None,
+    ):
+        """
+        Orders the schedule greedily so the next move is always the fastest one.
+
+        With more than one worker or start, several constructions run in a process pool (see multi_start_order)
+        and the fastest path is kept. Schedules longer than cluster_size are instead split into clusters whose paths
+        are constructed in parallel and joined (see cluster_order). Call it under `if __name__ == "__main__":` on
+        platforms that spawn processes.
+
+        Args:
+            refine: Run refine_path on the greedy path afterwards.
+            time_budget: Wall-clock budget in seconds for the refinement.
+            max_iterations: Maximum number of refinement passes.
+            candidates: Number of spatial index neighbours scored per step, 0 scores all remaining positions.
+                Defaults to index_candidates for schedules longer than index_threshold, otherwise 0.
+            workers: Number of worker processes for multi-start or clustered optimization, None for os.cpu_count().
+            starts: Number of independent constructions, defaults to the number of workers.
+            seed: Seed for the multi-start start positions and tie-breaking.
+            cache: OrderCache to look the order up in before optimizing and to store it in afterwards, defaults to
+                the order_cache class attribute.
+            cluster_size: Largest number of positions per cluster, None optimizes the schedule as a whole.
+
+        Returns:
+            The (before, after) path times of the refinement if refine is set, otherwise None.
+        """
+        if not len(self):
             return  # Early return if there are no positions
 
-        path_time = (
-            PathTime()
-        )  # Instantiate the class that calculates time between positions
-        remaining = set(range(len(self.schedule)))
-        current_pos = remaining.pop()  # Start from the first position
-        optimized_path = [self.schedule[current_pos]]
-
-        # Progress bar for visual feedback
-        with tqdm(total=len(self.schedule) - 1, desc="Optimizing path") as pbar:
-            while remaining:
-                next_pos, min_time = min(
-                    (
-                        (
-                            pos,
-                            path_time.time_to_position(
-                                self.schedule[current_pos], self.schedule[pos]
-                            ),
-                        )
-                        for pos in remaining
-                    ),
-                    key=lambda item: item[1],
-                )
-                optimized_path.append(self.schedule[next_pos])
-                current_pos = next_pos
-                remaining.remove(next_pos)
-                pbar.update(1)
+        if candidates is None:
+            candidates = self.index_candidates if len(self) > self.index_threshold else 0
+        coordinates = self.coordinates
+        origin = positions_to_array([self.initial_position])[0]
+        clustered = cluster_size is not None and len(self) > cluster_size
+        multi_start = not clustered and (workers != 1 or (starts or 1) > 1)
+        cache = self.order_cache if cache is None else cache
+        if cache is not None:
+            key = cache.key(
+                coordinates,
+                origin,
+                {
+                    "model": type(self.path_time).__name__,
+                    "concurrent": self.path_time.concurrent,
+                    "dispatch_overhead": self.path_time.dispatch_overhead,
+                    "speed_adc": self.path_time.speed_adc,
+                    "acceleration_adc": self.path_time.acceleration_adc,
+                    "tolerance": self.path_time.tolerance,
+                },
+                {
+                    "refine": refine,
+                    "time_budget": time_budget,
+                    "max_iterations": max_iterations,
+                    "candidates": candidates,
+                    "multi_start": multi_start,
+                    "starts": starts or (os.cpu_count() if workers is None else workers),
+                    "seed": seed,
+                    "cluster_size": cluster_size if clustered else None,
+                },
+            )
+            hit = cache.get(key, self.path_time.calibration_version, len(self))
+            if hit is not None:
+                log.info("Using cached path order")
+                order, before = hit
+                self._apply_order(order)
+                if refine:
+                    return before, self.calculate_total_path_time()
+                return
 
-        self.schedule = optimized_path
+        before = after = None
+        if clustered:
+            before, after, order = cluster_order(
+                coordinates,
+                self.path_time,
+                origin=origin,
+                cluster_size=cluster_size,
+                workers=workers,
+                candidates=candidates,
+                refine=refine,
+                time_budget=time_budget,
+                max_iterations=max_iterations,
+            )
+        elif multi_start:
+            before, after, order = multi_start_order(
+                coordinates,
+                self.path_time,
+                origin=origin,
+                starts=starts,
+                workers=workers,
+                seed=seed,
+                candidates=candidates,
+                refine=refine,
+                time_budget=time_budget,
+                max_iterations=max_iterations,
+            )
+        else:
+            if candidates:
+                order = indexed_nearest_neighbour_order(coordinates, self.path_time, candidates=candidates)
+            else:
+                order = nearest_neighbour_order(coordinates, self.path_time)
+            if refine:
+                before = path_total_time(coordinates[order], self.path_time, origin)
+                order = refine_order(coordinates, order, self.path_time, time_budget, max_iterations)
+                after = path_total_time(coordinates[order], self.path_time, origin)
+        self._apply_order(order)
+        if cache is not None:
+            cache.put(key, self.path_time.calibration_version, order, np.nan if before is None else before)
+        if refine:
+            log.info(f"Refined path time from {before / 60:.1f} min to {after / 60:.1f} min")
+            return before, after
+
+    def optimality_gap(self, iterations: int = 20) -> dict:
+        """
+        Compares calculate_total_path_time with the shortest possible path through the positions: the exact optimum
+        for up to pathbounds.max_exact_positions positions, otherwise a lower bound (see pathbounds.lower_bound).
+
+        Args:
+            iterations: Subgradient steps of the lower bound, each evaluates all pairs of positions once.
+
+        Returns:
+            dict: "path_time", "lower_bound", "gap" (share of path_time the path may be longer than the optimum) and
+            "exact" (whether lower_bound is the optimum itself).
+        """
+        from .pathbounds import lower_bound, max_exact_positions, optimal_order
+
+        origin = positions_to_array([self.initial_position])[0]
+        total = self.calculate_total_path_time()
+        exact = len(self) <= max_exact_positions
+        if exact:
+            bound = path_total_time(
+                self.coordinates[optimal_order(self.coordinates, self.path_time, origin)], self.path_time, origin
+            )
+        else:
+            bound = lower_bound(self.coordinates, self.path_time, origin, iterations=iterations, upper_bound=total)
+        gap = (total - bound) / total if total > 0 else 0.0
+        log.info(f"Path time {total / 60:.1f} min, {'optimum' if exact else 'lower bound'} {bound / 60:.1f} min, "
+                 f"gap {gap:.1%}")
+        return {"path_time": total, "lower_bound": bound, "gap": gap, "exact": exact}
+
+    def refine_path(self, time_budget: float = None, max_iterations: int = None):
+        """
+        Improves the current order with 2-opt and Or-opt moves, keeping the first position fixed.
+
+        Args:
+            time_budget: Wall-clock budget in seconds, None for no limit.
+            max_iterations: Maximum number of passes over the schedule, None for no limit.
+
+        Returns:
+            tuple: calculate_total_path_time before and after the refinement.
+        """
+        before = self.calculate_total_path_time()
+        order = refine_order(
+            self.coordinates,
+            np.arange(len(self)),
+            self.path_time,
+            time_budget=time_budget,
+            max_iterations=max_iterations,
+        )
+        self._apply_order(order)
+        after = self.calculate_total_path_time()
+        log.info(f"Refined path time from {before / 60:.1f} min to {after / 60:.1f} min")
+        return before, after
+
+    def _leg_times(self) -> np.ndarray:
+        # Rows appended since the last call only need their own legs computed
+        done = 0 if self._legs is None else min(len(self._legs), self._size)
+        if done < self._size:
+            origin = positions_to_array([self.initial_position]) if done == 0 else self.coordinates[done - 1 : done]
+            path = np.vstack([origin, self.coordinates[done:]])
+            legs = self.path_time.travel_times(path[:-1], path[1:])
+            self._legs = legs if done == 0 else np.concatenate([self._legs[:done], legs])
+        if self._legs is None:
+            return np.empty(0)
+        return self._legs[: self._size]
+
+    def insert_positions(self, coordinates) -> np.ndarray:
+        """
+        Inserts positions one by one where they add the least travel time to the current order (cheapest insertion).
+
+        Meant for adding a few positions to an already optimized schedule. Every insertion scores all gaps of the
+        schedule with one vectorized PathTime evaluation against the cached travel times of the current moves,
+        instead of re-running optimize_path.
+
+        Args:
+            coordinates: (M, 5) array in axis_order and system units or iterable of Position instances.
+
+        Returns:
+            np.ndarray: Indices of the inserted positions in the resulting schedule.
+        """
+        if not isinstance(coordinates, np.ndarray):
+            coordinates = list(coordinates)
+            if coordinates and isinstance(coordinates[0], Position):
+                coordinates = positions_to_array(coordinates)
+        coordinates = np.asarray(coordinates, dtype=float).reshape(-1, len(axis_order))
+        origin = positions_to_array([self.initial_position])
+        inserted = []
+        for point in coordinates:
+            legs = self._leg_times()
+            n = self._size
+            # Time into the new point from the origin and every row, and from it into every row
+            to_point = self.path_time.travel_times(np.vstack([origin, self.coordinates]), point)
+            from_point = self.path_time.travel_times(point, self.coordinates)
+            added = np.empty(n + 1)
+            added[:n] = to_point[:n] + from_point - legs
+            added[n] = to_point[n]
+            k = int(np.argmin(added))
+
+            # A new buffer, slices of the schedule share the old one and must not see the rows shift
+            self._coordinates = np.insert(self.coordinates, k, point, axis=0)
+            self._size += 1
+            self._legs = np.insert(legs, k, to_point[k])
+            if k < n:
+                self._legs[k + 1] = from_point[k]
+            inserted = [i + 1 if i >= k else i for i in inserted] + [k]
+        return np.array(inserted, dtype=np.intp)
+
+    def remove_positions(self, indices) -> None:
+        """
+        Removes positions, the remaining ones keep their order. Only the moves into the positions following a
+        removed one are re-timed.
+
+        Args:
+            indices: Index or indices of the positions to remove.
+        """
+        keep = np.ones(self._size, dtype=bool)
+        keep[np.asarray(indices, dtype=np.intp)] = False
+        legs = self._leg_times()[keep]
+        rows = np.flatnonzero(keep)
+        # Kept rows whose predecessor was removed get a new move into them
+        changed = np.flatnonzero(rows != np.concatenate([[-1], rows[:-1]]) + 1)
+        self._coordinates = self.coordinates[keep]
+        self._size = len(self._coordinates)
+        if len(changed):
+            path = np.vstack([positions_to_array([self.initial_position]), self._coordinates])
+            legs[changed] = self.path_time.travel_times(path[changed], path[changed + 1])
+        self._legs = legs
 
     def __len__(self):
-        return len(self.schedule)
+        return self._size
 
     def __getitem__(self, idx):
-        return self.schedule[idx]
+        if isinstance(idx, slice):
+            schedule = FASSchedule(path_time=self.path_time)
+            schedule._coordinates = self.coordinates[idx]
+            schedule._size = len(schedule._coordinates)
+            return schedule
+        return array_to_position(self.coordinates[idx])
+
+    def __iter__(self):
+        for row in self.coordinates:
+            yield array_to_position(row)
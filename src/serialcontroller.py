@@ -1,6 +1,15 @@
+import json
+import os
 import time
 import serial
 import logging
+import queue
+import threading
+from concurrent.futures import Future
+from collections import deque
+from contextlib import contextmanager
+from .answerparser import AnswerParser
+from .telemetry import Telemetry, command_label
 
 log = logging.getLogger(__name__)
 
@@ -12,51 +21,448 @@ class SerialController:
         port (str): The name of the serial port to connect to (e.g., 'COM5' for Windows or '/dev/ttyUSB0' for Unix systems).
         answer_end (str): The delimiter used to identify the end of a response from the connected device. Defaults to "####".
         timeout (int): The timeout in seconds for reading from the serial port. Defaults to 10 seconds.
+        max_reconnects (int): How often a session reconnects and retries a command after an I/O error. Defaults to 3.
+        pacing_file (str): JSON file with calibrated command gaps per port (see calibrate_min_gap). If it has an entry
+            for this port, "gap" pacing is used.
+        device: Object with the serial.Serial interface to use instead of opening port, e.g. a simulated device.
+
+    Pacing between the arguments of a command and between commands is selected with the pacing attribute:
+        "fixed": sleep sleep_time between arguments and answer_sleep_time after each answer (default).
+        "ack": after each argument wait until the device sends the ack bytes, at most ack_timeout seconds,
+            and fall back to the fixed delay if they do not arrive.
+        "gap": keep at least min_gap seconds between arguments and answer_gap seconds between an answer and the
+            next command, counting the time already spent elsewhere.
+    saved_wait_time accumulates how many seconds of the fixed delays were not slept.
+
+    Inside a session each command is written as soon as it is queued, without waiting for the answers of the
+    commands before it. The device answers the commands in query_labels (the position query) right away and a move
+    only once it is done, so polls can go out while moves run. The worker reads in steps of poll_interval seconds to
+    write newly queued commands in between. With "ack" pacing the echoes are read while writing, so there a command
+    is only written once all earlier answers arrived.
+
+    telemetry collects latency histograms of writing, waiting and reading per command, and counts retries and
+    timeouts (see Telemetry).
     """
     
-    def __init__(self, port : str = 'COM5', answer_end : str = "####", timeout : int =10):
-        self.ise = serial.Serial(port=port, timeout=timeout)
+    def __init__(self, port : str = 'COM5', answer_end : str = "####", timeout : int =10, max_reconnects : int = 3,
+                 pacing_file : str = None, device = None):
+        self.ise = serial.Serial(port=port, timeout=timeout) if device is None else device
         self.ise.close()  # Close initially, open only when needed
+        self.timeout = self.ise.timeout
         self.answer_end = answer_end
+        # Cuts the answers out of the bytes read from the port, complete ones not read yet wait in _answers
+        self._parser = AnswerParser(answer_end)
+        self._answers = deque()
         self.sleep_time = 0.65
+        self.answer_sleep_time = 0.1
+        self.pacing = "fixed"
+        self.ack = None
+        self.ack_timeout = self.sleep_time
+        self.min_gap = self.sleep_time
+        self.answer_gap = self.answer_sleep_time
+        self.saved_wait_time = 0.0
+        self._ready_at = 0.0
+        self.max_reconnects = max_reconnects
+        self.query_labels = {"My-Achse"}
+        self.poll_interval = 0.005
+        self.telemetry = Telemetry()
+        if pacing_file is not None:
+            self.load_pacing(pacing_file)
+        self._lock = threading.Lock()
+        self._session_depth = 0
+        self._queue = None
+        self._worker = None
+
     def open(self)->None:
         if not self.ise.is_open:
             log.debug(f"Opening device connection")
             self.ise.open()
+            # Bytes received on an earlier connection do not belong to the next command
+            self._parser.reset()
+            self._answers.clear()
 
     def close(self)->None:
         if self.ise.is_open:
             log.debug(f"Closing device connection")
             self.ise.close()
-            
-    def send(self, *args : str)-> str:
+
+    @property
+    def in_session(self) -> bool:
+        return self._session_depth > 0
+
+    @contextmanager
+    def session(self):
+        """
+        Keeps the serial port open for the duration of the with-block instead of reopening it for every command.
+
+        Inside a session all sends, from any thread, are queued and written in order by one worker thread that owns
+        the connection, which also reads the answers and hands them to the waiting sends. After an I/O error the port
+        is reopened and the commands still waiting for answers are written again, up to max_reconnects times.
+        Sessions can be nested, the port closes when the outermost one ends.
+        """
+        with self._lock:
+            self._session_depth += 1
+            if self._session_depth == 1:
+                self.open()
+                self.ise.timeout = self.poll_interval
+                self._queue = queue.Queue()
+                self._worker = threading.Thread(target=self._process_queue, name="SerialController session", daemon=True)
+                self._worker.start()
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._session_depth -= 1
+                if self._session_depth == 0:
+                    # Let the worker finish everything queued before closing the port
+                    self._queue.put(None)
+                    self._worker.join()
+                    self._worker = None
+                    self._queue = None
+                    self.ise.timeout = self.timeout
+                    self.close()
+
+    def _process_queue(self) -> None:
+        # Writes every transaction as soon as it is queued and hands out the answers as they arrive, so that queries
+        # go out while moves written before them still wait for their answers
+        in_flight = deque()
+        stopping = False
+        while not stopping or in_flight:
+            if not stopping and (not in_flight or (self.pacing != "ack" and not self._queue.empty())):
+                item = self._queue.get()
+                if item is None:
+                    stopping = True
+                    continue
+                commands, single, on_written, future = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                transaction = _Transaction(commands, single, on_written, future)
+                in_flight.append(transaction)
+                step, args = self._write_transaction, (in_flight, transaction)
+            else:
+                step, args = self._read_answers, (in_flight,)
+            try:
+                step(*args)
+            except (serial.SerialException, OSError) as err:
+                self._reconnect(in_flight, err)
+            except Exception as err:
+                for transaction in in_flight:
+                    transaction.future.set_exception(err)
+                in_flight.clear()
+
+    def _write_transaction(self, in_flight : deque, transaction : "_Transaction") -> None:
+        # Answers that arrived meanwhile belong to the commands written before, hand them out first
+        self._read_answers(in_flight, wait=False)
+        transaction.reset()
+        transaction.labels = self._write_commands(transaction.commands, transaction.on_written)
+        transaction.queries = [label in self.query_labels for label in transaction.labels]
+        transaction.written = time.perf_counter()
+
+    def _read_answers(self, in_flight : deque, wait : bool = True) -> None:
+        # Reads what the device sent, waiting at most one read timeout (poll_interval) for it if wait is set
+        if wait or self.ise.in_waiting:
+            self._answers.extend(self._parser.split(self.ise.read(max(1, self.ise.in_waiting))))
+        # Answers ahead of their command (e.g. left from a timed out one) wait in _answers for the next
+        while self._answers and self._assign(in_flight, self._answers[0].decode()):
+            self._answers.popleft()
+        oldest = in_flight[0] if in_flight else None
+        if oldest is not None and oldest.written is not None and time.perf_counter() - oldest.written > self.timeout:
+            # Read timeout, the first missing answer gets the incomplete one like read_until would
+            partial = self._parser.pending.decode()
+            self._parser.reset()
+            for i in oldest.missing():
+                self._answer(in_flight, oldest, i, partial)
+                partial = ""
+
+    def _assign(self, in_flight : deque, answer : str) -> bool:
+        # Queries are answered right away, so an answer arriving while one is outstanding is its answer. A move that
+        # finished just before reports the same positions, mixing the two up changes nothing. Moves get the answers
+        # in the order they arrive.
+        missing = [(transaction, i) for transaction in in_flight if transaction.written is not None
+                   for i in transaction.missing()]
+        if not missing:
+            return False
+        transaction, i = next(((t, i) for t, i in missing if t.queries[i]), missing[0])
+        self._answer(in_flight, transaction, i, answer)
+        return True
+
+    def _answer(self, in_flight : deque, transaction : "_Transaction", i : int, answer : str) -> None:
+        transaction.responses[i] = answer
+        self._answer_received(transaction.labels[i], answer, time.perf_counter() - transaction.written)
+        if not transaction.missing():
+            in_flight.remove(transaction)
+            self.last_answer_time = time.perf_counter() - transaction.written
+            log.debug(f"Got following responses {transaction.responses} from device after {self.last_answer_time} s")
+            transaction.future.set_result(transaction.responses[0] if transaction.single else transaction.responses)
+
+    def _reconnect(self, in_flight : deque, err : Exception) -> None:
+        # The answers still expected are lost with the connection, the transactions in flight are written again
+        while in_flight:
+            for transaction in list(in_flight):
+                transaction.attempts += 1
+                if transaction.attempts > self.max_reconnects:
+                    transaction.future.set_exception(err)
+                    in_flight.remove(transaction)
+            if not in_flight:
+                return
+            attempt = max(transaction.attempts for transaction in in_flight)
+            log.warning(f"I/O error '{err}' on device connection, reconnecting ({attempt}/{self.max_reconnects})")
+            self.telemetry.increment("retries")
+            self.close()
+            try:
+                self.open()
+                for transaction in in_flight:
+                    transaction.reset()
+                for transaction in in_flight:
+                    self._write_transaction(in_flight, transaction)
+                return
+            except (serial.SerialException, OSError) as retry_err:
+                err = retry_err
+
+    def _wait_between_arguments(self, written_at : float) -> None:
+        if self.pacing == "ack" and self.ack is not None:
+            timeout = self.ise.timeout
+            self.ise.timeout = self.ack_timeout
+            try:
+                echo = self.ise.read_until(self.ack, 1000)
+            finally:
+                self.ise.timeout = timeout
+            if not echo.endswith(self.ack):
+                log.debug(f"No ack from device within {self.ack_timeout} s, falling back to fixed delay")
+                self.telemetry.increment("ack_fallbacks")
+                time.sleep(max(0.0, self.sleep_time - (time.time() - written_at)))
+        elif self.pacing == "gap":
+            time.sleep(max(0.0, self.min_gap - (time.time() - written_at)))
+        else:
+            time.sleep(self.sleep_time)
+        self.saved_wait_time += max(0.0, self.sleep_time - (time.time() - written_at))
+
+    def _read_answer(self) -> str:
+        # Reads whatever bytes are available until an answer is complete. A read may end inside an answer or hold
+        # several, the ones after the first are returned by the next calls.
+        while not self._answers:
+            chunk = self.ise.read(max(1, self.ise.in_waiting))
+            if not chunk:
+                # Read timeout, return the incomplete answer like read_until would
+                partial = self._parser.pending
+                self._parser.reset()
+                return partial.decode()
+            self._answers.extend(self._parser.split(chunk))
+        return self._answers.popleft().decode()
+
+    def _write_commands(self, commands : list, on_written=None) -> list:
+        # Writes the arguments of all commands with the pacing on the already open port, returns the command labels.
+        # on_written gets the time.perf_counter() right after the last argument is written.
+        labels = [command_label(command[0]) for command in commands]
+        # Instead of sleeping after the previous answer, wait only for what is left of the answer gap
+        ready_wait = max(0.0, self._ready_at - time.time())
+        time.sleep(ready_wait)
+        if self.pacing != "fixed":
+            self.saved_wait_time += max(0.0, self.answer_sleep_time - ready_wait)
+        self.telemetry.record("wait", labels[0], ready_wait)
+        arguments = [(label, arg) for label, command in zip(labels, commands) for arg in command]
+        for i, (label, arg) in enumerate(arguments):
+            log.debug(f"Sending command '{arg}' to device")
+            written = time.perf_counter()
+            self.ise.write((str(arg)+"\n").encode())
+            waiting = time.perf_counter()
+            self.telemetry.record("write", label, waiting - written)
+            if i!=len(arguments)-1:
+                self._wait_between_arguments(time.time())
+                self.telemetry.record("wait", label, time.perf_counter() - waiting)
+        if on_written is not None:
+            on_written(time.perf_counter())
+        return labels
+
+    def _answer_received(self, label : str, answer : str, duration : float) -> None:
+        self.telemetry.record("read", label, duration)
+        if self.answer_end not in answer:
+            self.telemetry.increment("timeouts")
+        self._ready_at = time.time() + (self.answer_gap if self.pacing == "gap" else self.answer_sleep_time)
+
+    def _transfer_many(self, commands : list, on_written=None) -> list:
+        # Writes all commands before reading their answers
+        labels = self._write_commands(commands, on_written)
+        start = time.time()
+        responses = []
+        for label in labels:
+            reading = time.perf_counter()
+            responses.append(self._read_answer())
+            self._answer_received(label, responses[-1], time.perf_counter() - reading)
+        self.last_answer_time = time.time() - start
+        log.debug(f"Got following responses {responses} from device after {self.last_answer_time} s")
+        return responses
+
+    def _transfer(self, *args : str, on_written=None) -> str:
+        return self._transfer_many([args], on_written)[0]
+
+    def command_dispatch_time(self, n_args : int = 3) -> float:
+        """
+        Estimated time to write one command of n_args arguments with the current pacing, before its answer is read.
+        """
+        gap = self.min_gap if self.pacing == "gap" else self.sleep_time
+        return n_args * gap
+
+    def calibrate_min_gap(self, *probe : str, validate=None, gaps=None, repeats : int = 3, margin : float = 1.2) -> float:
+        """
+        Finds the shortest gap between arguments the device still handles, using "gap" pacing.
+
+        The probe command is sent repeats times for every candidate gap, from long to short, until an answer is
+        missing its answer_end or fails validate. The shortest working gap times margin is kept in min_gap and
+        answer_gap, and pacing switches to "gap". The probe must be harmless to repeat, e.g. a move to the current
+        position.
+
+        Args:
+            *probe: Command arguments to send.
+            validate: Optional callable that gets the response and returns False if it is not the expected answer.
+            gaps: Candidate gaps in seconds, defaults to a range from sleep_time down to 10 ms.
+            repeats: Number of probes per candidate gap.
+            margin: Safety factor applied to the shortest working gap.
+
+        Returns:
+            float: The calibrated min_gap.
+        """
+        if gaps is None:
+            gaps = [self.sleep_time, 0.4, 0.25, 0.15, 0.1, 0.05, 0.02, 0.01]
+        previous = (self.pacing, self.min_gap, self.answer_gap)
+        self.pacing = "gap"
+        working = None
+        try:
+            for gap in sorted(gaps, reverse=True):
+                self.min_gap = self.answer_gap = gap
+                answers = [self.send(*probe) for _ in range(repeats)]
+                if not all(self.answer_end in answer and (validate is None or validate(answer)) for answer in answers):
+                    break
+                working = gap
+        finally:
+            self.pacing, self.min_gap, self.answer_gap = previous
+        if working is None:
+            log.warning("No candidate gap gave valid answers, keeping the current pacing")
+            return self.min_gap
+        self.pacing = "gap"
+        self.min_gap = self.answer_gap = min(working * margin, self.sleep_time)
+        log.info(f"Calibrated minimum command gap of {self.min_gap} s for {self.ise.port}")
+        return self.min_gap
+
+    def save_pacing(self, fname : str) -> None:
+        """
+        Stores the calibrated gaps of this port in a JSON file, keeping entries of other ports.
+        """
+        pacing = {}
+        if os.path.exists(fname):
+            with open(fname) as f:
+                pacing = json.load(f)
+        pacing[self.ise.port] = {"min_gap": self.min_gap, "answer_gap": self.answer_gap}
+        with open(fname, "w") as f:
+            json.dump(pacing, f, indent=2)
+
+    def load_pacing(self, fname : str) -> None:
+        """
+        Loads the calibrated gaps of this port from a JSON file written by save_pacing and switches to "gap" pacing.
+        """
+        if not os.path.exists(fname):
+            log.debug(f"No pacing file {fname}, keeping fixed delays")
+            return
+        with open(fname) as f:
+            pacing = json.load(f).get(self.ise.port)
+        if pacing is None:
+            log.debug(f"No calibrated pacing for {self.ise.port} in {fname}, keeping fixed delays")
+            return
+        self.min_gap = pacing["min_gap"]
+        self.answer_gap = pacing["answer_gap"]
+        self.pacing = "gap"
+
+    def _enqueue(self, commands : list, single : bool, on_written=None) -> Future:
+        if not self.in_session or self._queue is None:
+            raise RuntimeError("Queuing commands needs an active session, use `with controller.session():`")
+        future = Future()
+        self._queue.put((commands, single, on_written, future))
+        return future
+
+    def submit(self, *args : str, on_written=None) -> Future:
+        """
+        Queues the commands on the open session and returns a Future with the response of send.
+        """
+        return self._enqueue([args], single=True, on_written=on_written)
+
+    def submit_many(self, commands : list, on_written=None) -> Future:
+        """
+        Queues several commands as one transaction on the open session, returns a Future with the responses of
+        send_many.
+        """
+        return self._enqueue(list(commands), single=False, on_written=on_written)
+
+    def send(self, *args : str, on_written=None)-> str:
         """
         Sends the specified commands to the connected serial device and reads the response.
         
-        The method automatically opens the connection if it's not already open, sends each argument as a command,
-        and then closes the connection. Responses are read until the specified 'answer_end' delimiter is encountered.
+        Outside of a session the method opens the connection, sends each argument as a command, and then closes the
+        connection again. Inside a session the commands are queued on the open connection instead.
+        Responses are read until the specified 'answer_end' delimiter is encountered.
         
         Args:
             *args: Variable length argument list where each argument is a command to send to the device.
+            on_written: Optional callable that gets the time.perf_counter() right after the last argument is written,
+                i.e. after the pacing waits. Called again if the command is written again after a reconnect.
         
         Returns:
             str: The response from the serial device up to and including the 'answer_end' delimiter.
         """
-        self.open()
-        try:
-            for i, arg in enumerate(args):
-                log.debug(f"Sending command '{arg}' to device")
-                self.ise.write((str(arg)+"\n").encode())
-                if i!=len(args)-1:
-                    time.sleep(self.sleep_time)
-            start = time.time()
-            response = self.ise.read_until((self.answer_end).encode(), 1000).decode()
-            stop = time.time()
-            self.last_answer_time = stop-start
-            time.sleep(0.1)
-            log.debug(f"Got following response {response} from device after {self.last_answer_time} s")
-        except Exception as err:
-            log.error(err)
-        self.close()
+        if self.in_session:
+            return self.submit(*args, on_written=on_written).result()
+        response = ""
+        with self._lock:
+            self.open()
+            try:
+                response = self._transfer(*args, on_written=on_written)
+            except Exception as err:
+                log.error(err)
+                self.telemetry.increment("errors")
+            self.close()
         return response
-    
\ No newline at end of file
+
+    def send_many(self, commands : list, on_written=None) -> list:
+        """
+        Sends several commands back to back and only then reads one answer per command, so that the device can
+        execute them at the same time.
+
+        Args:
+            commands: List of argument tuples, each one command as passed to send.
+            on_written: Optional callable that gets the time.perf_counter() after the last command is written, as for
+                send.
+
+        Returns:
+            list: The responses in the order they were read, one per command.
+        """
+        if self.in_session:
+            return self.submit_many(commands, on_written=on_written).result()
+        responses = [""] * len(commands)
+        with self._lock:
+            self.open()
+            try:
+                responses = self._transfer_many(commands, on_written)
+            except Exception as err:
+                log.error(err)
+                self.telemetry.increment("errors")
+            self.close()
+        return responses
+
+
+class _Transaction:
+    # Commands queued on a session as one item, with their answers as far as they arrived
+    def __init__(self, commands : list, single : bool, on_written, future : Future):
+        self.commands = commands
+        self.single = single
+        self.on_written = on_written
+        self.future = future
+        self.attempts = 0
+        self.labels = []
+        self.queries = []
+        self.reset()
+
+    def reset(self) -> None:
+        self.responses = [None] * len(self.commands)
+        self.written = None
+
+    def missing(self) -> list:
+        return [i for i, response in enumerate(self.responses) if response is None]
@@ -0,0 +1,200 @@
+import heapq
+import logging
+import re
+import threading
+import time
+
+from .serialcontroller import SerialController
+from .scheduling import FASSchedule, PathTime
+from .utils_constants import Axis, axis_order, axis_to_system_units, system_to_axis_units
+
+log = logging.getLogger(__name__)
+
+# Protocol axis key ("X", "4", ...) -> axis name ("X", "ROT", ...)
+command_axes = {getattr(Axis, axis): axis for axis in axis_order}
+move_pattern = re.compile(r"^(\w+)-Achse:(-?\d+)$")
+
+
+class SimulatedDevice:
+    """
+    In-process stand-in for the serial.Serial port of the axis controller.
+
+    It understands the controller protocol: a move is the line "<axis>-Achse:<position>" followed by a speed and an
+    acceleration line, "My-Achse:" asks for the current position. Each axis moves independently and answers with
+    all axis positions once its move is done, after the time PathTime.model predicts for the distance, speed and
+    acceleration, multiplied by time_scale. While it moves, the position stays put for PathTime.start_delay and then
+    follows the model's speed profile. Positions are in axis units, like on the real device.
+
+    Args:
+        port (str): Name reported as port.
+        timeout (float): Read timeout in seconds.
+        answer_end (str): Delimiter terminating every answer.
+        time_scale (float): Factor applied to all simulated durations, e.g. 0.01 to replay 100x faster.
+        path_time (PathTime): Model the move durations are taken from.
+        initial_position (dict): Start position per axis name in system units, defaults to
+            FASSchedule.initial_position.
+        echo (bool): Echo every received line immediately, like devices that acknowledge input.
+    """
+
+    def __init__(self, port: str = "SIM", timeout: float = 10, answer_end: str = "####", time_scale: float = 1.0,
+                 path_time: PathTime = None, initial_position: dict = None, echo: bool = False):
+        self.port = port
+        self.timeout = timeout
+        self.answer_end = answer_end
+        self.time_scale = time_scale
+        self.path_time = PathTime() if path_time is None else path_time
+        self.echo = echo
+        self.is_open = False
+        if initial_position is None:
+            initial_position = {axis: getattr(FASSchedule.initial_position, axis) for axis in axis_order}
+        # Per axis: (start position, target position, start time, duration, speed_adc, acceleration_adc), positions
+        # in axis units
+        self._motion = {
+            axis: (system_to_axis_units(initial_position[axis], axis),) * 2 + (0.0, 0.0, None, None)
+            for axis in axis_order
+        }
+        self._input = b""
+        self._command = []
+        self._output = bytearray()
+        self._pending = []
+        self._sequence = 0
+        self._condition = threading.Condition()
+
+    def open(self) -> None:
+        self.is_open = True
+
+    def close(self) -> None:
+        self.is_open = False
+
+    def reset_input_buffer(self) -> None:
+        with self._condition:
+            self._output.clear()
+
+    def position(self, axis: str, now: float = None) -> float:
+        """
+        Position of an axis in axis units, following the speed profile of the model while it moves.
+        """
+        start, target, started, duration, speed, acceleration = self._motion[axis]
+        now = time.monotonic() if now is None else now
+        if duration <= 0 or now >= started + duration or target == start:
+            return target
+        elapsed = (now - started) / self.time_scale - self.path_time.start_delay(axis)
+        distance = axis_to_system_units(abs(target - start), axis)
+        travelled = self.path_time.distance_at(axis, distance, elapsed, speed, acceleration)
+        return start + (target - start) * travelled / distance
+
+    def _answer(self, now: float) -> bytes:
+        values = " ".join(f"{getattr(Axis, axis)}-Achse:{int(round(self.position(axis, now)))}" for axis in axis_order)
+        return f"{values} {self.answer_end}".encode()
+
+    def _schedule_output(self, ready: float, data: bytes) -> None:
+        self._sequence += 1
+        heapq.heappush(self._pending, (ready, self._sequence, data))
+        self._condition.notify_all()
+
+    def _handle_line(self, line: str, now: float) -> None:
+        if self.echo:
+            self._schedule_output(now, (line + "\n").encode())
+        if line.startswith("My-Achse:"):
+            self._schedule_output(now, self._answer(now))
+            return
+        self._command.append(line)
+        match = move_pattern.match(self._command[0])
+        if match is None or match.group(1) not in command_axes:
+            log.warning(f"Simulated device got unknown command {self._command}")
+            self._command = []
+            return
+        if len(self._command) < 3:
+            return
+        axis = command_axes[match.group(1)]
+        target = float(match.group(2))
+        speed, acceleration = float(self._command[1]), float(self._command[2])
+        self._command = []
+        start = self.position(axis, now)
+        distance = axis_to_system_units(abs(target - start), axis)
+        duration = self.path_time.axis_time(axis, distance, speed, acceleration) * self.time_scale
+        self._motion[axis] = (start, target, now, duration, speed, acceleration)
+        self._schedule_output(now + duration, None)
+
+    def write(self, data: bytes) -> int:
+        if not self.is_open:
+            raise OSError("Simulated device is not open")
+        now = time.monotonic()
+        with self._condition:
+            self._input += data
+            while b"\n" in self._input:
+                line, self._input = self._input.split(b"\n", 1)
+                self._handle_line(line.decode().strip(), now)
+        return len(data)
+
+    def _deliver(self, now: float) -> None:
+        # Answers of finished moves report the positions at their completion time
+        while self._pending and self._pending[0][0] <= now:
+            ready, _, data = heapq.heappop(self._pending)
+            self._output += self._answer(ready) if data is None else data
+
+    @property
+    def in_waiting(self) -> int:
+        with self._condition:
+            self._deliver(time.monotonic())
+            return len(self._output)
+
+    def _read(self, end_of) -> bytes:
+        # Waits until end_of(output) gives the length to return, or the timeout passes, like serial.Serial reads
+        if not self.is_open:
+            raise OSError("Simulated device is not open")
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._deliver(now)
+                end = end_of(self._output)
+                if end is not None:
+                    break
+                if deadline is not None and now >= deadline:
+                    end = len(self._output)
+                    break
+                wake = self._pending[0][0] if self._pending else None
+                if deadline is not None:
+                    wake = deadline if wake is None else min(wake, deadline)
+                self._condition.wait(None if wake is None else max(0.0, wake - now))
+            data = bytes(self._output[:end])
+            del self._output[:end]
+        return data
+
+    def read(self, size: int = 1) -> bytes:
+        return self._read(lambda output: size if len(output) >= size else None)
+
+    def read_until(self, expected: bytes = b"\n", size: int = None) -> bytes:
+        def end_of(output):
+            end = output.find(expected)
+            if end >= 0 and (size is None or end + len(expected) <= size):
+                return end + len(expected)
+            if size is not None and len(output) >= size:
+                return size
+            return None
+
+        return self._read(end_of)
+
+
+class SimulatedController(SerialController):
+    """
+    SerialController talking to a SimulatedDevice instead of a serial port, for benchmarks and tests without the rig.
+
+    All host-side delays of the pacing are scaled by time_scale as well, so whole schedule runs replay faster.
+
+    Args:
+        time_scale (float): Factor applied to all simulated and pacing durations, e.g. 0.01 to replay 100x faster.
+        answer_end (str): Delimiter terminating every answer.
+        timeout (float): Read timeout in seconds.
+        **device_kwargs: Further arguments for SimulatedDevice.
+    """
+
+    def __init__(self, time_scale: float = 1.0, answer_end: str = "####", timeout: float = 10, **device_kwargs):
+        device = SimulatedDevice(timeout=timeout, answer_end=answer_end, time_scale=time_scale, **device_kwargs)
+        super().__init__(port=device.port, answer_end=answer_end, timeout=timeout, device=device)
+        self.sleep_time *= time_scale
+        self.answer_sleep_time *= time_scale
+        self.ack_timeout *= time_scale
+        self.min_gap *= time_scale
+        self.answer_gap *= time_scale
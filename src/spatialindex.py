@@ -0,0 +1,195 @@
+import numpy as np
+
+
+class GridIndex:
+    """
+    Uniform grid over scaled coordinates for approximate nearest neighbour queries with lazy deletion.
+
+    Points are bucketed into cells of equal size over the axes that actually vary. A query searches rings of
+    cells around the query point until enough alive points are found, and returns the closest of them by the
+    L1 norm of the scaled coordinates. Removed points are only flagged dead and skipped by later queries.
+
+    Args:
+        coordinates (np.ndarray): (N, D) coordinate array, NaN entries are replaced by the axis mean.
+        scale (np.ndarray): (D,) factors the coordinates are divided by, e.g. axis speeds so that
+            distances approximate travel times.
+        points_per_cell (float): Average number of points per cell the cell size is chosen for.
+    """
+
+    # Empty border cells around the grid, rings up to this radius need no bounds checks
+    padding = 2
+
+    def __init__(self, coordinates: np.ndarray, scale=1.0, points_per_cell: float = 4.0):
+        points = np.asarray(coordinates, dtype=float)
+        self.scale = np.broadcast_to(np.asarray(scale, dtype=float), points.shape[1:]).copy()
+        points = points / self.scale
+        self.fill = np.zeros(points.shape[1])
+        if np.isnan(points).any():
+            # Axes without any value are filled with 0, nanmean warns about them
+            present = ~np.isnan(points).all(axis=0)
+            self.fill[present] = np.nanmean(points[:, present], axis=0)
+            points = np.where(np.isnan(points), self.fill, points)
+        self.size = len(points)
+        lower = points.min(axis=0) if self.size else np.zeros(points.shape[1])
+        extent = points.max(axis=0) - lower if self.size else np.zeros(points.shape[1])
+        # Only axes that vary are gridded, constant axes do not change any distance
+        self.dims = np.flatnonzero(extent > 0)
+        self.points = points[:, self.dims]
+        self.lower = lower[self.dims]
+        extent = extent[self.dims]
+
+        self.cell_size = 1.0
+        cells_per_dim = np.ones(len(self.dims), dtype=np.int64)
+        if len(self.dims):
+            self.cell_size = (np.prod(extent) * points_per_cell / max(self.size, 1)) ** (1 / len(self.dims))
+            cells_per_dim = np.maximum(np.ceil(extent / self.cell_size), 1).astype(np.int64)
+            # Degenerate extents can blow up the cell count, grow the cells until it stays near N
+            while np.prod((cells_per_dim + 2 * self.padding).astype(float)) > 8 * self.size + 1024:
+                self.cell_size *= 1.5
+                cells_per_dim = np.maximum(np.ceil(extent / self.cell_size), 1).astype(np.int64)
+        self.cells_per_dim = cells_per_dim
+        self.shape = cells_per_dim + 2 * self.padding
+        self.n_cells = int(np.prod(self.shape))
+        self.strides = np.cumprod(np.concatenate([self.shape[1:], [1]])[::-1])[::-1].astype(np.intp)
+
+        self.cell_key = self._key_of(self.points)
+        # CSR layout: members[cell_start[c]:cell_start[c + 1]] are the points of cell c
+        self.members = np.argsort(self.cell_key, kind="stable")
+        self.cell_start = np.zeros(self.n_cells + 1, dtype=np.intp)
+        np.cumsum(np.bincount(self.cell_key, minlength=self.n_cells), out=self.cell_start[1:])
+        self.cell_length = np.diff(self.cell_start)
+        # Number of alive points per cell, lets queries skip cells whose points were all removed
+        self.cell_count = self.cell_length.copy()
+        self.alive = np.ones(self.size, dtype=bool)
+        self.n_alive = self.size
+        self.n_occupied = int(np.count_nonzero(self.cell_count))
+        self._rings = {}
+
+    def _cell_of(self, points: np.ndarray) -> np.ndarray:
+        cells = np.floor((points - self.lower) / self.cell_size).astype(np.int64)
+        return np.clip(cells, 0, self.cells_per_dim - 1) + self.padding
+
+    def _key_of(self, points: np.ndarray) -> np.ndarray:
+        return self._cell_of(points) @ self.strides
+
+    def _ring(self, r: int):
+        # Offsets of all cells at Chebyshev distance r from the centre cell, and the matching key offsets
+        if r not in self._rings:
+            d = len(self.dims)
+            offsets = np.indices((2 * r + 1,) * d).reshape(d, -1).T - r
+            offsets = offsets[np.abs(offsets).max(axis=1) == r]
+            self._rings[r] = offsets, offsets @ self.strides
+        return self._rings[r]
+
+    def _ring_size(self, r: int) -> int:
+        d = len(self.dims)
+        return (2 * r + 1) ** d - (2 * r - 1) ** d if r else 1
+
+    def _gather(self, cells: np.ndarray) -> np.ndarray:
+        # Alive points of the given cell keys
+        starts = self.cell_start[cells]
+        counts = self.cell_length[cells]
+        total = int(counts.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.intp)
+        shifts = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        members = self.members[np.arange(total) + shifts]
+        return members[self.alive[members]]
+
+    def remove(self, idx: int) -> None:
+        """
+        Flags a point as deleted, later queries skip it.
+        """
+        if self.alive[idx]:
+            self.alive[idx] = False
+            self.n_alive -= 1
+            cell = self.cell_key[idx]
+            self.cell_count[cell] -= 1
+            if self.cell_count[cell] == 0:
+                self.n_occupied -= 1
+
+    def query(self, point: np.ndarray, k: int = 8) -> np.ndarray:
+        """
+        Returns the indices of up to k alive points closest to point (in original, unscaled coordinates).
+        """
+        point = np.asarray(point, dtype=float) / self.scale
+        point = np.where(np.isnan(point), self.fill, point)
+        return self.query_scaled(point[self.dims], k)
+
+    def query_scaled(self, point: np.ndarray, k: int = 8) -> np.ndarray:
+        """
+        Like query, but point is already given in the scaled coordinates of the gridded axes.
+        """
+        if self.n_alive == 0:
+            return np.empty(0, dtype=np.intp)
+        if not len(self.dims):
+            return np.flatnonzero(self.alive)[:k]
+        centre = self._cell_of(point)
+        centre_key = int(centre @ self.strides)
+        found = []
+        n_found = 0
+        # With fewer alive points than k the rings have to reach all of them. Rings along a single gridded axis
+        # never outgrow the occupied cells, so the count is the only sure end.
+        wanted = min(k, self.n_alive)
+        r = 0
+        while n_found < wanted:
+            if self._ring_size(r) > self.n_occupied:
+                # Rings got larger than the set of occupied cells, scan those directly
+                found = [self._gather(np.flatnonzero(self.cell_count))]
+                break
+            offsets, key_offsets = self._ring(r)
+            if r <= self.padding:
+                keys = centre_key + key_offsets
+            else:
+                cells = centre + offsets
+                keys = cells[((cells >= 0) & (cells < self.shape)).all(axis=1)] @ self.strides
+            keys = keys[self.cell_count[keys] > 0]
+            if len(keys):
+                members = self._gather(keys)
+                found.append(members)
+                n_found += len(members)
+            r += 1
+        candidates = np.concatenate(found)
+        if len(candidates) > k:
+            distance = np.abs(self.points[candidates] - point).sum(axis=1)
+            candidates = candidates[np.argpartition(distance, k - 1)[:k]]
+        return candidates
+
+
+def bisection_clusters(coordinates: np.ndarray, max_size: int, scale=1.0) -> list:
+    """
+    Splits points into spatially compact clusters of at most max_size points by recursive coordinate bisection:
+    every cluster that is too large is split at the median of the axis it spans most, giving clusters of nearly
+    equal size in O(N log(N / max_size)).
+
+    Args:
+        coordinates (np.ndarray): (N, D) coordinate array, NaN entries are replaced by the axis mean.
+        max_size (int): Largest number of points per cluster.
+        scale (np.ndarray): (D,) factors the coordinates are divided by, as for GridIndex.
+
+    Returns:
+        list: Index arrays of the clusters, in the order of a depth-first walk of the bisection.
+    """
+    points = np.asarray(coordinates, dtype=float) / np.asarray(scale, dtype=float)
+    if np.isnan(points).any():
+        fill = np.zeros(points.shape[1])
+        present = ~np.isnan(points).all(axis=0)
+        fill[present] = np.nanmean(points[:, present], axis=0)
+        points = np.where(np.isnan(points), fill, points)
+    max_size = max(int(max_size), 1)
+    clusters = []
+    stack = [np.arange(len(points))]
+    while stack:
+        indices = stack.pop()
+        if len(indices) <= max_size:
+            if len(indices):
+                clusters.append(indices)
+            continue
+        members = points[indices]
+        axis = int(np.argmax(members.max(axis=0) - members.min(axis=0)))
+        half = len(indices) // 2
+        split = np.argpartition(members[:, axis], half)
+        # Pushed in reverse so the lower half is walked first
+        stack.append(indices[split[half:]])
+        stack.append(indices[split[:half]])
+    return clusters
@@ -0,0 +1,179 @@
+from collections import deque
+import json
+import logging
+import math
+import os
+import threading
+import time
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class LatencyHistogram:
+    """
+    Histogram of durations in logarithmic buckets, bins_per_decade per factor 10 from min_value to max_value seconds.
+    Values outside the range are counted in the first or last bucket.
+    """
+
+    def __init__(self, min_value: float = 1e-6, max_value: float = 1e3, bins_per_decade: int = 10):
+        self.min_value = min_value
+        self.bins_per_decade = bins_per_decade
+        n_bins = int(math.ceil(math.log10(max_value / min_value) * bins_per_decade))
+        self.edges = min_value * 10 ** (np.arange(n_bins + 1) / bins_per_decade)
+        self.counts = np.zeros(n_bins, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def record(self, value: float) -> None:
+        i = int(math.log10(value / self.min_value) * self.bins_per_decade) if value > self.min_value else 0
+        self.counts[min(i, len(self.counts) - 1)] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper edge of the bucket holding the q-quantile, NaN if nothing was recorded.
+        """
+        if self.count == 0:
+            return math.nan
+        i = int(np.searchsorted(np.cumsum(self.counts), q * self.count))
+        return float(min(self.edges[i + 1], self.max))
+
+    def to_dict(self) -> dict:
+        occupied = np.flatnonzero(self.counts)
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "p50": self.quantile(0.5) if self.count else None,
+            "p90": self.quantile(0.9) if self.count else None,
+            "p99": self.quantile(0.99) if self.count else None,
+            # Sparse buckets as [lower edge, count]
+            "buckets": [[float(self.edges[i]), int(self.counts[i])] for i in occupied],
+        }
+
+
+def command_label(command: str) -> str:
+    """
+    Key of a command in the statistics: the part before the colon, e.g. "X-Achse" for moves of the X axis.
+    """
+    return str(command).split(":", 1)[0]
+
+
+class Telemetry:
+    """
+    In-process statistics of the rig communication.
+
+    Holds latency histograms per phase ("write", "wait", "read") and command label (see command_label), event
+    counters (e.g. "retries", "timeouts") and the predicted versus measured duration of every move. All methods are
+    thread safe.
+
+    Args:
+        move_history (int): Number of most recent moves kept individually, older ones only in the totals.
+    """
+
+    def __init__(self, move_history: int = 10000):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.moves = deque(maxlen=move_history)
+        self.move_totals = {"count": 0, "predicted": 0.0, "measured": 0.0, "squared_error": 0.0}
+        self.started = time.time()
+        self._dump_thread = None
+        self._dump_stop = threading.Event()
+
+    def record(self, phase: str, label: str, duration: float) -> None:
+        with self._lock:
+            histogram = self.histograms.get((phase, label))
+            if histogram is None:
+                histogram = self.histograms[(phase, label)] = LatencyHistogram()
+            histogram.record(duration)
+
+    def increment(self, counter: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def record_move(self, axes, predicted: float, measured: float) -> None:
+        """
+        Records a move of the given axes, predicted may be None if there was no prediction.
+        """
+        with self._lock:
+            self.moves.append((time.time(), "".join(axes), predicted, measured))
+            if predicted is not None:
+                self.move_totals["count"] += 1
+                self.move_totals["predicted"] += predicted
+                self.move_totals["measured"] += measured
+                self.move_totals["squared_error"] += (measured - predicted) ** 2
+
+    def histogram(self, phase: str, label: str) -> LatencyHistogram:
+        return self.histograms[(phase, label)]
+
+    def snapshot(self) -> dict:
+        """
+        All statistics as a JSON serializable dict.
+        """
+        with self._lock:
+            totals = dict(self.move_totals)
+            if totals["count"]:
+                totals["mean_error"] = (totals["measured"] - totals["predicted"]) / totals["count"]
+                totals["rms_error"] = math.sqrt(totals["squared_error"] / totals["count"])
+            phases = {}
+            for (phase, label), histogram in sorted(self.histograms.items()):
+                phases.setdefault(phase, {})[label] = histogram.to_dict()
+            return {
+                "timestamp": time.time(),
+                "uptime": time.time() - self.started,
+                "latency": phases,
+                "counters": dict(self.counters),
+                "moves": totals,
+                "recent_moves": [list(move) for move in list(self.moves)[-100:]],
+            }
+
+    def dump(self, fname: str) -> None:
+        """
+        Writes snapshot to a JSON file, replacing it atomically.
+        """
+        tmp = fname + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp, fname)
+
+    def start_periodic_dump(self, fname: str, interval: float = 60.0) -> None:
+        """
+        Dumps the statistics to fname every interval seconds from a background thread until stop_periodic_dump.
+        """
+        self.stop_periodic_dump()
+        self._dump_stop.clear()
+
+        def run():
+            while not self._dump_stop.wait(interval):
+                try:
+                    self.dump(fname)
+                except OSError:
+                    log.exception(f"Could not write metrics to {fname}")
+            self.dump(fname)
+
+        self._dump_thread = threading.Thread(target=run, name="Telemetry dump", daemon=True)
+        self._dump_thread.start()
+
+    def stop_periodic_dump(self) -> None:
+        # Writes a last dump before the thread ends
+        if self._dump_thread is not None:
+            self._dump_stop.set()
+            self._dump_thread.join()
+            self._dump_thread = None
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.moves.clear()
+            self.move_totals = {"count": 0, "predicted": 0.0, "measured": 0.0, "squared_error": 0.0}
+            self.started = time.time()
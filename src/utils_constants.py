@@ -19,6 +19,8 @@ class Axis:
     TILT  : str =  "5"
 
 
+axis_order = ("X", "Y", "Z", "ROT", "TILT")
+
 axis_units = {
     "X": Units.UM,
     "Y": Units.UM,
@@ -0,0 +1,92 @@
+import pytest
+from src.answerparser import AnswerParser, parse_frame
+from src.serialcontroller import SerialController
+
+frame = b"X-Achse:100000 Y-Achse:-2000 Z-Achse:0 4-Achse:9000 5-Achse:0 ####"
+
+
+class ChunkedDevice:
+    """
+    Port stand-in that answers every command with the bytes of chunks, one chunk per read.
+    """
+
+    port = "CHUNKED"
+    timeout = 0.1
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.is_open = False
+        self.written = []
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def write(self, data):
+        self.written.append(data)
+        return len(data)
+
+    @property
+    def in_waiting(self):
+        return len(self.chunks[0]) if self.chunks else 0
+
+    def read(self, size=1):
+        if not self.chunks:
+            return b""
+        chunk = self.chunks.pop(0)
+        self.chunks[:0] = [chunk[size:]] if len(chunk) > size else []
+        return chunk[:size]
+
+
+def test_parse_frame():
+    values = parse_frame(frame[:-4])
+    assert values == parse_frame(frame.decode()[:-4])
+    assert len(values) == 5 and values[0] > 0 and values[1] < 0
+
+
+def test_parse_frame_rejects_short_answers():
+    with pytest.raises(ValueError):
+        parse_frame(b"X-Achse:100 ")
+
+
+def test_feed_split_and_concatenated_frames():
+    parser = AnswerParser(b"####")
+    data = frame * 3
+    positions = [position for i in range(0, len(data), 7) for position in parser.feed(data[i : i + 7])]
+    assert positions == [parse_frame(frame[:-4])] * 3
+    assert parser.pending == b""
+
+
+def test_feed_counts_invalid_frames():
+    parser = AnswerParser("####")
+    assert parser.feed(b"garbage ####" + frame) == [parse_frame(frame[:-4])]
+    assert parser.invalid_frames == 1
+
+
+def make_controller(chunks):
+    controller = SerialController(device=ChunkedDevice(chunks))
+    controller.pacing = "gap"
+    controller.min_gap = controller.answer_gap = 0.0
+    return controller
+
+
+def test_controller_joins_split_answer():
+    controller = make_controller([frame[:10], frame[10:30], frame[30:]])
+    assert controller.send("My-Achse:") == frame.decode()
+
+
+def test_controller_splits_concatenated_answers():
+    controller = make_controller([frame + frame.replace(b"100000", b"5")])
+    with controller.session():
+        first = controller.send("My-Achse:")
+        second = controller.send("My-Achse:")
+    assert first == frame.decode()
+    assert second.startswith("X-Achse:5 ")
+
+
+def test_controller_returns_incomplete_answer_on_timeout():
+    controller = make_controller([frame[:20]])
+    assert controller.send("My-Achse:") == frame[:20].decode()
+    assert controller.telemetry.snapshot()["counters"]["timeouts"] == 1
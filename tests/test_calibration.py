@@ -0,0 +1,24 @@
+import os
+import numpy as np
+from src.calibration import default_calibration, fit_calibration, load_calibration, write_calibration
+from src.scheduling import PathTime
+
+data_dir = os.path.join(os.path.dirname(__file__), "..", "240311_FAS_calibration", "data")
+
+
+def test_fit_calibration_round_trip(tmp_path):
+    calibration = fit_calibration(data_dir)
+    assert sorted(calibration["source"]) == ["rot", "tilt", "x", "y", "z"]
+    assert all(values["rms"] < 1.0 for values in calibration["axes"].values())
+    fname = str(tmp_path / "fas_calibration.json")
+    write_calibration(calibration, fname)
+    assert load_calibration(fname)["version"] == calibration["version"]
+    path_time = PathTime(calibration_file=fname)
+    assert path_time.calibration_version == calibration["version"]
+    assert path_time.axis_time("X", 10.0, 200, 200) > 0
+
+
+def test_default_calibration_is_used_without_file(monkeypatch, tmp_path):
+    monkeypatch.setenv("FAS_CALIBRATION_FILE", str(tmp_path / "missing.json"))
+    assert load_calibration()["version"] == default_calibration()["version"]
+    assert np.isfinite(PathTime().axis_parameters()).all()
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from src.executor import ScheduleExecutor, read_journal
+from src.FAS import FiveAxisSystem
+from src.patterns import raster
+from src.scheduling import FASSchedule
+from src.simulation import SimulatedController
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def fas():
+    controller = SimulatedController(time_scale=0.0001)
+    controller.pacing = "gap"
+    controller.min_gap = controller.answer_gap = 0.0
+    return FiveAxisSystem(controller)
+
+
+def test_resume_after_interruption(fas, tmp_path):
+    journal = str(tmp_path / "scan.journal")
+    schedule = FASSchedule(raster(x=np.arange(10, 14.0), y=np.arange(10, 13.0), z=20))
+    measured = []
+
+    def measure(index, position, fas):
+        if index == 5 and 5 not in measured:
+            measured.append(index)
+            raise Interrupted()
+        measured.append(index)
+        assert fas.current_position.X == position.X and fas.current_position.Y == position.Y
+
+    with pytest.raises(Interrupted):
+        ScheduleExecutor(fas, schedule, journal, measure=measure).run(progress=False)
+    executor = ScheduleExecutor(fas, schedule, journal, measure=measure)
+    assert executor.completed() == 5
+    assert executor.run(progress=False) == len(schedule) - 5
+    assert measured == list(range(6)) + list(range(5, len(schedule)))
+    _, length, records = read_journal(journal)
+    assert length == len(schedule)
+    assert records["index"].tolist() == list(range(len(schedule)))
+    assert ScheduleExecutor(fas, schedule, journal).run(progress=False) == 0
+
+
+def test_journal_of_other_schedule(fas, tmp_path):
+    journal = str(tmp_path / "scan.journal")
+    ScheduleExecutor(fas, FASSchedule(raster(x=[10.0, 11.0], z=20)), journal).run(progress=False)
+    with pytest.raises(ValueError):
+        ScheduleExecutor(fas, FASSchedule(raster(x=[10.0, 12.0], z=20)), journal).run(progress=False)
+
+
+def test_torn_record_is_dropped(fas, tmp_path):
+    journal = tmp_path / "scan.journal"
+    schedule = FASSchedule(raster(x=np.arange(10, 14.0), z=20))
+    executor = ScheduleExecutor(fas, schedule, str(journal))
+    executor.run(progress=False)
+    journal.write_bytes(journal.read_bytes()[:-20])
+    assert executor.completed() == 2
+    assert executor.run(progress=False) == 2
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from src.FAS import FiveAxisSystem, Position
+from src.positionlog import PositionLogger, read_position_log
+from src.simulation import SimulatedController
+
+
+@pytest.fixture
+def fas():
+    controller = SimulatedController(time_scale=0.001)
+    controller.pacing = "gap"
+    controller.min_gap = controller.answer_gap = 0.0
+    return FiveAxisSystem(controller)
+
+
+def test_move_absolute_position(fas):
+    fas.move_absolute_position(x=20, y=30)
+    assert fas.current_position == Position(20.0, 30.0, 10.0, 0.0, 0.0)
+    assert fas.read_position() == fas.current_position
+
+
+def test_simultaneous_move_in_session(fas):
+    with fas.controller.session():
+        fas.move_absolute_position(x=40, tilt=5, simultaneous=True)
+        fas.move_relative_distance(y=-5)
+    assert fas.current_position == Position(40.0, 5.0, 10.0, 0.0, 5.0)
+
+
+def test_unchanged_axes_are_not_sent(fas):
+    fas.move_absolute_position(x=20)
+    sent = fas.controller.telemetry.snapshot()["moves"]["count"]
+    fas.move_absolute_position(x=20 + 1e-6)
+    assert fas.controller.telemetry.snapshot()["moves"]["count"] == sent
+
+
+def test_log_current_position_to_file(fas, tmp_path):
+    fas.move_absolute_position(x=20)
+    fname = tmp_path / "positions.tsv"
+    fas.log_current_position(str(fname))
+    assert [float(value) for value in fname.read_text().split()[1:]] == [20, 10, 10, 0, 0]
+
+
+def test_log_current_position_to_logger(fas, tmp_path):
+    fname = str(tmp_path / "positions.bin")
+    with PositionLogger(fname) as logger:
+        fas.position_logger = logger
+        fas.move_absolute_position(x=20)
+        fas.log_current_position()
+    log = read_position_log(fname, mmap=False)
+    assert len(log) == 2
+    np.testing.assert_array_equal(log["X"], [20, 20])
+
+
+def test_log_current_position_without_target(fas):
+    fas.move_absolute_position(x=20)
+    with pytest.raises(ValueError):
+        fas.log_current_position()
@@ -0,0 +1,80 @@
+import numpy as np
+from src.FAS import FiveAxisSystem
+from src.flyscan import FlySegment, fly_path_time, fly_speed, find_fly_segments
+from src.planning import MovePlanner
+from src.scheduling import PathTime
+from src.simulation import SimulatedController
+from src.utils_constants import axis_to_system_units
+
+nan = np.nan
+
+
+def line(xs, y=10.0):
+    return np.column_stack([xs, np.full(len(xs), y), np.full(len(xs), 20.0), np.full((len(xs), 2), nan)])
+
+
+def test_crossing_times_invert_distance_at():
+    path_time = PathTime()
+    for distance in (0.1, 5.0, 50.0):
+        offsets = np.linspace(0, distance, 7)
+        times = path_time.crossing_times("X", distance, offsets, 200)
+        travelled = [path_time.distance_at("X", distance, t, 200) for t in times]
+        np.testing.assert_allclose(travelled, offsets, atol=1e-9)
+
+
+def test_find_fly_segments_on_dense_line():
+    coordinates = np.vstack([line([0.0], y=20.0), line(np.arange(10, 30, 0.5))])
+    segments = find_fly_segments(coordinates, dwell=0.05)
+    assert segments == [FlySegment("X", 1, len(coordinates))]
+
+
+def test_fly_path_time_counts_run_up_moves():
+    planner = MovePlanner()
+    path_time = planner.path_time()
+    xs = np.arange(10, 30, 0.5)
+    coordinates = np.vstack([line([0.0]), line(xs), line([0.0], y=20.0)])
+    segment = FlySegment("X", 1, len(xs) + 1)
+    speed_adc, _ = planner.fly_profile("X", fly_speed(xs, 0.05))
+    run_up = path_time.fly_run_up("X", speed_adc)
+    expected = (
+        path_time.travel_times(coordinates[0], line([xs[0] - run_up])[0])
+        + path_time.fly_time("X", xs[-1] - xs[0], speed_adc)
+        + path_time.travel_times(line([xs[-1] + run_up])[0], coordinates[-1])
+        + 0.05 * 2
+    )
+    assert np.isclose(fly_path_time(coordinates, [segment], path_time, dwell=0.05, planner=planner), expected)
+
+
+def test_fly_scan_triggers_at_positions():
+    controller = SimulatedController()
+    controller.pacing = "gap"
+    controller.min_gap = controller.answer_gap = 0.0
+    fas = FiveAxisSystem(controller)
+    positions = np.arange(11, 12.01, 0.25)
+    reached = []
+
+    def measure(index, position, fas):
+        reached.append(axis_to_system_units(controller.ise.position("X"), "X"))
+
+    with controller.session():
+        measured = fas.fly_scan("x", positions, dwell=0.05, measure=measure)
+    assert not np.isnan(measured).any()
+    np.testing.assert_allclose(reached, positions, atol=0.05)
+
+
+def test_fly_scan_triggers_at_positions_with_answer_gap():
+    # The answer gap of the move to the run-up start is waited for before the fly move is written
+    controller = SimulatedController()
+    controller.pacing = "gap"
+    controller.min_gap = 0.0
+    controller.answer_gap = 0.3
+    fas = FiveAxisSystem(controller)
+    positions = np.arange(11, 12.01, 0.25)
+    reached = []
+
+    def measure(index, position, fas):
+        reached.append(axis_to_system_units(controller.ise.position("X"), "X"))
+
+    with controller.session():
+        fas.fly_scan("x", positions, dwell=0.05, measure=measure)
+    np.testing.assert_allclose(reached, positions, atol=0.05)
@@ -0,0 +1,52 @@
+import itertools
+import numpy as np
+import pytest
+from src.pathbounds import lower_bound, max_exact_positions, optimal_order
+from src.scheduling import FASSchedule, PathTime, path_total_time, positions_to_array
+
+
+def random_coordinates(n, seed=0):
+    coordinates = np.full((n, 5), np.nan)
+    coordinates[:, :3] = np.random.default_rng(seed).uniform(0, 100, (n, 3))
+    coordinates[:, 3] = np.random.default_rng(seed + 1).uniform(0, 180, n)
+    return coordinates
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_optimal_order_matches_brute_force(seed):
+    path_time = PathTime()
+    coordinates = random_coordinates(6, seed)
+    origin = positions_to_array([FASSchedule.initial_position])[0]
+    best = min(
+        path_total_time(coordinates[list(order)], path_time, origin)
+        for order in itertools.permutations(range(len(coordinates)))
+    )
+    order = optimal_order(coordinates, path_time, origin)
+    assert np.isclose(path_total_time(coordinates[order], path_time, origin), best)
+
+
+def test_optimal_order_size_limit():
+    with pytest.raises(ValueError):
+        optimal_order(random_coordinates(max_exact_positions + 1), PathTime())
+
+
+def test_lower_bound_below_optimum():
+    path_time = PathTime()
+    coordinates = random_coordinates(9)
+    origin = positions_to_array([FASSchedule.initial_position])[0]
+    optimum = path_total_time(coordinates[optimal_order(coordinates, path_time, origin)], path_time, origin)
+    spanning_tree = lower_bound(coordinates, path_time, origin, iterations=0)
+    bound = lower_bound(coordinates, path_time, origin)
+    assert 0 < spanning_tree <= bound <= optimum + 1e-9
+
+
+def test_optimality_gap():
+    schedule = FASSchedule(random_coordinates(40))
+    schedule.optimize_path()
+    report = schedule.optimality_gap()
+    assert report["lower_bound"] <= report["path_time"]
+    assert 0 <= report["gap"] < 1
+    assert not report["exact"]
+    small = FASSchedule(random_coordinates(8))
+    report = small.optimality_gap()
+    assert report["exact"] and report["lower_bound"] <= report["path_time"]
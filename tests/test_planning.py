@@ -0,0 +1,47 @@
+import numpy as np
+from src.planning import MovePlanner
+from src.scheduling import FASSchedule
+
+nan = np.nan
+
+
+def test_redundant_rows_without_duplicates():
+    planner = MovePlanner()
+    coordinates = np.array([[1.0, 2, 3, nan, nan], [4, 5, 6, nan, nan]])
+    assert not planner.redundant_rows(coordinates).any()
+
+
+def test_redundant_rows_drops_duplicates():
+    planner = MovePlanner()
+    coordinates = np.array([[1.0, 2, 3, nan, nan], [1, 2, 3, nan, nan], [1, 2, nan, nan, nan], [4, 5, 6, nan, nan]])
+    assert planner.redundant_rows(coordinates).tolist() == [False, True, True, False]
+
+
+def test_redundant_rows_keeps_slow_drift():
+    planner = MovePlanner()
+    # Every step is below the X tolerance, their sum is not
+    step = 0.8 * planner.tolerance[0]
+    coordinates = np.array([[10.0 + i * step, 10, 10, nan, nan] for i in range(4)])
+    redundant = planner.redundant_rows(coordinates)
+    assert redundant.tolist() == [False, True, False, True]
+    kept = coordinates[~redundant]
+    assert not planner.unchanged(kept[:-1], kept[1:]).all(axis=1).any()
+
+
+def test_merge_duplicates_without_duplicates():
+    schedule = FASSchedule(np.array([[1.0, 2, 3, nan, nan], [4, 5, 6, nan, nan]]))
+    assert schedule.merge_duplicates() == 0
+    assert len(schedule) == 2
+
+
+def test_merge_duplicates():
+    schedule = FASSchedule(np.array([[1.0, 2, 3, nan, nan], [1, 2, 3, nan, nan], [4, 5, 6, nan, nan]]))
+    assert schedule.merge_duplicates() == 1
+    np.testing.assert_array_equal(schedule.coordinates[:, :3], [[1, 2, 3], [4, 5, 6]])
+
+
+def test_plan_skips_axes_within_tolerance():
+    planner = MovePlanner()
+    speed, acceleration = planner.plan([10.0, 10, 10, 0, 0], [10.0, 20, 10 + 1e-6, 0, nan])
+    assert speed[1] > 0 and acceleration[1] > 0
+    assert speed[[0, 2, 3, 4]].tolist() == [0, 0, 0, 0]
@@ -0,0 +1,62 @@
+import itertools
+import threading
+import numpy as np
+from src.FAS import FiveAxisSystem, Position
+from src.positionmonitor import PositionMonitor
+from src.simulation import SimulatedController
+
+
+def make_controller():
+    controller = SimulatedController(time_scale=0.001)
+    controller.pacing = "gap"
+    controller.min_gap = controller.answer_gap = 0.0
+    return controller
+
+
+def test_ring_buffer_keeps_last_samples():
+    monitor = PositionMonitor(make_controller(), capacity=4, clock=itertools.count().__next__)
+    with monitor.controller.session():
+        for _ in range(10):
+            monitor.poll()
+    assert monitor.count == 10 and monitor.failures == 0
+    samples = monitor.samples()
+    assert len(samples) == 4
+    # Every poll reads the clock twice and stamps the midpoint
+    np.testing.assert_array_equal(samples[:, 0], [12.5, 14.5, 16.5, 18.5])
+    np.testing.assert_array_equal(samples[:, 1:], [[10, 10, 10, 0, 0]] * 4)
+    assert len(monitor.samples(2)) == 2
+    assert monitor.latest() == (18.5, (10.0, 10.0, 10.0, 0.0, 0.0))
+
+
+def test_position_at_interpolates():
+    monitor = PositionMonitor(make_controller(), capacity=8)
+    assert np.isnan(monitor.position_at(0.0)).all()
+    monitor.buffer[:2] = [[0.0, 10, 10, 10, 0, 0], [2.0, 20, 10, 10, 0, 0]]
+    monitor.count = 2
+    np.testing.assert_allclose(monitor.position_at(0.5), [12.5, 10, 10, 0, 0])
+    np.testing.assert_allclose(monitor.position_at(5.0), [20, 10, 10, 0, 0])
+
+
+def test_wait_for_position_in_background():
+    controller = make_controller()
+    fas = FiveAxisSystem(controller)
+    with controller.session(), PositionMonitor(controller, rate=200) as monitor:
+        assert not monitor.wait_for(Position(X=30), timeout=0.05)
+        mover = threading.Thread(target=fas.move_absolute_position, kwargs={"x": 30})
+        mover.start()
+        assert monitor.wait_for(Position(X=30), timeout=5)
+        mover.join()
+    assert not monitor.running
+    assert monitor.latest()[1][0] == 30
+
+
+def test_polls_follow_a_running_move():
+    controller = SimulatedController(time_scale=0.05)
+    controller.pacing = "gap"
+    controller.min_gap = controller.answer_gap = 0.0
+    fas = FiveAxisSystem(controller)
+    with controller.session(), PositionMonitor(controller, rate=200) as monitor:
+        fas.move_absolute_position(x=30)
+    x = monitor.samples()[:, 1]
+    assert ((x > 10.5) & (x < 29.5)).any()
+    assert x[-1] == 30
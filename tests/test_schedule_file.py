@@ -0,0 +1,27 @@
+import numpy as np
+from src.scheduling import FASSchedule
+
+
+def test_round_trip(tmp_path):
+    fname = str(tmp_path / "schedule.fas")
+    coordinates = np.array([[1.0, 2, 3, np.nan, np.nan], [4, 5, 6, 90, 10]])
+    FASSchedule(coordinates).write_schedule_to_file(fname)
+    for mmap in (True, False):
+        schedule = FASSchedule()
+        schedule.load_schedule_from_file(fname, mmap=mmap)
+        np.testing.assert_array_equal(schedule.coordinates, coordinates)
+
+
+def test_save_over_memory_mapped_source(tmp_path):
+    fname = str(tmp_path / "schedule.fas")
+    coordinates = np.random.default_rng(0).uniform(0, 100, (20000, 5))
+    FASSchedule(coordinates).write_schedule_to_file(fname)
+    schedule = FASSchedule()
+    schedule.load_schedule_from_file(fname)
+    schedule.write_schedule_to_file(fname)
+    reloaded = FASSchedule()
+    reloaded.load_schedule_from_file(fname)
+    np.testing.assert_array_equal(reloaded.coordinates, coordinates)
+    # The mapping of the replaced file is dropped, the schedule keeps its coordinates in memory
+    assert not isinstance(schedule._coordinates, np.memmap)
+    np.testing.assert_array_equal(schedule.coordinates, coordinates)
@@ -0,0 +1,148 @@
+import numpy as np
+import pytest
+from src.FAS import Position
+from src.ordercache import OrderCache
+from src.scheduling import (
+    FASSchedule,
+    PathTime,
+    cluster_order,
+    indexed_nearest_neighbour_order,
+    nearest_neighbour_order,
+    path_total_time,
+    positions_to_array,
+    refine_order,
+)
+
+nan = np.nan
+
+
+def random_coordinates(n, seed=0):
+    coordinates = np.full((n, 5), nan)
+    coordinates[:, :3] = np.random.default_rng(seed).uniform(0, 100, (n, 3))
+    return coordinates
+
+
+def is_permutation(order, n):
+    return sorted(np.asarray(order).tolist()) == list(range(n))
+
+
+def test_time_matrix_matches_travel_times():
+    path_time = PathTime()
+    coordinates = random_coordinates(20)
+    coordinates[::3, 3] = np.arange(7) * 10.0
+    matrix = path_time.time_matrix(coordinates, coordinates)
+    for i in (0, 5, 13):
+        np.testing.assert_allclose(matrix[i], path_time.travel_times(coordinates[i], coordinates))
+    assert np.allclose(np.diag(matrix), 0)
+
+
+def test_time_to_position_skips_unset_axes():
+    path_time = PathTime()
+    assert path_time.time_to_position(Position(10, 10, 10, 0, 0), Position(X=10, Y=10)) == 0
+    assert path_time.time_to_position(Position(10, 10, 10, 0, 0), Position(X=20)) > 0
+
+
+def test_refine_order_never_lengthens_the_path():
+    path_time = PathTime()
+    coordinates = random_coordinates(100)
+    order = nearest_neighbour_order(coordinates, path_time, progress=False)
+    refined = refine_order(coordinates, order, path_time, max_iterations=5)
+    assert is_permutation(refined, 100) and refined[0] == order[0]
+    assert path_total_time(coordinates[refined], path_time) <= path_total_time(coordinates[order], path_time)
+
+
+def test_optimize_path_with_refinement_keeps_the_positions():
+    schedule = FASSchedule(random_coordinates(150))
+    original = np.array(schedule.coordinates)
+    before, after = schedule.optimize_path(refine=True, max_iterations=5)
+    assert after <= before
+    assert np.isclose(schedule.calculate_total_path_time(), after)
+    assert sorted(map(tuple, schedule.coordinates[:, :3])) == sorted(map(tuple, original[:, :3]))
+
+
+def test_greedy_orders():
+    path_time = PathTime()
+    coordinates = random_coordinates(200)
+    full = nearest_neighbour_order(coordinates, path_time, progress=False)
+    indexed = indexed_nearest_neighbour_order(coordinates, path_time, candidates=8, progress=False)
+    assert is_permutation(full, 200) and is_permutation(indexed, 200)
+    assert full[0] == indexed[0] == 0
+    identity = path_total_time(coordinates, path_time)
+    assert path_total_time(coordinates[full], path_time) < identity
+    assert path_total_time(coordinates[indexed], path_time) < identity
+
+
+def test_indexed_optimize_path_on_line_scan():
+    coordinates = np.full((300, 5), nan)
+    coordinates[:, 0] = np.random.default_rng(0).permutation(300) * 0.1
+    coordinates[:, 1:3] = 20.0
+    schedule = FASSchedule(coordinates)
+    schedule.optimize_path(candidates=8)
+    assert len(schedule) == 300
+    np.testing.assert_array_equal(np.sort(schedule.coordinates[:, 0]), np.sort(coordinates[:, 0]))
+
+
+def test_optimize_path_multi_start():
+    schedule = FASSchedule(random_coordinates(60))
+    single = FASSchedule(random_coordinates(60))
+    single.optimize_path()
+    schedule.optimize_path(workers=2, starts=3, seed=1)
+    assert len(schedule) == 60
+    assert schedule.calculate_total_path_time() <= single.calculate_total_path_time() + 1e-9
+
+
+def test_slicing_and_iteration():
+    schedule = FASSchedule(np.column_stack([np.arange(6.0), np.full(6, nan), np.full(6, 20.0), np.full((6, 2), nan)]))
+    schedule.append_programmed_position(x=7.0, z=20)
+    assert len(schedule) == 7
+    assert schedule[6] == Position(X=7.0, Z=20.0)
+    assert len(schedule[2:4]) == 2
+    assert all(position.Z == 20 for position in schedule)
+    with pytest.raises(IndexError):
+        schedule[7]
+
+
+def test_insert_and_remove_positions():
+    schedule = FASSchedule(random_coordinates(50))
+    schedule.optimize_path()
+    optimized = np.array(schedule.coordinates)
+    indices = schedule.insert_positions(random_coordinates(3, seed=1))
+    assert len(schedule) == 53
+    assert np.isclose(schedule.calculate_total_path_time(), schedule._leg_times().sum())
+    schedule.remove_positions(indices)
+    np.testing.assert_array_equal(schedule.coordinates, optimized)
+
+
+def test_insert_positions_leaves_slices_unchanged():
+    coordinates = np.column_stack([np.arange(10.0), np.full((10, 4), nan)])
+    schedule = FASSchedule(coordinates)
+    head = schedule[0:3]
+    schedule.insert_positions(np.array([[-1.0, nan, nan, nan, nan]]))
+    np.testing.assert_array_equal(head.coordinates[:, 0], [0, 1, 2])
+    assert schedule.coordinates[0, 0] == -1
+
+
+def test_order_cache(tmp_path):
+    cache = OrderCache(str(tmp_path))
+    coordinates = random_coordinates(80)
+    first = FASSchedule(coordinates)
+    first.optimize_path(cache=cache)
+    assert len(list(tmp_path.iterdir())) == 1
+    second = FASSchedule(coordinates)
+    second.optimize_path(cache=cache)
+    np.testing.assert_array_equal(first.coordinates, second.coordinates)
+    # Only entries of other calibrations are invalidated, unless all are
+    assert cache.invalidate(first.path_time.calibration_version) == 0
+    assert cache.invalidate() == 1
+    assert not list(tmp_path.iterdir())
+
+
+def test_cluster_order_independent_of_workers():
+    path_time = PathTime()
+    coordinates = random_coordinates(300)
+    origin = positions_to_array([FASSchedule.initial_position])[0]
+    _, serial_time, serial = cluster_order(coordinates, path_time, origin, cluster_size=60, workers=1)
+    _, parallel_time, parallel = cluster_order(coordinates, path_time, origin, cluster_size=60, workers=2)
+    assert is_permutation(serial, 300)
+    np.testing.assert_array_equal(serial, parallel)
+    assert serial_time == parallel_time < path_total_time(coordinates, path_time, origin)
@@ -0,0 +1,81 @@
+import threading
+import pytest
+from src.answerparser import parse_frame
+from src.simulation import SimulatedController
+
+
+def make_controller(**kwargs):
+    controller = SimulatedController(time_scale=0.001, **kwargs)
+    controller.pacing = "gap"
+    controller.min_gap = controller.answer_gap = 0.0
+    return controller
+
+
+def test_send_outside_session_closes_port():
+    controller = make_controller()
+    answer = controller.send("My-Achse:")
+    assert answer.endswith(controller.answer_end)
+    assert not controller.ise.is_open
+
+
+def test_session_queues_sends_from_threads():
+    controller = make_controller()
+    answers = []
+    with controller.session():
+        assert controller.ise.is_open
+        threads = [threading.Thread(target=lambda: answers.append(controller.send("My-Achse:"))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with controller.session():
+            pass
+        assert controller.ise.is_open
+    assert not controller.ise.is_open
+    assert len(answers) == 8
+    assert all(len(parse_frame(answer[: -len(controller.answer_end)])) == 5 for answer in answers)
+
+
+def test_submit_needs_session():
+    with pytest.raises(RuntimeError):
+        make_controller().submit("My-Achse:")
+
+
+def test_session_reconnects_after_io_error():
+    controller = make_controller()
+    write = controller.ise.write
+    failures = [OSError("Device disconnected")]
+
+    def flaky_write(data):
+        if failures:
+            controller.ise.close()
+            raise failures.pop()
+        return write(data)
+
+    controller.ise.write = flaky_write
+    with controller.session():
+        answer = controller.send("My-Achse:")
+    assert answer.endswith(controller.answer_end)
+    assert controller.telemetry.snapshot()["counters"]["retries"] == 1
+
+
+
+def test_send_many_moves_axes_together():
+    controller = make_controller()
+    answers = controller.send_many([("X-Achse:200000", "500", "500"), ("Y-Achse:200000", "500", "500")])
+    assert len(answers) == 2
+    x, y, *_ = parse_frame(answers[-1][: -len(controller.answer_end)])
+    assert (x, y) == (20.0, 20.0)
+
+
+def test_session_answers_query_during_move():
+    controller = SimulatedController(time_scale=0.01)
+    controller.pacing = "gap"
+    controller.min_gap = controller.answer_gap = 0.0
+    with controller.session():
+        move = controller.submit("X-Achse:300000", "500", "500")
+        answer = controller.send("My-Achse:")
+        assert not move.done()
+        x = parse_frame(answer[: -len(controller.answer_end)])[0]
+        assert 10 <= x < 30
+        assert parse_frame(move.result()[: -len(controller.answer_end)])[0] == 30
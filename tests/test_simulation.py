@@ -0,0 +1,33 @@
+import time
+from src.FAS import FiveAxisSystem
+from src.simulation import SimulatedController
+from src.utils_constants import axis_to_system_units
+
+
+def test_move_takes_predicted_time():
+    controller = SimulatedController(time_scale=0.05)
+    controller.pacing = "gap"
+    controller.min_gap = controller.answer_gap = 0.0
+    fas = FiveAxisSystem(controller)
+    fas.move_absolute_position(x=10)
+    predicted = fas.path_time.travel_times([10, 10, 10, 0, 0], [30, 10, 10, 0, 0]) * 0.05
+    start = time.perf_counter()
+    fas.move_absolute_position(x=30)
+    assert abs(time.perf_counter() - start - predicted) < 0.05
+    assert fas.current_position.X == 30
+
+
+def test_position_follows_speed_profile():
+    controller = SimulatedController()
+    device = controller.ise
+    path_time = device.path_time
+    device.open()
+    device.write(b"X-Achse:300000\n500\n500\n")
+    started = time.monotonic()
+    # Nothing moves during the start delay, then the axis accelerates from rest
+    assert axis_to_system_units(device.position("X", started + 0.5 * path_time.start_delay("X")), "X") == 10
+    delay = started + path_time.start_delay("X")
+    early = axis_to_system_units(device.position("X", delay + 0.1), "X") - 10
+    later = axis_to_system_units(device.position("X", delay + 0.2), "X") - 10
+    assert 0 < early < later / 2
+    device.close()
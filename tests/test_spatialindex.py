@@ -0,0 +1,38 @@
+import numpy as np
+from src.spatialindex import GridIndex, bisection_clusters
+
+
+def test_query_returns_nearest_alive_points():
+    points = np.random.default_rng(0).uniform(0, 100, (500, 3))
+    index = GridIndex(points)
+    query = np.array([50.0, 50.0, 50.0])
+    distance = np.abs(points - query).sum(axis=1)
+    nearest = index.query(query, k=5)
+    assert sorted(nearest.tolist()) == sorted(np.argsort(distance)[:5].tolist())
+    for i in nearest:
+        index.remove(i)
+    assert index.n_alive == 495
+    assert not set(index.query(query, k=5).tolist()) & set(nearest.tolist())
+
+
+def test_query_until_empty():
+    points = np.random.default_rng(1).uniform(0, 10, (20, 2))
+    index = GridIndex(points)
+    for _ in range(20):
+        index.remove(int(index.query(points[0], k=1)[0]))
+    assert index.query(points[0]).size == 0
+
+
+def test_query_with_fewer_alive_points_than_k_on_one_axis():
+    points = np.column_stack([np.arange(100.0), np.full(100, 5.0), np.full(100, 5.0)])
+    index = GridIndex(points)
+    for i in range(3, 100):
+        index.remove(i)
+    assert sorted(index.query(points[0], k=8).tolist()) == [0, 1, 2]
+
+
+def test_bisection_clusters_partition_points():
+    points = np.random.default_rng(2).uniform(0, 100, (1000, 3))
+    clusters = bisection_clusters(points, 64)
+    assert all(len(cluster) <= 64 for cluster in clusters)
+    assert sorted(np.concatenate(clusters).tolist()) == list(range(1000))